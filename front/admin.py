@@ -1,5 +1,19 @@
 from django.contrib import admin
-from .models import Quiz, Question, AnswerOption
+from .models import Quiz, Question, AnswerOption, GenerationJob, Attempt, QuestionStats
+from .search import matching_quiz_ids, search_question_ids
+
+ADMIN_SEARCH_LIMIT = 1000  # Most relevant matches shown for an admin search
+
+class FullTextSearchMixin:
+    """Answers admin searches from the full-text index instead of LIKE scans"""
+    search_index_lookup = 'pk__in'  # Lookup matching the question ids found
+    search_index_duplicates = False  # Whether the lookup can repeat rows
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        question_ids = search_question_ids(search_term, limit=ADMIN_SEARCH_LIMIT)
+        return queryset.filter(**{self.search_index_lookup: question_ids}), self.search_index_duplicates
 
 class AnswerOptionInline(admin.TabularInline):
     """Inline view for answer options"""
@@ -13,27 +27,72 @@ class QuestionInline(admin.StackedInline):
     model = Question
     extra = 1
     show_change_link = True
+    raw_id_fields = ('origin',)  # A select would list, and label, every stored question per form
+
+    def get_queryset(self, request):
+        # Each inline header renders str(question), which reads quiz.title
+        return super().get_queryset(request).select_related('quiz')
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
     """Admin view for Quiz model"""
-    list_display = ('quiz_id', 'title', 'created_at')
+    list_display = ('quiz_id', 'title', 'topic', 'created_at')
     list_filter = ('created_at',)
+    show_full_result_count = False  # Skip the unfiltered COUNT(*) on every filtered page
     search_fields = ('title', 'description')
     inlines = [QuestionInline]
     date_hierarchy = 'created_at'
 
+    def get_search_results(self, request, queryset, search_term):
+        # The quiz's own title or description, or any of its questions from
+        # the full-text index; not capped, so quizzes past ADMIN_SEARCH_LIMIT
+        # matching questions and quizzes without questions are found too
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        own_matches, _ = super().get_search_results(request, queryset, search_term)
+        return own_matches | queryset.filter(pk__in=matching_quiz_ids(search_term)), False
+
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     """Admin view for Question model"""
     list_display = ('question_id', 'quiz', 'question_type', 'order_in_quiz')
     list_filter = ('question_type', 'quiz')
+    list_select_related = ('quiz',)
+    raw_id_fields = ('origin',)
     search_fields = ('question_text',)
     inlines = [AnswerOptionInline]
 
 @admin.register(AnswerOption)
-class AnswerOptionAdmin(admin.ModelAdmin):
+class AnswerOptionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     """Admin view for AnswerOption model"""
+    search_index_lookup = 'question__in'
     list_display = ('option_id', 'question', 'option_text', 'is_correct')
     list_filter = ('is_correct', 'question__quiz')
+    list_select_related = ('question__quiz',)
     search_fields = ('option_text',)
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    """Admin view for GenerationJob model"""
+    list_display = ('job_id', 'status', 'quiz', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    list_select_related = ('quiz',)
+    search_fields = ('description',)
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(Attempt)
+class AttemptAdmin(admin.ModelAdmin):
+    """Admin view for Attempt model"""
+    list_display = ('attempt_id', 'quiz', 'score', 'total', 'submitted_at')
+    list_select_related = ('quiz',)
+    date_hierarchy = 'submitted_at'
+    readonly_fields = ('submitted_at',)
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    """Admin view for QuestionStats model"""
+    list_display = ('question', 'answered', 'correct', 'percent_correct', 'updated_at')
+    list_filter = ('question__quiz',)
+    list_select_related = ('question__quiz',)
+    ordering = ('question__quiz', 'question__order_in_quiz')
+    readonly_fields = ('question', 'answered', 'correct', 'updated_at')
@@ -0,0 +1,208 @@
+"""
+Per-question statistics kept as incrementally updated aggregate rows.
+
+Every batch of recorded responses adds its counts to QuestionStats,
+OptionStats and AnswerTimeBucket rows inside the same transaction, so
+reading a quiz's stats touches O(questions) rows however many attempts
+exist. rebuild_stats() recomputes the rows from raw responses.
+"""
+import logging
+import operator
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Prefetch, Q, Value, When
+
+from .models import AnswerOption, AnswerTimeBucket, OptionStats, Question, QuestionStats, Response
+
+logger = logging.getLogger('custom_logger')
+
+# Upper bounds in seconds of the time-to-answer buckets; the last bucket is open-ended
+TIME_BUCKET_BOUNDS = (2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+
+UPDATE_CHUNK = 200  # Keys per UPDATE, keeping statements within SQLite's expression limits
+
+
+def time_bucket(seconds):
+    """
+    Returns the histogram bucket for a time-to-answer.
+    """
+    return bisect_right(TIME_BUCKET_BOUNDS, seconds)
+
+
+def _add_counts(model, key_fields, counts):
+    """
+    Adds `counts` ({key: {field: delta}}) to aggregate rows, creating missing rows.
+
+    Rows are incremented with F() expressions, so concurrent writers never
+    lose updates. Costs one INSERT and one UPDATE per UPDATE_CHUNK keys.
+    """
+    if not counts:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in counts],
+        ignore_conflicts=True,
+    )
+    keys = list(counts)
+    fields = {field for deltas in counts.values() for field in deltas}
+    for start in range(0, len(keys), UPDATE_CHUNK):
+        chunk = keys[start:start + UPDATE_CHUNK]
+        matches = [Q(**dict(zip(key_fields, key))) for key in chunk]
+        model.objects.filter(reduce(operator.or_, matches)).update(**{
+            field: F(field) + Case(
+                *[When(match, then=Value(counts[key].get(field, 0))) for key, match in zip(chunk, matches)],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            for field in fields
+        })
+
+
+def record_responses(responses):
+    """
+    Adds a batch of newly stored responses to the aggregate rows.
+
+    Call inside the transaction that stores the responses so the counts
+    never disagree with them.
+    """
+    questions = defaultdict(Counter)
+    options = defaultdict(Counter)
+    buckets = defaultdict(Counter)
+    for response in responses:
+        questions[(response.question_id,)]['answered'] += 1
+        questions[(response.question_id,)]['correct'] += response.is_correct
+        if response.selected_option_id is not None:
+            options[(response.selected_option_id,)]['selected'] += 1
+        if response.seconds_to_answer is not None:
+            buckets[(response.question_id, time_bucket(response.seconds_to_answer))]['count'] += 1
+
+    _add_counts(QuestionStats, ('question_id',), questions)
+    _add_counts(OptionStats, ('option_id',), options)
+    _add_counts(AnswerTimeBucket, ('question_id', 'bucket'), buckets)
+
+
+def rebuild_stats(quiz_ids=None):
+    """
+    Recomputes aggregate rows from raw responses, replacing the current ones.
+
+    Args:
+        quiz_ids (list[int]): Quizzes to rebuild; all quizzes when None
+
+    Returns:
+        int: Number of questions with responses
+    """
+    questions = Question.objects.all()
+    if quiz_ids is not None:
+        questions = questions.filter(quiz_id__in=quiz_ids)
+    responses = Response.objects.filter(question__in=questions)
+    bucket = Case(
+        *[When(seconds_to_answer__lt=bound, then=Value(i)) for i, bound in enumerate(TIME_BUCKET_BOUNDS)],
+        default=Value(len(TIME_BUCKET_BOUNDS)),
+        output_field=IntegerField(),
+    )
+
+    with transaction.atomic():
+        QuestionStats.objects.filter(question__in=questions).delete()
+        OptionStats.objects.filter(option__question__in=questions).delete()
+        AnswerTimeBucket.objects.filter(question__in=questions).delete()
+
+        question_rows = responses.values('question_id').annotate(
+            num_answered=Count('pk'),
+            num_correct=Count('pk', filter=Q(is_correct=True)),
+        ).order_by()
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question_id=row['question_id'], answered=row['num_answered'], correct=row['num_correct'])
+            for row in question_rows
+        ])
+        option_rows = responses.filter(selected_option__isnull=False).values('selected_option_id').annotate(
+            num_selected=Count('pk'),
+        ).order_by()
+        OptionStats.objects.bulk_create([
+            OptionStats(option_id=row['selected_option_id'], selected=row['num_selected'])
+            for row in option_rows
+        ])
+        bucket_rows = responses.filter(seconds_to_answer__isnull=False).annotate(time_bucket=bucket).values(
+            'question_id', 'time_bucket'
+        ).annotate(num=Count('pk')).order_by()
+        AnswerTimeBucket.objects.bulk_create([
+            AnswerTimeBucket(question_id=row['question_id'], bucket=row['time_bucket'], count=row['num'])
+            for row in bucket_rows
+        ])
+
+    rebuilt = QuestionStats.objects.filter(question__in=questions).count()
+    logger.info(f"Rebuilt stats for {rebuilt} questions")
+    return rebuilt
+
+
+def median_seconds(buckets):
+    """
+    Estimates the median time-to-answer from histogram counts.
+
+    Interpolates linearly within the bucket holding the median; answers in
+    the open-ended last bucket report its lower bound.
+
+    Args:
+        buckets (dict): {bucket: count}
+    """
+    total = sum(buckets.values())
+    if not total:
+        return None
+    half = total / 2
+    cumulative = 0
+    for bucket in sorted(buckets):
+        count = buckets[bucket]
+        if count and cumulative + count >= half:
+            lower = TIME_BUCKET_BOUNDS[bucket - 1] if bucket else 0
+            if bucket >= len(TIME_BUCKET_BOUNDS):
+                return float(lower)
+            upper = TIME_BUCKET_BOUNDS[bucket]
+            return round(lower + (upper - lower) * (half - cumulative) / count, 1)
+        cumulative += count
+
+
+def get_quiz_stats(quiz):
+    """
+    Returns per-question stats for a quiz from the aggregate rows.
+
+    Three queries regardless of how many attempts the quiz has.
+    """
+    questions = Question.objects.filter(quiz=quiz).select_related('stats').prefetch_related(
+        Prefetch('options', queryset=AnswerOption.objects.select_related('stats')),
+        'time_buckets',
+    )
+    results = []
+    for question in questions:
+        stats = getattr(question, 'stats', None) or QuestionStats(question=question)
+        results.append({
+            'question_id': question.question_id,
+            'order_in_quiz': question.order_in_quiz,
+            'question_text': question.question_text,
+            'answered': stats.answered,
+            'correct': stats.correct,
+            'percent_correct': stats.percent_correct,
+            'median_seconds': median_seconds({row.bucket: row.count for row in question.time_buckets.all()}),
+            'options': [
+                {
+                    'option_id': option.option_id,
+                    'option_text': option.option_text,
+                    'is_correct': option.is_correct,
+                    'selected': _selected(option),
+                    'percent': round(_selected(option) * 100 / stats.answered, 1) if stats.answered else None,
+                }
+                for option in question.options.all()
+            ],
+        })
+    return {
+        'quiz_id': quiz.quiz_id,
+        'title': quiz.title,
+        # Every attempt answers every question, so the most answered question counts attempts
+        'attempts': max((question['answered'] for question in results), default=0),
+        'questions': results,
+    }
+
+
+def _selected(option):
+    stats = getattr(option, 'stats', None)
+    return stats.selected if stats else 0
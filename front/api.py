@@ -0,0 +1,152 @@
+"""
+Compact JSON representation of quizzes, for clients that render them.
+
+Payloads are serialized once per quiz version (see cache.get_quiz_version)
+and cached encoded, plain and gzipped, so serving an unchanged quiz costs
+one cache read and no queries. The version stamp also yields a strong
+ETag, so a client that already holds the quiz revalidates it without
+reading the payload at all. Correct answers are never included; quizzes
+are graded by submit_quiz.
+"""
+import json
+import math
+import re
+
+from django.conf import settings
+from django.utils.http import parse_etags
+from django.utils.text import compress_string
+
+from .cache import get_cached_quiz_payload, set_cached_quiz_payload
+from .models import Question, Quiz
+
+DEFAULTS = {
+    'PAGE_SIZE': 20,  # Questions per page when ?page= is given without ?page_size=
+    'MAX_PAGE_SIZE': 100,
+    'GZIP_MIN_LENGTH': 200,  # Bytes; smaller bodies are sent uncompressed
+}
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def get_api_config():
+    return {**DEFAULTS, **getattr(settings, 'QUIZ_API', {})}
+
+
+class PageNotFound(Exception):
+    """
+    Raised when the requested page is past the last page of the quiz.
+    """
+
+
+def parse_page(params, config=None):
+    """
+    Reads ?page= and ?page_size= from a query dict.
+
+    Returns:
+        tuple: (page, page_size), both None when the whole quiz is requested
+
+    Raises:
+        ValueError: If either value is not a positive integer
+    """
+    config = config or get_api_config()
+    if 'page' not in params and 'page_size' not in params:
+        return None, None
+    try:
+        page = int(params.get('page', 1))
+        page_size = int(params.get('page_size', config['PAGE_SIZE']))
+    except ValueError:
+        raise ValueError("page and page_size must be positive integers")
+    if page < 1 or page_size < 1:
+        raise ValueError("page and page_size must be positive integers")
+    return page, min(page_size, config['MAX_PAGE_SIZE'])
+
+
+def serialize_question(question):
+    return {
+        'id': question.question_id,
+        'text': question.question_text,
+        'options': [{'id': option.option_id, 'text': option.option_text} for option in question.options.all()],
+    }
+
+
+def serialize_quiz(quiz_id, page=None, page_size=None):
+    """
+    Builds the payload for a quiz, or for one page of its questions.
+
+    A page loads only its own questions, so slicing a very large quiz does
+    not read the rest of it.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no such quiz
+        PageNotFound: If `page` is past the last page
+    """
+    if page is None:
+        quiz = Quiz.objects.with_questions().get(pk=quiz_id)
+        questions = quiz.questions.all()
+        payload = {'quiz_id': quiz.quiz_id, 'title': quiz.title, 'total_questions': len(questions)}
+    else:
+        quiz = Quiz.objects.get(pk=quiz_id)
+        total = Question.objects.filter(quiz_id=quiz_id).count()
+        num_pages = max(1, math.ceil(total / page_size))
+        if page > num_pages:
+            raise PageNotFound(f"Page {page} is past the last page ({num_pages})")
+        start = (page - 1) * page_size
+        questions = Question.objects.filter(quiz_id=quiz_id).prefetch_related('options')[start:start + page_size]
+        payload = {
+            'quiz_id': quiz.quiz_id, 'title': quiz.title, 'total_questions': total,
+            'page': page, 'page_size': page_size, 'num_pages': num_pages,
+        }
+    payload['questions'] = [serialize_question(question) for question in questions]
+    return payload
+
+
+def page_variant(page, page_size):
+    return 'all' if page is None else f"{page}x{page_size}"
+
+
+def get_quiz_payload(quiz_id, version, page=None, page_size=None):
+    """
+    Returns (body, gzipped_body) for a quiz version, serializing it on a miss.
+
+    `gzipped_body` is None when the body is too small to be worth compressing.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no such quiz
+        PageNotFound: If `page` is past the last page
+    """
+    variant = page_variant(page, page_size)
+    content = get_cached_quiz_payload(quiz_id, version, variant)
+    if content is None:
+        body = json.dumps(serialize_quiz(quiz_id, page, page_size), ensure_ascii=False, separators=(',', ':')).encode()
+        gzipped = compress_string(body) if len(body) >= get_api_config()['GZIP_MIN_LENGTH'] else None
+        content = (body, gzipped)
+        set_cached_quiz_payload(quiz_id, version, variant, content)
+    return content
+
+
+def quiz_etag(quiz_id, version, page=None, page_size=None, gzipped=False):
+    """
+    Returns the strong ETag of one encoding of a quiz version.
+
+    Plain and gzipped bodies differ byte for byte, so they get different tags.
+    """
+    return f'"{quiz_id}-{version}-{page_variant(page, page_size)}{"-gzip" if gzipped else ""}"'
+
+
+def accepts_gzip(request):
+    return bool(ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', '')))
+
+
+def matching_etag(request, quiz_id, version, page=None, page_size=None):
+    """
+    Returns the tag in the client's If-None-Match that names the current version, or None.
+
+    Whether a version is sent gzipped depends only on its size, so a tag
+    the client holds for this version is still the one it would receive;
+    the payload need not be read to answer.
+    """
+    client_tags = parse_etags(request.headers.get('If-None-Match', ''))
+    current = [quiz_etag(quiz_id, version, page, page_size)]
+    if accepts_gzip(request):
+        current.append(quiz_etag(quiz_id, version, page, page_size, gzipped=True))
+    return next((tag for tag in current if tag in client_tags), None)
@@ -0,0 +1,196 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': 'response_archive',
+    'MAX_BYTES': 10 * 1024 * 1024,  # Rotate the active file past this compressed size
+    'BACKUP_COUNT': 5,  # Rotated files to keep; older ones are deleted
+    'QUEUE_SIZE': 1000,  # Records waiting to be written before new ones are dropped
+}
+
+# Each process appends to its own active file: gzip members written by
+# several processes would interleave, and renaming a file another process
+# still appends to would race. Rotated files sort by time across processes.
+# Active files left by processes that have exited are rotated by the next
+# archive to start, so they count against BACKUP_COUNT.
+ACTIVE_FILE = 'responses.{pid}.jsonl.gz'
+ACTIVE_RE = re.compile(r'responses\.(\d+)\.jsonl\.gz')
+ROTATED_FILE = 'responses-{time_ns}-{pid}.jsonl.gz'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user, or cannot be checked: leave its file alone
+        return True
+    return True
+
+
+class ResponseArchive:
+    """
+    Appends raw LLM outputs to a rotating, gzip-compressed JSONL store.
+
+    Callers only enqueue records; a daemon thread owns the file and does all
+    the I/O, so archiving never blocks or serializes request handling. When
+    the queue is full, records are dropped and counted rather than waited on.
+    """
+
+    def __init__(self, directory, max_bytes, backup_count, queue_size):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._raw = None
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name='response-archive', daemon=True)
+        self._thread.start()
+
+    def submit(self, request_id, source, text):
+        """
+        Queues one response for archiving without waiting.
+
+        Returns:
+            bool: False if the queue was full and the record was dropped
+        """
+        record = {
+            'request_id': request_id,
+            'source': source,
+            'archived_at': datetime.now(timezone.utc).isoformat(),
+            'text': text,
+        }
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=5):
+        """
+        Writes out queued records and closes the active file.
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error("Response archive did not drain before shutdown")
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._rotate_orphans()
+        except Exception as e:
+            logger.error(f"Error rotating archive files of exited processes: {e}")
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            try:
+                self._write(record)
+                # Flush once the burst is written so readers see whole records
+                if self._queue.empty():
+                    self._file.flush()
+            except Exception as e:
+                logger.error(f"Error archiving response {record['request_id']}: {e}")
+        self._close_file()
+
+    def _write(self, record):
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._raw = open(self._active_path(), 'ab')
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        self._file.write(json.dumps(record).encode('utf-8') + b'\n')
+        self.written += 1
+        if self._raw.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _active_path(self):
+        return self.directory / ACTIVE_FILE.format(pid=os.getpid())
+
+    def _rotate(self):
+        self._close_file()
+        os.replace(self._active_path(), self.directory / ROTATED_FILE.format(time_ns=time.time_ns(), pid=os.getpid()))
+        self._prune()
+
+    def _rotate_orphans(self):
+        if not self.directory.is_dir():
+            return
+        rotated = False
+        for path in self.directory.glob('responses.*.jsonl.gz'):
+            match = ACTIVE_RE.fullmatch(path.name)
+            if not match or int(match.group(1)) == os.getpid() or _pid_alive(int(match.group(1))):
+                continue
+            try:
+                # Stamped with its last write, so it sorts among the other backups by age
+                target = ROTATED_FILE.format(time_ns=path.stat().st_mtime_ns, pid=match.group(1))
+                os.replace(path, self.directory / target)
+                rotated = True
+            except FileNotFoundError:
+                continue  # Another starting process rotated it first
+        if rotated:
+            self._prune()
+
+    def _prune(self):
+        backups = sorted(self.directory.glob('responses-*.jsonl.gz'))
+        for old in backups[:max(len(backups) - self.backup_count, 0)]:
+            # Another process may be pruning the same backups
+            old.unlink(missing_ok=True)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = self._raw = None
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_response_archive():
+    """
+    Returns the process-wide archive, or None when archiving is disabled.
+    """
+    global _archive
+    config = {**DEFAULTS, **getattr(settings, 'QUIZ_RESPONSE_ARCHIVE', {})}
+    if not config['ENABLED']:
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = ResponseArchive(
+                    directory=config['DIRECTORY'],
+                    max_bytes=config['MAX_BYTES'],
+                    backup_count=config['BACKUP_COUNT'],
+                    queue_size=config['QUEUE_SIZE'],
+                )
+                atexit.register(_archive.close)
+    return _archive
+
+
+def archive_response(request_id, source, text):
+    """
+    Archives a raw model response if archiving is enabled.
+    """
+    archive = get_response_archive()
+    if archive is not None and not archive.submit(request_id, source, text):
+        logger.error(f"Response archive queue full, dropped response {request_id}")
@@ -0,0 +1,200 @@
+"""
+Question bank: assembles quizzes from stored questions.
+
+Every generated question keeps its topic and difficulty, so a request on
+a topic the database already covers can be filled by sampling stored
+questions (originals only, never copies) to a difficulty mix. Only the
+shortfall is sent to the LLM.
+"""
+import logging
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Question, Quiz
+from .persistence import copy_questions, save_quiz
+from .prompt_cache import normalize_description
+from .schemas import QuizQuestion
+from .vectors import get_question_vectors
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEFAULT_SIZE': 10,  # Questions per quiz when the request does not say
+    'MAX_SIZE': 50,
+    'TOPIC_COVERAGE': 0.5,  # Share of the description's words the matched topics must account for
+    'DIFFICULTY_MIX': {'Easy': 0.3, 'Medium': 0.4, 'Hard': 0.3},
+}
+
+DIFFICULTY_ORDER = {'Easy': 0, 'Medium': 1, 'Hard': 2}
+
+_SIZE_RE = re.compile(r'\b(\d{1,3})\s+(?:\w+\s+)?questions?\b', re.IGNORECASE)
+
+
+def requested_size(description):
+    """
+    Returns the number of questions a description asks for ("10 hard questions"), or None.
+    """
+    match = _SIZE_RE.search(description)
+    return int(match.group(1)) if match else None
+
+
+def matching_topics(description, coverage=DEFAULTS['TOPIC_COVERAGE']):
+    """
+    Returns the stored topics that describe the request.
+
+    A topic matches when its words all appear in the description. A broader
+    topic ("Python") gives way to a more specific one ("Python decorators"),
+    and nothing matches unless the topics account for at least `coverage`
+    of the description's words: a "Python" bank does not serve "Python
+    decorators and metaclasses".
+    """
+    # Question counts ("10 questions") are not part of the topic
+    words = {word for word in normalize_description(description).split() if not word.isdigit()}
+    if not words:
+        return []
+    topics = (
+        Question.objects.filter(origin__isnull=True).exclude(topic='')
+        .order_by('topic').values_list('topic', flat=True).distinct()
+    )
+    candidates = {}
+    for topic in topics:
+        topic_words = set(normalize_description(topic).split())
+        if topic_words and topic_words <= words:
+            candidates[topic] = topic_words
+    matches = [
+        topic for topic, topic_words in candidates.items()
+        if not any(topic_words < other for other in candidates.values())
+    ]
+    covered = set().union(*(candidates[topic] for topic in matches))
+    if len(covered) < coverage * len(words):
+        return []
+    return matches
+
+
+def difficulty_targets(size, mix):
+    """
+    Splits `size` questions across difficulties in proportion to `mix`.
+    """
+    total = sum(mix.values())
+    exact = {difficulty: size * weight / total for difficulty, weight in mix.items()}
+    targets = {difficulty: int(share) for difficulty, share in exact.items()}
+    # Hand out the remainder to the largest fractional parts
+    by_remainder = sorted(exact, key=lambda difficulty: exact[difficulty] - targets[difficulty], reverse=True)
+    for difficulty in by_remainder[:size - sum(targets.values())]:
+        targets[difficulty] += 1
+    return targets
+
+
+@dataclass
+class BankSelection:
+    size: int
+    explicit_size: bool
+    topics: list = field(default_factory=list)
+    question_ids: list = field(default_factory=list)
+
+    @property
+    def shortfall(self):
+        return self.size - len(self.question_ids)
+
+    @property
+    def generation_size(self):
+        """
+        Questions to ask the LLM for, or None to leave the count to the model.
+        """
+        if self.question_ids or self.explicit_size:
+            return self.shortfall
+        return None
+
+
+def select_questions(description, num_questions=None, mix=None, rng=None):
+    """
+    Picks distinct bank questions for a request, following the difficulty mix.
+
+    Difficulties the bank cannot fill are topped up from the others before
+    counting a shortfall. The picks are ordered easiest first.
+
+    Returns:
+        BankSelection | None: None when the question bank is disabled
+    """
+    config = {**DEFAULTS, **getattr(settings, 'QUIZ_QUESTION_BANK', {})}
+    if not config['ENABLED']:
+        return None
+    explicit = num_questions or requested_size(description)
+    size = max(1, min(explicit or config['DEFAULT_SIZE'], config['MAX_SIZE']))
+    selection = BankSelection(size=size, explicit_size=bool(explicit), topics=matching_topics(description, config['TOPIC_COVERAGE']))
+    if not selection.topics:
+        return selection
+
+    rng = rng or random.Random()
+    pool = defaultdict(list)
+    rows = Question.objects.filter(topic__in=selection.topics, origin__isnull=True).values_list('question_id', 'difficulty')
+    for question_id, difficulty in rows:
+        pool[difficulty].append(question_id)
+
+    picked = {}
+    for difficulty, target in difficulty_targets(size, mix or config['DIFFICULTY_MIX']).items():
+        candidates = pool[difficulty]
+        for question_id in rng.sample(candidates, min(target, len(candidates))):
+            picked[question_id] = difficulty
+    leftovers = [
+        (question_id, difficulty)
+        for difficulty, question_ids in pool.items()
+        for question_id in question_ids
+        if question_id not in picked
+    ]
+    for question_id, difficulty in rng.sample(leftovers, min(size - len(picked), len(leftovers))):
+        picked[question_id] = difficulty
+
+    selection.question_ids = sorted(picked, key=lambda question_id: DIFFICULTY_ORDER.get(picked[question_id], 1))
+    logger.info(f"Question bank filled {len(picked)} of {size} questions on {', '.join(selection.topics)}")
+    return selection
+
+
+def assemble_quiz(selection, generated: list[QuizQuestion] = ()):
+    """
+    Stores a quiz of newly generated questions plus copies of the selected bank questions.
+
+    Generated questions that repeat indexed ones are dropped first, and at
+    most `selection.shortfall` of them are kept.
+
+    Returns:
+        int: ID of the new quiz
+    """
+    generated = list(generated)[:selection.shortfall]
+    question_vectors = get_question_vectors()
+    vectors = None
+    if generated and question_vectors is not None:
+        try:
+            generated, vectors, dropped = question_vectors.drop_duplicates(generated)
+            if dropped:
+                logger.info(f"Dropped {dropped} generated questions already in the bank")
+        except Exception as e:
+            logger.error(f"Skipping duplicate check: {e}")
+
+    with transaction.atomic():
+        if generated:
+            quiz_id = save_quiz(generated)
+        else:
+            topic = selection.topics[0]
+            quiz_id = Quiz.objects.create(
+                title=f"Quiz about {topic}",
+                description=f"A quiz containing {len(selection.question_ids)} questions about {topic}",
+                topic=topic[:100],
+            ).quiz_id
+        first_order = max([0] + list(Question.objects.filter(quiz_id=quiz_id).values_list('order_in_quiz', flat=True))) + 1
+        copies = copy_questions(selection.question_ids, quiz_id, first_order=first_order)
+
+    if question_vectors is not None:
+        try:
+            if generated:
+                question_vectors.add_quiz(quiz_id, generated, vectors)
+            question_vectors.add_copies(copies, quiz_id)
+        except Exception as e:
+            logger.error(f"Failed to index quiz {quiz_id}: {e}")
+    return quiz_id
@@ -0,0 +1,208 @@
+"""
+Batch quiz generation: many descriptions, few model calls.
+
+Descriptions are packed into as few prompts as the token budget allows
+(see utils.generate_batch_prompt), and the calls run with bounded
+concurrency. Each combined response is split back into one question list
+per description, and each list is repaired, validated and stored on its
+own, so one bad quiz does not fail the batch. Descriptions a response
+leaves out, or whose response cannot be split at all, are retried one per
+call alongside the other calls. No call runs past the batch's deadline.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .generation import QuizGenerationError, request_completion
+from .repair import repair_questions, tolerant_loads
+from .utils import create_quiz, generate_batch_prompt, generate_quiz_prompt
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'MAX_PROMPT_TOKENS': 8000,  # Budget per call, prompt plus expected output
+    'TOKENS_PER_QUESTION': 200,  # Estimated output tokens for one generated question
+    'DEFAULT_QUESTIONS': 10,  # Assumed quiz size when none is requested
+    'MAX_QUIZZES_PER_CALL': 20,
+    'CONCURRENCY': 4,  # Model calls in flight at once
+    'MAX_DESCRIPTIONS': 100,  # Per request to the batch endpoint
+    'DEADLINE': 300,  # Seconds for a whole batch; calls still waiting by then fail
+}
+
+# Rough token count of the fixed instructions in a batch prompt
+PROMPT_OVERHEAD_TOKENS = len(generate_batch_prompt([])) // 4
+
+
+def get_batch_config():
+    return {**DEFAULTS, **getattr(settings, 'QUIZ_BATCH_GENERATION', {})}
+
+
+@dataclass
+class BatchResult:
+    description: str
+    quiz_id: int = None
+    error: str = ''
+
+    @property
+    def ok(self):
+        return self.quiz_id is not None
+
+
+def estimate_tokens(description, num_questions, config):
+    """
+    Estimates the tokens one description adds to a batch call, input and output.
+    """
+    return len(description) // 4 + 1 + (num_questions or config['DEFAULT_QUESTIONS']) * config['TOKENS_PER_QUESTION']
+
+
+def pack_descriptions(descriptions, num_questions=None, config=None):
+    """
+    Greedily groups description indexes into calls that fit the token budget.
+
+    A description that alone exceeds the budget still gets a call of its own.
+    """
+    config = config or get_batch_config()
+    packs, current, used = [], [], PROMPT_OVERHEAD_TOKENS
+    for index, description in enumerate(descriptions):
+        cost = estimate_tokens(description, num_questions, config)
+        if current and (used + cost > config['MAX_PROMPT_TOKENS'] or len(current) >= config['MAX_QUIZZES_PER_CALL']):
+            packs.append(current)
+            current, used = [], PROMPT_OVERHEAD_TOKENS
+        current.append(index)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def split_batch_response(response_text, count):
+    """
+    Splits a batch response into one raw question list per description.
+
+    Returns:
+        list: One entry per description; None where the response has no quiz for it
+
+    Raises:
+        ValueError: If the response is not a JSON object
+    """
+    data = tolerant_loads(response_text)
+    if not isinstance(data, dict):
+        raise ValueError("Batch response is not a JSON object")
+    return [data.get(str(number)) for number in range(1, count + 1)]
+
+
+def _store(description, raw_questions):
+    # Repaired locally only: a re-ask per quiz would cost what batching saves
+    if not isinstance(raw_questions, list):
+        return BatchResult(description, error="Schema validation failed: expected a list of questions")
+    report = repair_questions(raw_questions)
+    if not report.questions:
+        error = report.broken[0][2] if report.broken else 'no questions'
+        return BatchResult(description, error=f"Schema validation failed: {error}")
+    success, message, quiz_id = create_quiz(report.questions)
+    if not success:
+        return BatchResult(description, error=message)
+    return BatchResult(description, quiz_id=quiz_id)
+
+
+class _Calls:
+    """
+    Model calls of one batch: at most `concurrency` in flight, none past the deadline.
+
+    A slot is held only for the call itself, so storing a quiz or retrying
+    a description never keeps another call waiting.
+    """
+
+    def __init__(self, concurrency, timeout, deadline):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.deadline = time.monotonic() + deadline
+
+    async def request(self, prompt, kind):
+        async with self.semaphore:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise QuizGenerationError('Batch deadline exceeded before this quiz was generated.', status=504)
+            return await request_completion(prompt, min(self.timeout, remaining), kind)
+
+
+async def _generate_one(description, num_questions, calls):
+    try:
+        response_text = await calls.request(generate_quiz_prompt(description, num_questions), 'generate')
+        raw_questions = tolerant_loads(response_text)
+    except QuizGenerationError as e:
+        return BatchResult(description, error=e.message)
+    except ValueError as e:
+        return BatchResult(description, error=f"Invalid JSON format: {e}")
+    return await sync_to_async(_store)(description, raw_questions)
+
+
+async def _generate_pack(descriptions, num_questions, calls):
+    if len(descriptions) == 1:
+        return [await _generate_one(descriptions[0], num_questions, calls)]
+    try:
+        response_text = await calls.request(generate_batch_prompt(descriptions, num_questions), 'batch')
+    except QuizGenerationError as e:
+        return [BatchResult(description, error=e.message) for description in descriptions]
+    try:
+        parts = split_batch_response(response_text, len(descriptions))
+    except ValueError as e:
+        logger.error(f"Could not split batch response, retrying {len(descriptions)} quizzes singly: {e}")
+        parts = [None] * len(descriptions)
+
+    retries = [index for index, raw_questions in enumerate(parts) if raw_questions is None]
+    retried = asyncio.gather(*[_generate_one(descriptions[index], num_questions, calls) for index in retries])
+    results = [
+        None if raw_questions is None else await sync_to_async(_store)(description, raw_questions)
+        for description, raw_questions in zip(descriptions, parts)
+    ]
+    for index, result in zip(retries, await retried):
+        results[index] = result
+    return results
+
+
+async def generate_quizzes(descriptions, num_questions=None, pack=True, concurrency=None, timeout=None, deadline=None):
+    """
+    Generates and stores one quiz per description.
+
+    Args:
+        descriptions (list[str]): What each quiz should be about
+        num_questions (int): Questions per quiz, left to the model if None
+        pack (bool): Pack several descriptions into one call; otherwise
+            every description gets its own call
+        concurrency (int): Model calls in flight at once, defaults to
+            QUIZ_BATCH_GENERATION['CONCURRENCY']
+        timeout (float): Seconds to wait for each call, defaults to
+            settings.QUIZ_GENERATION_TIMEOUT
+        deadline (float): Seconds for the whole batch, defaults to
+            QUIZ_BATCH_GENERATION['DEADLINE']; quizzes not generated by then
+            fail
+
+    Returns:
+        list[BatchResult]: One result per description, in input order
+    """
+    config = get_batch_config()
+    if pack:
+        packs = pack_descriptions(descriptions, num_questions, config)
+    else:
+        packs = [[index] for index in range(len(descriptions))]
+    calls = _Calls(
+        concurrency or config['CONCURRENCY'],
+        timeout if timeout is not None else getattr(settings, 'QUIZ_GENERATION_TIMEOUT', 60),
+        deadline if deadline is not None else config['DEADLINE'],
+    )
+
+    async def run(indexes):
+        return indexes, await _generate_pack([descriptions[index] for index in indexes], num_questions, calls)
+
+    results = [None] * len(descriptions)
+    for indexes, pack_results in await asyncio.gather(*[run(indexes) for indexes in packs]):
+        for index, result in zip(indexes, pack_results):
+            results[index] = result
+    succeeded = sum(1 for result in results if result.ok)
+    logger.info(f"Batch generated {succeeded} of {len(descriptions)} quizzes in {len(packs)} calls")
+    return results
@@ -0,0 +1,957 @@
+"""
+Benchmarks for the quiz pipeline, run with ``python manage.py benchmark <name>``.
+
+Each benchmark runs against a throwaway test database and a local fake model,
+so results are reproducible offline and never touch db.sqlite3 or the
+Gemini API.
+"""
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from .llm import FakeBackend, LLMClient
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Registers a benchmark function under `name`.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+@contextmanager
+def scratch_database(on_disk=False):
+    """
+    Runs the enclosed block against a freshly created test database.
+
+    SQLite test databases live in memory unless `on_disk` is set, which
+    benchmarks that measure file locking between threads need.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    if on_disk and connection.vendor == 'sqlite':
+        test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+def sample_quiz_data(num_questions, topic="Benchmark"):
+    """
+    Builds a valid quiz payload with `num_questions` questions.
+
+    Ids wrap after 999 because the schema only allows three digits.
+    """
+    return [
+        {
+            "id": f"q_bench_{i % 1000:03d}",
+            "topic": topic,
+            "difficulty": "Medium",
+            "type": "MCQ",
+            "question_text": f"Benchmark question number {i}?",
+            "options": [
+                {"option_id": letter, "text": f"Option {letter} for question {i}"}
+                for letter in "abcd"
+            ],
+            "correct_answer_id": "b",
+            "explanation": f"Option b is correct for question {i}.",
+        }
+        for i in range(1, num_questions + 1)
+    ]
+
+
+def sample_quiz_response(num_questions, topic="Benchmark"):
+    """
+    Returns a valid quiz payload as the JSON text a model would send.
+    """
+    return json.dumps(sample_quiz_data(num_questions, topic))
+
+
+@contextmanager
+def fake_llm(backend):
+    """
+    Routes every LLM call to `backend` through a fresh client without a rate limit.
+    """
+    with patch('front.llm._client', LLMClient(backend, max_concurrency=10_000)):
+        yield backend
+
+
+def model_only():
+    """
+    Sends every generation to the model: no prompt cache, no question bank
+    and no duplicate checks, so timings measure the calls being compared.
+    """
+    return override_settings(
+        QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_QUESTION_BANK={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False},
+    )
+
+
+class FakeBatchBackend(FakeBackend):
+    """
+    Fake backend that answers batch prompts with one quiz per listed description.
+
+    Each call takes `latency` seconds of round-trip plus `seconds_per_question`
+    for every question it returns, as a real model's output time grows with
+    the length of the answer.
+    """
+
+    def __init__(self, size, latency=0.0, seconds_per_question=0.0):
+        super().__init__(latency=latency, responder=self.respond)
+        self.size = size
+        self.seconds_per_question = seconds_per_question
+
+    @staticmethod
+    def quiz_count(prompt):
+        match = re.match(r'Create (\d+) separate quizzes', prompt)
+        return int(match.group(1)) if match else None
+
+    def respond(self, prompt):
+        count = self.quiz_count(prompt)
+        if count is None:
+            return sample_quiz_response(self.size)
+        return json.dumps({str(number): sample_quiz_data(self.size) for number in range(1, count + 1)})
+
+    async def generate(self, prompt, config):
+        await asyncio.sleep(self.latency + self.seconds_per_question * self.size * (self.quiz_count(prompt) or 1))
+        return self._answer(prompt)
+
+
+@benchmark('async_generation')
+def bench_async_generation(out, concurrency=20, latency=0.5, workers=4, size=10, **options):
+    """
+    Compares concurrent quiz generations on a fixed pool of sync workers
+    against the async view, with a fake model of fixed latency.
+    """
+    from django.test import AsyncClient
+
+    from .utils import create_quiz, validate_quiz_response
+
+    fake_backend = FakeBackend(sample_quiz_response(size), latency=latency)
+    body = json.dumps({"description": "Benchmark quiz"})
+
+    def sync_generation(_):
+        # The pre-async pipeline, as a WSGI worker would run it: a blocking model call
+        time.sleep(latency)
+        validate_quiz_response(fake_backend.response_text)
+        return create_quiz(fake_backend.response_text)
+
+    async def async_generations():
+        client = AsyncClient()
+        return await asyncio.gather(*[
+            client.post('/query-gemini/', body, content_type='application/json')
+            for _ in range(concurrency)
+        ])
+
+    # Identical descriptions would otherwise be answered by the prompt cache or the bank
+    with scratch_database(), model_only(), fake_llm(fake_backend):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(sync_generation, range(concurrency)))
+        sync_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        responses = asyncio.run(async_generations())
+        async_elapsed = time.perf_counter() - start
+
+    failures = sum(1 for response in responses if response.status_code != 200)
+    out(f"{concurrency} generations, {latency:.2f}s model latency, {size} questions each")
+    out(f"  sync, {workers} workers: {sync_elapsed:.2f}s")
+    out(f"  async view:        {async_elapsed:.2f}s ({failures} failed)")
+
+
+@benchmark('streaming')
+def bench_streaming(out, latency=10.0, size=10, **options):
+    """
+    Measures time-to-first-question of the SSE stream against the time to
+    generate the whole quiz, with a fake model streaming at a steady rate.
+    """
+    from .streaming import stream_quiz_events
+
+    fake_backend = FakeBackend(sample_quiz_response(size), latency=latency)
+
+    async def consume():
+        start = time.perf_counter()
+        first_question = None
+        async for event in stream_quiz_events("Benchmark quiz"):
+            if first_question is None and event.startswith('event: question'):
+                first_question = time.perf_counter() - start
+        return first_question, time.perf_counter() - start
+
+    with scratch_database(), model_only(), fake_llm(fake_backend):
+        first_question, total = asyncio.run(consume())
+
+    out(f"{size} questions streamed over {latency:.1f}s of model latency")
+    out(f"  time to first question: {first_question:.2f}s")
+    out(f"  time to full quiz:      {total:.2f}s ({first_question / total:.0%})")
+
+
+@benchmark('validation')
+def bench_validation(out, size=500, iterations=20, **options):
+    """
+    Compares per-response CPU time of the old jsonschema validation (schema
+    rebuilt and JSON parsed twice per request) with the single-pass pydantic
+    parse, on a large synthetic response.
+    """
+    from jsonschema import validate
+
+    from .schemas import QuizSchema
+    from .utils import strip_code_fences
+
+    response_text = sample_quiz_response(size)
+
+    def legacy_validation(text):
+        schema = QuizSchema.model_json_schema()
+        validate(instance=json.loads(strip_code_fences(text)), schema=schema)
+        return json.loads(text)  # create_quiz parsed the string again
+
+    def single_pass_validation(text):
+        return QuizSchema.model_validate_json(strip_code_fences(text)).root
+
+    out(f"{size}-question response ({len(response_text) / 1024:.0f} KiB), {iterations} iterations")
+    for label, func in (("jsonschema, parsed twice", legacy_validation), ("pydantic, single pass", single_pass_validation)):
+        func(response_text)  # Warm up
+        start = time.process_time()
+        for _ in range(iterations):
+            func(response_text)
+        per_call = (time.process_time() - start) / iterations
+        out(f"  {label:<25} {per_call * 1000:8.2f} ms CPU per response")
+
+
+@benchmark('persistence')
+def bench_persistence(out, iterations=20, **options):
+    """
+    Times atomic quiz persistence for 10, 100 and 1000 question quizzes,
+    with and without primary keys returned from bulk inserts.
+    """
+    from unittest.mock import PropertyMock
+
+    from django.test.utils import CaptureQueriesContext
+
+    from .persistence import save_quiz, save_quizzes
+    from .schemas import QuizSchema
+
+    features = type(connection.features)
+    with scratch_database():
+        out(f"{connection.vendor}, {iterations} quizzes per size")
+        for returns_pks in (True, False):
+            flag = patch.object(features, 'can_return_rows_from_bulk_insert', new_callable=PropertyMock, return_value=returns_pks)
+            with flag:
+                label = "returned PKs" if returns_pks else "PK read-back"
+                for size in (10, 100, 1000):
+                    questions = QuizSchema.model_validate(sample_quiz_data(size)).root
+                    with CaptureQueriesContext(connection) as queries:
+                        save_quiz(questions)
+                    start = time.perf_counter()
+                    for _ in range(iterations):
+                        save_quiz(questions)
+                    per_quiz = (time.perf_counter() - start) / iterations
+                    out(f"  {label:<13} {size:>5} questions: {per_quiz * 1000:8.2f} ms/quiz, {len(queries)} queries")
+
+                start = time.perf_counter()
+                save_quizzes([QuizSchema.model_validate(sample_quiz_data(10)).root] * 100)
+                out(f"  {label:<13} batch of 100 x 10: {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+
+@benchmark('ingestion')
+def bench_ingestion(out, concurrency=32, iterations=50, size=10, **options):
+    """
+    Measures sustained quiz submissions per second from many concurrent
+    clients, writing each attempt directly versus through the attempt buffer.
+    """
+    from django.db import connections
+    from django.test import Client
+
+    from .ingest import get_attempt_buffer, reset_attempt_buffer
+    from .persistence import save_quiz
+    from .schemas import QuizSchema
+
+    def run(buffered):
+        statuses = []
+        lock = threading.Lock()
+
+        def student(_):
+            client = Client(raise_request_exception=False)  # Count lock errors as failures
+            answers = {str(question_id): option_id for question_id, option_id in answer_sheet.items()}
+            body = json.dumps({'answers': answers})
+            results = [
+                client.post(url, body, content_type='application/json').status_code
+                for _ in range(iterations)
+            ]
+            connections.close_all()
+            with lock:
+                statuses.extend(results)
+
+        config = {'ENABLED': buffered, 'QUEUE_SIZE': concurrency * iterations}
+        with override_settings(QUIZ_ATTEMPT_BUFFER=config):
+            reset_attempt_buffer()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(student, range(concurrency)))
+            if buffered:
+                get_attempt_buffer().flush(timeout=60)  # Count the write-behind time too
+            elapsed = time.perf_counter() - start
+            stats = get_attempt_buffer().stats() if buffered else None
+            reset_attempt_buffer()
+        return elapsed, statuses, stats
+
+    with scratch_database(on_disk=True):
+        from .models import Attempt, Question
+
+        quiz_id = save_quiz(QuizSchema.model_validate(sample_quiz_data(size)).root)
+        url = f'/quiz/{quiz_id}/submit/'
+        answer_sheet = {
+            question.question_id: question.options.all()[1].option_id
+            for question in Question.objects.filter(quiz_id=quiz_id).prefetch_related('options')
+        }
+
+        out(f"{connection.vendor}, {concurrency} clients x {iterations} submissions of a {size}-question quiz")
+        for label, buffered in (("direct writes", False), ("attempt buffer", True)):
+            before = Attempt.objects.count()
+            elapsed, statuses, stats = run(buffered)
+            stored = Attempt.objects.count() - before
+            errors = sum(1 for status in statuses if status != 200)
+            out(f"  {label:<15} {stored / elapsed:8.0f} submissions/s stored, {errors} errors")
+            if stats:
+                out(
+                    f"  {'':<15} {stats['flushes']} flushes, mean {stats['mean_flush_seconds'] * 1000:.1f} ms, "
+                    f"max {stats['max_flush_seconds'] * 1000:.1f} ms, {stats['rejected']} rejected"
+                )
+
+
+def _synthetic_vocabulary(rng, size):
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qu', 'ar', 'el', 'on', 'ux', 'py', 'th']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(syllables, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+@benchmark('search')
+def bench_search(out, size=1_000_000, iterations=5, **options):
+    """
+    Compares admin-style LIKE searches with the full-text index on a
+    generated corpus of `size` questions (four options each).
+    """
+    import random
+
+    from django.db import transaction
+
+    from .models import Question
+    from .search import rebuild_index, search_question_ids
+
+    rng = random.Random(42)
+    vocabulary = _synthetic_vocabulary(rng, 20000)
+    per_quiz = 10
+
+    def timed(func):
+        func()  # Warm up the page cache
+        start = time.perf_counter()
+        for _ in range(iterations):
+            result = func()
+        return (time.perf_counter() - start) / iterations, result
+
+    with scratch_database(on_disk=True):
+        start = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for first_quiz in range(1, size // per_quiz + 1, 1000):
+                quiz_ids = range(first_quiz, min(first_quiz + 1000, size // per_quiz + 1))
+                cursor.executemany(
+                    "INSERT INTO front_quiz (quiz_id, title, description, created_at) VALUES (%s, %s, '', CURRENT_TIMESTAMP)",
+                    [(quiz_id, f"Quiz about {rng.choice(vocabulary)}") for quiz_id in quiz_ids],
+                )
+                questions, answer_options = [], []
+                for quiz_id in quiz_ids:
+                    for order in range(1, per_quiz + 1):
+                        question_id = (quiz_id - 1) * per_quiz + order
+                        questions.append((question_id, quiz_id, ' '.join(rng.choices(vocabulary, k=8)) + '?', order))
+                        answer_options.extend(
+                            (question_id, ' '.join(rng.choices(vocabulary, k=3)), letter == 'a') for letter in 'abcd'
+                        )
+                cursor.executemany(
+                    "INSERT INTO front_question (question_id, quiz_id, question_text, question_type, order_in_quiz) "
+                    "VALUES (%s, %s, %s, 'MCQ', %s)",
+                    questions,
+                )
+                cursor.executemany(
+                    "INSERT INTO front_answeroption (question_id, option_text, is_correct) VALUES (%s, %s, %s)",
+                    answer_options,
+                )
+        out(f"{connection.vendor}, generated {size} questions in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            rebuild_index()
+        out(f"  built the full-text index in {time.perf_counter() - start:.1f}s")
+
+        for term in (rng.choice(vocabulary), rng.choice(vocabulary) + ' ' + rng.choice(vocabulary)):
+            like = Question.objects.filter(question_text__icontains=term.split()[0])
+            for word in term.split()[1:]:
+                like = like.filter(question_text__icontains=word)
+            like_count, _ = timed(like.count)
+            like_page, _ = timed(lambda: list(like.values_list('pk', flat=True)[:100]))
+            full_text, ids = timed(lambda: search_question_ids(term, limit=100))
+            out(f"  '{term}':")
+            out(f"    LIKE count (admin paginator) {like_count * 1000:9.1f} ms")
+            out(f"    LIKE first 100               {like_page * 1000:9.1f} ms")
+            out(f"    full-text top 100            {full_text * 1000:9.1f} ms ({len(ids)} hits)")
+
+
+@benchmark('vectors')
+def bench_vectors(out, size=100_000, latency=0.05, iterations=20, **options):
+    """
+    Measures batched versus per-question embedding against an embedder with
+    fixed per-call latency, and nearest-neighbour query time over `size`
+    indexed questions.
+    """
+    import random
+
+    from .prompt_cache import HashingEmbedder
+    from .vectors import MemoryVectorIndex
+
+    class SlowEmbedder(HashingEmbedder):
+        # Stands in for a remote embedding API with a round-trip per call
+        def embed(self, texts):
+            time.sleep(latency)
+            return super().embed(texts)
+
+    embedder = SlowEmbedder()
+    texts = [f"Benchmark question number {i} about topic {i % 7}?" for i in range(50)]
+    start = time.perf_counter()
+    for text in texts:
+        embedder.embed([text])
+    one_by_one = time.perf_counter() - start
+    start = time.perf_counter()
+    embedder.embed(texts)
+    batched = time.perf_counter() - start
+    out(f"Embedding {len(texts)} questions, {latency * 1000:.0f} ms per embedder call")
+    out(f"  one call per question: {one_by_one * 1000:8.1f} ms")
+    out(f"  one batched call:      {batched * 1000:8.1f} ms")
+
+    rng = random.Random(0)
+    dimensions = HashingEmbedder().dimensions
+    index = MemoryVectorIndex(refresh_interval=3600)
+    index._loaded_at = time.monotonic()  # Populated directly, not from the database
+    for first in range(0, size, 10000):
+        index.add([
+            (i, i // 10, [rng.random() for _ in range(dimensions)])
+            for i in range(first, min(first + 10000, size))
+        ])
+    query = [[rng.random() for _ in range(dimensions)]]
+
+    out(f"Nearest 10 of {size} questions ({dimensions} dimensions)")
+    index.search(query, k=10)  # Warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        index.search(query, k=10)
+    out(f"  numpy brute force:     {(time.perf_counter() - start) / iterations * 1000:8.1f} ms")
+    with patch('front.vectors.numpy', None):
+        start = time.perf_counter()
+        index.search(query, k=10)
+        out(f"  pure Python scan:      {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+
+@benchmark('batch_generation')
+def bench_batch_generation(out, concurrency=24, latency=1.0, workers=4, size=10, **options):
+    """
+    Compares generating `concurrency` quizzes one call at a time, fanned out
+    over `workers` concurrent calls, and packed into batch prompts.
+    """
+    from .batch import generate_quizzes, pack_descriptions
+
+    descriptions = [f"Benchmark quiz number {i}" for i in range(concurrency)]
+    per_question = 0.02
+    modes = [
+        ("one call at a time", dict(pack=False, concurrency=1)),
+        (f"fan-out, {workers} in flight", dict(pack=False, concurrency=workers)),
+        (f"packed, {workers} in flight", dict(pack=True, concurrency=workers)),
+    ]
+    out(f"{concurrency} quizzes of {size} questions, {latency:.2f}s per call + {per_question * 1000:.0f} ms per question")
+    out(f"  {len(pack_descriptions(descriptions, size))} packed calls")
+    with scratch_database(), model_only():
+        for label, kwargs in modes:
+            fake_backend = FakeBatchBackend(size, latency=latency, seconds_per_question=per_question)
+            with fake_llm(fake_backend):
+                start = time.perf_counter()
+                results = asyncio.run(generate_quizzes(descriptions, num_questions=size, **kwargs))
+                elapsed = time.perf_counter() - start
+            failures = sum(1 for result in results if not result.ok)
+            out(f"  {label:<24} {elapsed:6.2f}s, {len(fake_backend.prompts):3d} calls, "
+                f"{concurrency / elapsed:5.1f} quizzes/s ({failures} failed)")
+
+
+def bad_response_corpus(size=10):
+    """
+    Returns model responses with the defects seen in archived output, one defect each.
+    """
+    def defect(name, mutate):
+        data = sample_quiz_data(size)
+        return name, mutate(data)
+
+    def dumps(data):
+        return json.dumps(data, indent=2)
+
+    def set_field(field, value, count=1):
+        def mutate(data):
+            for question in data[:count]:
+                question[field] = value(question) if callable(value) else value
+            return dumps(data)
+        return mutate
+
+    def drop_option(data):
+        data[0]['options'] = data[0]['options'][:3]
+        return dumps(data)
+
+    def extra_option(data):
+        data[0]['options'].append({"option_id": "e", "text": "None of the above"})
+        return dumps(data)
+
+    return [
+        defect("prose around the array", lambda data: f"Here is your quiz:\n{dumps(data)}\nGood luck!"),
+        defect("trailing commas", lambda data: dumps(data).replace('"\n    }', '",\n    }').replace('}\n]', '},\n]')),
+        defect("truncated output", lambda data: dumps(data)[:-200]),
+        defect("ids off pattern", set_field('id', lambda question: question['id'].replace('q_bench_', 'Q'), count=size)),
+        defect("lower-case difficulty", set_field('difficulty', 'medium', count=size)),
+        defect("upper-case answer", set_field('correct_answer_id', 'B', count=3)),
+        defect("answer given as text", set_field('correct_answer_id', lambda question: question['options'][1]['text'])),
+        defect("options as strings", set_field('options', lambda question: [option['text'] for option in question['options']])),
+        defect("five options", extra_option),
+        defect("three options", drop_option),
+        defect("missing explanation", lambda data: dumps([{k: v for k, v in q.items() if k != 'explanation'} for q in data])),
+    ]
+
+
+def archived_bad_responses():
+    """
+    Yields (request_id, text) for archived generation responses that fail strict validation.
+    """
+    import gzip
+    from pathlib import Path
+
+    from django.conf import settings
+
+    from .utils import parse_quiz_response
+
+    directory = Path(getattr(settings, 'QUIZ_RESPONSE_ARCHIVE', {}).get('DIRECTORY', 'response_archive'))
+    for path in sorted(directory.glob('*.jsonl.gz')):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as fileobj:
+                for line in fileobj:
+                    record = json.loads(line)
+                    if record.get('source') == 'generate' and parse_quiz_response(record['text'])[0] is None:
+                        yield record['request_id'], record['text']
+        except (OSError, ValueError):
+            continue
+
+
+@benchmark('repair')
+def bench_repair(out, size=10, iterations=100, **options):
+    """
+    Measures first-attempt success and LLM calls on malformed responses,
+    with and without the repair stage.
+    """
+    from .repair import repair_response
+    from .utils import parse_quiz_response
+
+    groups = [
+        ("defect corpus", bad_response_corpus(size)),
+        ("response archive", [(f"archived {request_id[:8]}", text) for request_id, text in archived_bad_responses()]),
+    ]
+    corpus = [item for _, items in groups for item in items]
+    for group, items in groups:
+        if not items:
+            continue
+        strict_ok = repaired_ok = reasks = regenerations = 0
+        out(f"{group}: {len(items)} malformed responses")
+        for name, text in items:
+            strict_ok += parse_quiz_response(text)[0] is not None
+            try:
+                report = repair_response(text)
+            except ValueError:
+                report = None
+            if report is None or not report.questions:
+                outcome, regenerations = "unrecoverable, regenerate", regenerations + 1
+            elif report.broken:
+                outcome, reasks = f"{len(report.questions)} kept, re-ask {len(report.broken)}", reasks + 1
+            else:
+                outcome, repaired_ok = f"{len(report.questions)} kept", repaired_ok + 1
+            out(f"  {name:<24} {outcome}")
+        out(f"  first-attempt success: strict {strict_ok}/{len(items)}, with repair {repaired_ok + reasks}/{len(items)}")
+        out(f"  extra LLM calls: {len(items) - strict_ok} full regenerations before, "
+            f"{reasks} small re-asks + {regenerations} regenerations after")
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for _, text in corpus:
+            try:
+                repair_response(text)
+            except ValueError:
+                pass
+    per_response = (time.perf_counter() - start) / (iterations * len(corpus))
+    out(f"Local repair: {per_response * 1000:.2f} ms per response")
+
+
+# Imported by a worker that serves its first request, timed inside the subprocess
+COLD_START_SCRIPT = """
+import io, json, os, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+ready = time.perf_counter()
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+}
+b''.join(application(environ, lambda status, headers: statuses.append(status)))
+done = time.perf_counter()
+print(json.dumps({'setup': ready - start, 'first_request': done - ready, 'status': statuses[0]}))
+"""
+
+# Heavy dependencies whose import cost shows up in startup
+WATCHED_MODULES = ('numpy', 'pydantic', 'dotenv', 'google.generativeai', 'anthropic', 'litellm')
+
+
+def _python(args, **kwargs):
+    from django.conf import settings
+
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'quiz2.settings')}
+    return subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, **kwargs)
+
+
+def import_times(stderr):
+    """
+    Parses ``-X importtime`` output into {module: cumulative microseconds}, plus the total.
+    """
+    cumulative, total = {}, 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumul, name = line.split('|')
+        cumulative[name.strip()] = int(cumul)
+        if not name[1:].startswith(' '):  # Nested imports are indented
+            total += int(cumul)
+    return cumulative, total
+
+
+@benchmark('startup')
+def bench_startup(out, iterations=5, **options):
+    """
+    Measures import time of ``manage.py check`` and a WSGI worker's cold
+    start to its first response, each in a fresh interpreter.
+    """
+    totals, urlconf, modules = [], [], {}
+    for _ in range(iterations):
+        result = _python(['-X', 'importtime', 'manage.py', 'check'])
+        cumulative, total = import_times(result.stderr)
+        totals.append(total)
+        urlconf.append(cumulative.get('front.views', 0))
+        for name in WATCHED_MODULES:
+            if name in cumulative:
+                modules.setdefault(name, []).append(cumulative[name])
+    out(f"python -X importtime manage.py check, median of {iterations} runs")
+    out(f"  all imports:              {statistics.median(totals) / 1000:8.1f} ms")
+    out(f"  front.views (cumulative): {statistics.median(urlconf) / 1000:8.1f} ms")
+    for name in WATCHED_MODULES:
+        loaded = f"{statistics.median(modules[name]) / 1000:8.1f} ms" if name in modules else "     not imported"
+        out(f"  {name + ':':<25} {loaded}")
+
+    runs = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = _python(['-c', COLD_START_SCRIPT])
+        wall = time.perf_counter() - start
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        runs.append((wall, timings['setup'], timings['first_request'], timings['status']))
+    out(f"Worker cold start (new process, WSGI, GET /), median of {iterations} runs")
+    out(f"  process start to response: {statistics.median(run[0] for run in runs) * 1000:8.1f} ms")
+    out(f"  django setup:              {statistics.median(run[1] for run in runs) * 1000:8.1f} ms")
+    out(f"  first request:             {statistics.median(run[2] for run in runs) * 1000:8.1f} ms ({runs[0][3]})")
+
+    # What the first generation pays instead, when the provider SDK is imported lazily
+    result = _python(['-X', 'importtime', '-c', 'import google.generativeai'])
+    cumulative, _ = import_times(result.stderr)
+    if 'google.generativeai' in cumulative:
+        out(f"Deferred to first LLM call: google.generativeai {cumulative['google.generativeai'] / 1000:.1f} ms")
+
+
+@benchmark('catalogue')
+def bench_catalogue(out, size=2_000_000, iterations=20, **options):
+    """
+    Compares per-page latency of keyset and OFFSET pagination of the quiz
+    catalogue at shallow and deep pages of a `size`-row table.
+    """
+    import datetime
+
+    from django.utils import timezone
+
+    from .catalogue import encode_cursor, get_catalogue_config, list_quizzes
+    from .models import Quiz
+
+    limit = get_catalogue_config()['PAGE_SIZE']
+    topics = [f"Topic {i}" for i in range(50)]
+    start_time = timezone.now() - datetime.timedelta(seconds=size)
+
+    def row(i):
+        # Every tenth quiz shares its predecessor's timestamp, as bulk saves do
+        created_at = start_time + datetime.timedelta(seconds=i - (i % 10 == 9))
+        return f"Quiz {i}", "", connection.ops.adapt_datetimefield_value(created_at), topics[i % len(topics)]
+
+    def timed(func):
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times) * 1000
+
+    with scratch_database():
+        start = time.perf_counter()
+        table = connection.ops.quote_name(Quiz._meta.db_table)
+        with connection.cursor() as cursor:
+            for first in range(0, size, 100_000):
+                cursor.executemany(
+                    f"INSERT INTO {table} (title, description, created_at, topic) VALUES (%s, %s, %s, %s)",
+                    [row(i) for i in range(first, min(first + 100_000, size))],
+                )
+        out(f"{size} quizzes inserted in {time.perf_counter() - start:.1f}s; {limit} per page, median of {iterations}")
+
+        for topic in (None, topics[0]):
+            quizzes = Quiz.objects.order_by('-created_at', '-quiz_id')
+            if topic:
+                quizzes = quizzes.filter(topic=topic)
+            total = size // len(topics) if topic else size
+            out(f"  {'topic filter' if topic else 'all quizzes'} ({total} rows)")
+            for page in (1, 100, 1_000, 10_000):
+                if (page - 1) * limit >= total:
+                    continue
+                offset = (page - 1) * limit
+                cursor = None
+                if offset:
+                    # Where the previous page ended, as a client walking the pages would know
+                    created_at, quiz_id = quizzes.values_list('created_at', 'quiz_id')[offset - 1]
+                    cursor = encode_cursor(created_at, quiz_id)
+                keyset = timed(lambda: list_quizzes(topic, cursor, limit))
+                offset_ms = timed(lambda: list(quizzes.values('quiz_id', 'title', 'topic', 'created_at')[offset:offset + limit + 1]))
+                out(f"    page {page:>6}: keyset {keyset:7.2f} ms, OFFSET {offset_ms:8.2f} ms")
+
+        # The table as it was before the catalogue indexes: every page sorts all rows
+        with connection.schema_editor() as editor:
+            for index in Quiz._meta.indexes:
+                editor.remove_index(Quiz, index)
+        out(f"  without the composite indexes, page 1: {timed(lambda: list_quizzes(None, None, limit)):8.2f} ms")
+
+
+@benchmark('database')
+def bench_database(out, concurrency=32, iterations=100, size=10, **options):
+    """
+    Runs a mixed load from `concurrency` threads, one quiz write per four
+    quiz reads, with the plain and the tuned database profile.
+
+    Runs against the configured database: on PostgreSQL, 'tuned' keeps each
+    thread's connection (or the pool from settings) where 'plain' reconnects
+    for every operation.
+    """
+    import random
+
+    from django.db import OperationalError
+
+    from .db import get_sqlite_pragmas
+    from .models import Quiz
+    from .persistence import save_quiz
+    from .schemas import QuizSchema
+
+    questions = QuizSchema.model_validate(sample_quiz_data(size)).root
+    vendor_options = connection.settings_dict.setdefault('OPTIONS', {})
+    old_options = dict(vendor_options)
+    # Measure the database only: no page or vector caches to maintain on writes
+    isolated = override_settings(QUIZ_VECTOR_INDEX={'ENABLED': False}, QUIZ_PROMPT_CACHE={'ENABLED': False})
+
+    out(f"{concurrency} threads x {iterations} operations, 20% writes of {size}-question quizzes ({connection.vendor})")
+    for profile in ('plain', 'tuned'):
+        vendor_options.clear()
+        vendor_options.update(old_options)
+        if profile == 'plain':
+            vendor_options.pop('transaction_mode', None)
+            vendor_options.pop('pool', None)
+        elif connection.vendor == 'sqlite':
+            vendor_options['transaction_mode'] = 'IMMEDIATE'
+        try:
+            with override_settings(QUIZ_DB_PROFILE=profile), isolated, scratch_database(on_disk=True):
+                quiz_ids = [save_quiz(questions) for _ in range(20)]
+
+                def run(seed):
+                    rng = random.Random(seed)
+                    latencies, errors = [], 0
+                    for i in range(iterations):
+                        start = time.perf_counter()
+                        try:
+                            if i % 5 == 0:
+                                save_quiz(questions)
+                            else:
+                                quiz = Quiz.objects.with_questions().get(pk=rng.choice(quiz_ids))
+                                sum(len(question.options.all()) for question in quiz.questions.all())
+                        except OperationalError:
+                            errors += 1
+                        latencies.append(time.perf_counter() - start)
+                        if profile == 'plain':
+                            connection.close()  # A connection per request, as with CONN_MAX_AGE = 0
+                    connection.close()
+                    return latencies, errors
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    results = list(pool.map(run, range(concurrency)))
+                elapsed = time.perf_counter() - start
+                journal_mode = None
+                if connection.vendor == 'sqlite':
+                    with connection.cursor() as cursor:
+                        cursor.execute("PRAGMA journal_mode")
+                        journal_mode = cursor.fetchone()[0]
+        finally:
+            vendor_options.clear()
+            vendor_options.update(old_options)
+
+        latencies = sorted(latency for run_latencies, _ in results for latency in run_latencies)
+        errors = sum(run_errors for _, run_errors in results)
+        detail = f", journal {journal_mode}" if journal_mode else ""
+        out(f"  {profile:<6} {len(latencies) / elapsed:7.1f} ops/s, p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms, {errors} 'database is locked'{detail}")
+    if connection.vendor == 'sqlite':
+        out(f"  tuned pragmas: {', '.join(f'{name}={value}' for name, value in get_sqlite_pragmas().items())}")
+
+
+@benchmark('metrics')
+def bench_metrics(out, iterations=2000, size=10, **options):
+    """
+    Measures what the metrics middleware and query counting add to a
+    cached quiz_detail request, and the cost of rendering /metrics.
+    """
+    from django.conf import settings
+    from django.test import Client
+
+    from .metrics import render
+    from .persistence import save_quiz
+    from .schemas import QuizSchema
+
+    without_metrics = [name for name in settings.MIDDLEWARE if name != 'front.metrics.MetricsMiddleware']
+    modes = [
+        ("without metrics", override_settings(MIDDLEWARE=without_metrics, QUIZ_METRICS={'ENABLED': False})),
+        ("with metrics", override_settings(QUIZ_METRICS={'ENABLED': True})),
+    ]
+    out(f"quiz_detail for a cached {size}-question quiz, {iterations} requests")
+    with scratch_database():
+        quiz_id = save_quiz(QuizSchema.model_validate(sample_quiz_data(size)).root)
+        url = f"/quiz/{quiz_id}/"
+        per_request = {}
+        for _ in range(3):  # Alternate modes so drift affects both alike
+            for label, overrides in modes:
+                with overrides:
+                    connection.close()  # Reconnect so the query wrapper follows the setting
+                    client = Client()
+                    client.get(url)  # Warm the page cache
+                    start = time.perf_counter()
+                    for _ in range(iterations):
+                        client.get(url)
+                    elapsed = (time.perf_counter() - start) / iterations
+                per_request[label] = min(per_request.get(label, elapsed), elapsed)
+        for label, _ in modes:
+            out(f"  {label:<16} {per_request[label] * 1_000_000:7.1f} us per request")
+        overhead = per_request["with metrics"] - per_request["without metrics"]
+        out(f"  overhead: {overhead * 1_000_000:.1f} us per request ({overhead / per_request['without metrics']:.1%})")
+
+        start = time.perf_counter()
+        text = render()
+        out(f"Rendering /metrics: {(time.perf_counter() - start) * 1000:.2f} ms for {len(text.splitlines())} lines")
+
+
+class RecordedAnswerBackend(FakeBackend):
+    """
+    Fake provider with a JSON mode, replaying one recorded answer.
+
+    Asked for free text, it sends the answer inside a Markdown code fence,
+    as models often do despite the prompt; in JSON mode, the bare JSON.
+    """
+
+    def __init__(self, answer, latency=0.0):
+        super().__init__(answer, latency=latency, structured=True)
+        self.answers = []
+
+    async def generate(self, prompt, config, response_schema=None):
+        text = await super().generate(prompt, config, response_schema)
+        if response_schema is None:
+            text = f"```json\n{text}\n```"
+        self.answers.append(text)
+        return text
+
+
+@benchmark('structured_output')
+def bench_structured_output(out, iterations=50, latency=0.0, size=10, **options):
+    """
+    Compares free-text and structured (JSON mode) generation against a
+    recorded answer: input and output tokens per call, time spent
+    validating the answer, and the whole generate_quiz call.
+
+    Tokens are estimated at four characters each. The schema is counted
+    as input, in the form the Gemini backend sends it, since providers
+    bill it like the prompt.
+    """
+    from .generation import generate_quiz
+    from .llm import GeminiBackend, inline_schema
+    from .utils import parse_quiz_response
+
+    def tokens(text):
+        return len(text) // 4
+
+    backend = RecordedAnswerBackend(sample_quiz_response(size), latency=latency)
+    modes = [("free text", False), ("structured", True)]
+    out(f"{size}-question quiz, {iterations} generations per mode, {latency:.2f}s model latency")
+    with scratch_database(), model_only(), fake_llm(backend):
+        for label, structured in modes:
+            with override_settings(QUIZ_STRUCTURED_OUTPUT=structured):
+                del backend.prompts[:], backend.response_schemas[:], backend.answers[:]
+                start = time.perf_counter()
+                for i in range(iterations):
+                    asyncio.run(generate_quiz(f"Benchmark quiz {i}", num_questions=size))
+                per_generation = (time.perf_counter() - start) / iterations
+
+            prompt_tokens = tokens(backend.prompts[0])
+            schema_tokens = 0
+            if backend.response_schemas:
+                sent = inline_schema(backend.response_schemas[0], GeminiBackend.SCHEMA_KEYWORDS)
+                schema_tokens = tokens(json.dumps(sent, separators=(',', ':')))
+            answer = backend.answers[0]
+
+            start = time.perf_counter()
+            for _ in range(iterations * 20):
+                parse_quiz_response(answer, structured)
+            validation = (time.perf_counter() - start) / (iterations * 20)
+
+            out(f"  {label}:")
+            out(f"    input tokens:  {prompt_tokens + schema_tokens} ({prompt_tokens} prompt + {schema_tokens} schema)")
+            out(f"    output tokens: {tokens(answer)}")
+            out(f"    validation:    {validation * 1_000_000:.1f} us")
+            out(f"    generate_quiz: {per_generation * 1000:.2f} ms")
@@ -0,0 +1,138 @@
+"""
+Streaming readers and writers for quiz banks.
+
+A quiz bank holds quizzes in the JSON format create_quiz accepts (an array
+of question objects per quiz), stored either as JSON Lines (one quiz per
+line) or as a single JSON array of quizzes. Files are read incrementally so
+memory use does not grow with file size.
+"""
+import codecs
+import json
+
+from .schemas import QuizSchema
+
+try:
+    import ijson
+except ImportError:  # Optional: the built-in reader below is used instead
+    ijson = None
+
+READ_SIZE = 64 * 1024
+MAX_QUESTIONS = 999  # Question ids carry a three-digit number ('q_topic_XXX')
+
+
+def iter_json_array(fileobj, read_size=READ_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded is held in memory, so arrays far larger
+    than RAM can be read. Uses ijson when it is installed.
+    """
+    if ijson is not None:
+        yield from ijson.items(fileobj, 'item', use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace and separators between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield element
+                position = end
+                continue
+        elif eof:
+            if started:
+                raise ValueError("Unexpected end of file inside JSON array")
+            return
+
+        # Need more input: drop consumed text and read the next chunk
+        buffer = buffer[position:]
+        position = 0
+        chunk = fileobj.read(read_size)
+        eof = not chunk
+        if isinstance(chunk, bytes):
+            # Incremental decoding keeps multi-byte characters split across reads intact
+            chunk = text_decoder.decode(chunk, final=eof)
+        buffer += chunk
+
+
+def iter_quiz_file(fileobj, fmt):
+    """
+    Yields (index, raw_quiz) pairs from a quiz bank file.
+
+    Args:
+        fileobj: File opened in binary mode
+        fmt (str): 'jsonl' for one quiz per line, 'json' for an array of quizzes
+    """
+    if fmt == 'jsonl':
+        for index, line in enumerate(codecs.iterdecode(fileobj, 'utf-8'), start=1):
+            if line.strip():
+                yield index, line
+    else:
+        for index, quiz in enumerate(iter_json_array(fileobj), start=1):
+            yield index, quiz
+
+
+def parse_quiz(raw_quiz):
+    """
+    Validates one quiz from a bank file, returning its QuizQuestion list.
+    """
+    if isinstance(raw_quiz, str):
+        return QuizSchema.model_validate_json(raw_quiz).root
+    return QuizSchema.model_validate(raw_quiz).root
+
+
+def serialize_quiz(quiz):
+    """
+    Converts a quiz (with prefetched questions and options) to the create_quiz format.
+
+    Ids are numbered by position rather than by order_in_quiz, which can
+    exceed the three digits QuizSchema allows after edits; the order of
+    the questions is kept.
+
+    Raises:
+        ValueError: If the quiz has more questions than an id can number
+    """
+    title = quiz.title
+    topic = title[len("Quiz about "):] if title.startswith("Quiz about ") else title
+    quiz_questions = list(quiz.questions.all())
+    if len(quiz_questions) > MAX_QUESTIONS:
+        raise ValueError(f"{len(quiz_questions)} questions, at most {MAX_QUESTIONS} can be exported")
+    questions = []
+    for position, question in enumerate(quiz_questions, start=1):
+        options = list(question.options.all())
+        letters = 'abcd'
+        correct = next((letters[i] for i, option in enumerate(options) if option.is_correct), 'a')
+        questions.append({
+            "id": f"q_quiz_{position:03d}",
+            "topic": question.topic or topic,
+            "difficulty": question.difficulty or "Medium",
+            "type": question.question_type,
+            "question_text": question.question_text,
+            "options": [
+                {"option_id": letters[i], "text": option.option_text}
+                for i, option in enumerate(options[:4])
+            ],
+            "correct_answer_id": correct,
+            "explanation": "",
+        })
+    return questions
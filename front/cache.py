@@ -0,0 +1,91 @@
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('custom_logger')
+
+
+def get_quiz_cache():
+    """
+    Returns the cache backend used for quiz pages and payloads.
+    """
+    return caches[getattr(settings, 'QUIZ_CACHE_ALIAS', 'default')]
+
+
+def _version_key(quiz_id):
+    return f"quiz:{quiz_id}:version"
+
+
+def _page_key(quiz_id, version):
+    return f"quiz:{quiz_id}:page:{version}"
+
+
+def _payload_key(quiz_id, version, variant):
+    return f"quiz:{quiz_id}:payload:{version}:{variant}"
+
+
+def get_quiz_version(quiz_id):
+    """
+    Returns the current version stamp for a quiz, or a fresh one if it has none.
+
+    Version stamps are nanosecond timestamps rather than counters so that a
+    stamp evicted from the cache is never reissued for different content.
+    A fresh stamp is not stored here: the quiz id may not exist, and a stamp
+    per probed id would fill the cache. It is stored by save_quiz_version
+    once content has been built for it.
+    """
+    version = get_quiz_cache().get(_version_key(quiz_id))
+    return time.time_ns() if version is None else version
+
+
+def save_quiz_version(quiz_id, version):
+    """
+    Stores a fresh stamp from get_quiz_version, unless the quiz already has one.
+
+    Call it only after the quiz was read. If another request or an edit
+    stored a stamp first, content cached under this one is never served.
+    """
+    # add() keeps the first stamp if another request races us
+    get_quiz_cache().add(_version_key(quiz_id), version, timeout=None)
+
+
+def invalidate_quiz(quiz_id):
+    """
+    Bumps the version stamp so every cached entry for the quiz goes stale.
+    """
+    get_quiz_cache().set(_version_key(quiz_id), time.time_ns(), timeout=None)
+    logger.info(f"Invalidated cached content for quiz {quiz_id}")
+
+
+def get_cached_quiz_page(quiz_id, version):
+    """
+    Returns the rendered quiz page for the given version, or None.
+    """
+    return get_quiz_cache().get(_page_key(quiz_id, version))
+
+
+def set_cached_quiz_page(quiz_id, version, content):
+    """
+    Stores the rendered quiz page under the given version.
+    """
+    save_quiz_version(quiz_id, version)
+    timeout = getattr(settings, 'QUIZ_CACHE_TIMEOUT', 60 * 60 * 24)
+    get_quiz_cache().set(_page_key(quiz_id, version), content, timeout=timeout)
+
+
+def get_cached_quiz_payload(quiz_id, version, variant):
+    """
+    Returns a serialized quiz payload for the given version and variant, or None.
+    """
+    return get_quiz_cache().get(_payload_key(quiz_id, version, variant))
+
+
+def set_cached_quiz_payload(quiz_id, version, variant, content):
+    """
+    Stores a serialized quiz payload under the given version and variant.
+    """
+    save_quiz_version(quiz_id, version)
+    timeout = getattr(settings, 'QUIZ_CACHE_TIMEOUT', 60 * 60 * 24)
+    get_quiz_cache().set(_payload_key(quiz_id, version, variant), content, timeout=timeout)
@@ -0,0 +1,42 @@
+"""
+Per-connection database tuning for the 'tuned' profile (settings.QUIZ_DB_PROFILE).
+
+Every new SQLite connection gets QUIZ_SQLITE_PRAGMAS: WAL lets readers run
+alongside the one writer, busy_timeout makes a blocked writer wait for the
+lock instead of failing with "database is locked", synchronous=NORMAL is
+durable under WAL while syncing only at checkpoints, and mmap serves reads
+straight from the page cache. Connection reuse, SQLite's IMMEDIATE
+transactions and the PostgreSQL pool are set in DATABASES instead (see
+quiz2/settings.py). The 'plain' profile leaves every backend default.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger('custom_logger')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',  # Persistent: stays set in the database file
+    'busy_timeout': 10000,  # Milliseconds a writer waits for the lock
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,  # Bytes of the file read through mmap
+}
+
+
+def get_db_profile():
+    return getattr(settings, 'QUIZ_DB_PROFILE', 'tuned')
+
+
+def get_sqlite_pragmas():
+    return {**SQLITE_PRAGMAS, **getattr(settings, 'QUIZ_SQLITE_PRAGMAS', {})}
+
+
+def tune_connection(connection):
+    """
+    Applies the tuned profile's settings to a newly opened connection.
+    """
+    if connection.vendor != 'sqlite' or get_db_profile() != 'tuned':
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
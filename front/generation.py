@@ -0,0 +1,243 @@
+import logging
+import math
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .archive import archive_response
+from .bank import assemble_quiz, select_questions
+from .llm import CircuitOpen, LLMError, LLMTimeout, RateLimited, get_llm_client
+from .metrics import LLM_SECONDS, timer
+from .prompt_cache import get_prompt_cache
+from .repair import get_repair_config, reask_prompt, repair_response
+from .utils import create_quiz, generate_quiz_prompt, generate_structured_prompt, parse_quiz_response, quiz_json_schema
+
+logger = logging.getLogger('custom_logger')
+
+GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'top_p': 1,
+    'top_k': 1,
+}
+
+
+class QuizGenerationError(Exception):
+    """
+    Raised when a quiz cannot be generated from a description.
+
+    Carries the user-facing message, the HTTP status the view should use and,
+    when the provider is overloaded, how many seconds to wait before retrying.
+    """
+
+    def __init__(self, message, status=500, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+def get_client():
+    """
+    Returns the LLM client, or raises QuizGenerationError if its backend cannot be set up.
+    """
+    try:
+        return get_llm_client()
+    except Exception as e:
+        logger.error(f"Error configuring the LLM backend: {e}")
+        raise QuizGenerationError('The LLM backend is not configured correctly.')
+
+
+def use_structured_output(client):
+    """
+    Returns whether quizzes are requested through the provider's JSON mode.
+
+    On unless settings.QUIZ_STRUCTURED_OUTPUT is off; backends without a
+    JSON mode get the free-text prompt instead.
+    """
+    return getattr(settings, 'QUIZ_STRUCTURED_OUTPUT', True) and client.supports_response_schema
+
+
+def generation_error(error):
+    """
+    Maps an LLMError to the QuizGenerationError the views report.
+    """
+    if isinstance(error, LLMTimeout):
+        return QuizGenerationError('Quiz generation timed out. Please try again.', status=504)
+    if isinstance(error, CircuitOpen):
+        return QuizGenerationError(
+            'The quiz generator is temporarily unavailable. Please try again shortly.',
+            status=503, retry_after=math.ceil(error.retry_after),
+        )
+    if isinstance(error, RateLimited):
+        return QuizGenerationError('Too many quiz requests right now. Please try again shortly.', status=429, retry_after=1)
+    if isinstance(error.__cause__, ConnectionError):
+        return QuizGenerationError('Failed to connect to the LLM provider. Please try again later.')
+    return QuizGenerationError(f'An unexpected error occurred: {str(error)}')
+
+
+async def request_completion(prompt, timeout=None, kind='generate', response_schema=None):
+    """
+    Sends a prompt through the LLM client and returns the response text.
+
+    The raw response is archived under a fresh request id.
+
+    Args:
+        prompt (str): The full prompt
+        timeout (float): Seconds for the call including retries, defaults to
+            settings.QUIZ_GENERATION_TIMEOUT
+        kind (str): Archive record type
+        response_schema (dict): JSON schema for the provider's JSON mode
+
+    Raises:
+        QuizGenerationError: If the backend is unavailable, times out or
+            returns nothing
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'QUIZ_GENERATION_TIMEOUT', 60)
+    client = get_client()
+
+    request_id = uuid.uuid4().hex
+    logger.info(f"Sending query {request_id} to {client.backend.name}: {prompt}")
+    try:
+        with timer(LLM_SECONDS, backend=client.backend.name, kind=kind):
+            response_text = await client.generate(prompt, timeout, GENERATION_CONFIG, response_schema)
+    except LLMError as e:
+        logger.error(f"LLM call {request_id} failed: {e}")
+        raise generation_error(e)
+
+    archive_response(request_id, kind, response_text)
+    if not response_text:
+        logger.error("Error: Received empty response from the LLM")
+        raise QuizGenerationError('Received empty response from the LLM')
+    return response_text
+
+
+async def parse_and_repair(response_text, description, deadline=None, structured=False):
+    """
+    Validates a model response, repairing it when strict validation fails.
+
+    Local repairs come first (see front/repair.py). Questions still invalid
+    after that are sent back to the model in one small re-ask; any the
+    re-ask cannot fix are dropped. The re-ask only gets the time left before
+    `deadline` (a time.monotonic() value, by default a full
+    settings.QUIZ_GENERATION_TIMEOUT from now), so repairing never stretches
+    a generation past its timeout. A `structured` response (from the
+    provider's JSON mode) is validated without looking for code fences.
+
+    Returns:
+        list[QuizQuestion]: The valid questions
+
+    Raises:
+        QuizGenerationError: If no valid question can be recovered
+    """
+    questions, error_message = await sync_to_async(parse_quiz_response)(response_text, structured)
+    if questions is not None:
+        return questions
+    config = get_repair_config()
+    if not config['ENABLED']:
+        raise QuizGenerationError(f'Invalid response format: {error_message}')
+
+    try:
+        report = await sync_to_async(repair_response)(response_text)
+    except ValueError as e:
+        logger.error(f"Response could not be repaired: {e}")
+        raise QuizGenerationError(f'Invalid response format: {error_message}')
+    questions = report.questions
+    fixed_by_reask = 0
+    if deadline is None:
+        deadline = time.monotonic() + getattr(settings, 'QUIZ_GENERATION_TIMEOUT', 60)
+    remaining = deadline - time.monotonic()
+    if report.broken and config['REASK'] and remaining <= 0:
+        logger.warning(f"No time left to re-ask for {len(report.broken)} broken questions")
+    elif report.broken and config['REASK'] and len(report.broken) <= config['MAX_REASK_QUESTIONS']:
+        try:
+            reask_text = await request_completion(reask_prompt(description, report.broken), remaining, 'repair')
+            fixed = await sync_to_async(repair_response)(reask_text)
+            questions = questions + fixed.questions
+            fixed_by_reask = len(fixed.questions)
+        except (QuizGenerationError, ValueError) as e:
+            logger.error(f"Re-ask for {len(report.broken)} broken questions failed: {e}")
+    if not questions:
+        raise QuizGenerationError(f'Invalid response format: {error_message}')
+
+    dropped = len(report.broken) - fixed_by_reask
+    logger.info(f"Repaired response: {report.repaired} questions fixed locally, {fixed_by_reask} by re-ask, {dropped} dropped")
+    return questions
+
+
+async def generate_quiz(description, timeout=None, num_questions=None):
+    """
+    Generates, validates and stores a quiz without blocking the event loop.
+
+    Stored questions on the requested topic are reused first (see
+    front/bank.py); the model is only asked for the questions the bank
+    cannot supply. Where the backend has a JSON mode, the questions are
+    requested with QuizSchema as the response schema and a short prompt.
+    The model call is awaited through the async client API; validation and
+    database writes run in a worker thread via sync_to_async.
+
+    Args:
+        description (str): What the quiz should be about
+        timeout (float): Seconds to wait for the model, re-asks included,
+            defaults to settings.QUIZ_GENERATION_TIMEOUT
+        num_questions (int): Quiz size, defaults to the count in the
+            description or the question bank's DEFAULT_SIZE
+
+    Returns:
+        tuple: (quiz_id: int, message: str)
+
+    Raises:
+        QuizGenerationError: If any step of the pipeline fails
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'QUIZ_GENERATION_TIMEOUT', 60)
+    deadline = time.monotonic() + timeout
+    prompt_cache = get_prompt_cache()
+    if prompt_cache is not None:
+        cached_quiz_id = await sync_to_async(prompt_cache.lookup)(description, num_questions)
+        if cached_quiz_id is not None:
+            return cached_quiz_id, "Quiz served from cache"
+
+    selection = await sync_to_async(select_questions)(description, num_questions)
+    if selection is not None and selection.question_ids and not selection.shortfall:
+        quiz_id = await sync_to_async(assemble_quiz)(selection)
+        logger.info(f"Assembled quiz {quiz_id} from the question bank")
+        if prompt_cache is not None:
+            await sync_to_async(prompt_cache.store)(description, quiz_id, num_questions)
+        return quiz_id, "Quiz assembled from the question bank"
+
+    size = selection.generation_size if selection else num_questions
+    structured = use_structured_output(get_client())
+    # The cache lookup and bank selection already used part of the timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise generation_error(LLMTimeout("No time left to call the model"))
+    if structured:
+        # The schema travels as the provider's response schema, not in the prompt
+        response_text = await request_completion(
+            generate_structured_prompt(description, size), remaining, 'generate', quiz_json_schema(),
+        )
+    else:
+        response_text = await request_completion(generate_quiz_prompt(description, size), remaining, 'generate')
+
+    questions = await parse_and_repair(response_text, description, deadline, structured)
+
+    if selection is not None and selection.question_ids:
+        try:
+            quiz_id = await sync_to_async(assemble_quiz)(selection, questions)
+        except Exception as e:
+            logger.error(f"Failed to assemble quiz: {e}")
+            raise QuizGenerationError(f'Failed to create quiz: {e}')
+        message = f"Quiz created with {len(selection.question_ids)} questions from the question bank"
+    else:
+        success, message, quiz_id = await sync_to_async(create_quiz)(questions)
+        if not success:
+            logger.error(f"Failed to create quiz: {message}")
+            raise QuizGenerationError(f'Failed to create quiz: {message}')
+
+    logger.info(f"Created quiz with ID: {quiz_id}")
+    if prompt_cache is not None:
+        await sync_to_async(prompt_cache.store)(description, quiz_id, num_questions)
+    return quiz_id, message
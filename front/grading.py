@@ -0,0 +1,142 @@
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+
+from .analytics import record_responses
+from .cache import get_quiz_cache, get_quiz_version, save_quiz_version
+from .models import AnswerOption, Attempt, Response
+
+logger = logging.getLogger('custom_logger')
+
+
+def _answer_key_key(quiz_id, version):
+    return f"quiz:{quiz_id}:answers:{version}"
+
+
+def get_answer_key(quiz_id):
+    """
+    Returns the answer key for a quiz: {question_id: (correct_option_id, option_ids)}.
+
+    The key is built with a single query and cached under the quiz version
+    stamp, so edits invalidate it together with the rendered page. Returns
+    an empty dict for a quiz with no questions or that does not exist.
+    """
+    cache = get_quiz_cache()
+    version = get_quiz_version(quiz_id)
+    answer_key = cache.get(_answer_key_key(quiz_id, version))
+    if answer_key is None:
+        answer_key = {}
+        rows = AnswerOption.objects.filter(question__quiz_id=quiz_id).values_list(
+            'question_id', 'option_id', 'is_correct'
+        )
+        for question_id, option_id, is_correct in rows:
+            correct_option_id, option_ids = answer_key.get(question_id, (None, frozenset()))
+            answer_key[question_id] = (
+                option_id if is_correct else correct_option_id,
+                option_ids | {option_id},
+            )
+        # Keys of unknown quizzes are not cached, or probing ids would fill the cache
+        if answer_key:
+            save_quiz_version(quiz_id, version)
+            cache.set(_answer_key_key(quiz_id, version), answer_key, timeout=getattr(settings, 'QUIZ_CACHE_TIMEOUT', None))
+    return answer_key
+
+
+@dataclass
+class GradedAttempt:
+    attempt: Attempt
+    responses: list = field(default_factory=list)
+
+    def results(self):
+        return [
+            {
+                'question_id': response.question_id,
+                'selected_option_id': response.selected_option_id,
+                'correct_option_id': response.correct_option_id,
+                'is_correct': response.is_correct,
+            }
+            for response in self.responses
+        ]
+
+
+def grade_submission(quiz_id, answers, seconds=None):
+    """
+    Grades a full submission against the cached answer key.
+
+    Args:
+        quiz_id (int): Quiz being answered
+        answers (dict): {question_id: option_id}; missing questions count as wrong
+        seconds (dict): Optional {question_id: seconds spent answering}
+
+    Returns:
+        GradedAttempt | None: Unsaved attempt and responses, or None if the
+            quiz has no answer key (unknown quiz)
+
+    Raises:
+        ValueError: If an answer names a question or option outside the quiz,
+            or a time is negative
+    """
+    answer_key = get_answer_key(quiz_id)
+    if not answer_key:
+        return None
+
+    selected = {}
+    for question_id, option_id in answers.items():
+        question_id = int(question_id)
+        if question_id not in answer_key:
+            raise ValueError(f"Question {question_id} is not part of quiz {quiz_id}")
+        if option_id is not None:
+            option_id = int(option_id)
+            if option_id not in answer_key[question_id][1]:
+                raise ValueError(f"Option {option_id} does not belong to question {question_id}")
+        selected[question_id] = option_id
+
+    timings = {}
+    for question_id, value in (seconds or {}).items():
+        question_id = int(question_id)
+        if question_id not in answer_key:
+            raise ValueError(f"Question {question_id} is not part of quiz {quiz_id}")
+        value = float(value)
+        if not value >= 0:
+            raise ValueError(f"Time for question {question_id} must be a non-negative number")
+        timings[question_id] = value
+
+    attempt = Attempt(quiz_id=quiz_id, total=len(answer_key))
+    graded = GradedAttempt(attempt=attempt)
+    for question_id, (correct_option_id, _) in answer_key.items():
+        option_id = selected.get(question_id)
+        response = Response(
+            attempt=attempt,
+            question_id=question_id,
+            selected_option_id=option_id,
+            is_correct=option_id is not None and option_id == correct_option_id,
+            seconds_to_answer=timings.get(question_id),
+        )
+        response.correct_option_id = correct_option_id
+        graded.responses.append(response)
+    attempt.score = sum(response.is_correct for response in graded.responses)
+    return graded
+
+
+def record_attempts(graded_attempts):
+    """
+    Stores graded attempts and their responses in one transaction.
+
+    Two INSERTs regardless of how many attempts are written, plus the
+    aggregate stats updates for the batch.
+    """
+    responses = [response for graded in graded_attempts for response in graded.responses]
+    with transaction.atomic():
+        Attempt.objects.bulk_create([graded.attempt for graded in graded_attempts])
+        Response.objects.bulk_create(responses)
+        record_responses(responses)
+    logger.info(f"Recorded {len(graded_attempts)} attempts")
+
+
+def record_attempt(graded):
+    """
+    Stores one graded attempt and its responses in one transaction.
+    """
+    record_attempts([graded])
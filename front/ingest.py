@@ -0,0 +1,234 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections
+
+from .grading import record_attempt, record_attempts
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 0.2,  # Seconds the oldest buffered attempt may wait to be written
+    'MAX_BATCH_ROWS': 2000,  # Write once this many rows (attempts + responses) are buffered
+    'QUEUE_SIZE': 10000,  # Attempts waiting to be written before submissions are refused
+    'WRITE_RETRIES': 3,  # Retries of a batch when the database is locked
+}
+
+_STOP = object()
+
+
+class AttemptBuffer:
+    """
+    Write-behind buffer for graded quiz attempts.
+
+    Request threads only enqueue attempts; a single daemon thread coalesces
+    them and writes each batch in one transaction, either every
+    `flush_interval` seconds or once `max_batch_rows` rows are waiting. With
+    one writer, a burst of submissions becomes a few large transactions
+    instead of many small ones competing for SQLite's write lock. When the
+    queue is full, submissions are refused so callers can shed load. If a
+    batch fails for any reason but a locked database, its attempts are
+    written one at a time so one bad attempt cannot lose the others.
+    """
+
+    def __init__(self, flush_interval, max_batch_rows, queue_size, write_retries=3, writer=record_attempts):
+        self.flush_interval = flush_interval
+        self.max_batch_rows = max_batch_rows
+        self.write_retries = write_retries
+        self.writer = writer
+        self.submitted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='attempt-buffer', daemon=True)
+        self._thread.start()
+
+    def submit(self, graded):
+        """
+        Queues a graded attempt for writing without waiting.
+
+        Returns:
+            bool: False if the queue was full and the attempt was refused
+        """
+        try:
+            self._queue.put_nowait(graded)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def flush(self, timeout=5):
+        """
+        Writes every attempt queued so far, returning once they are stored.
+
+        Returns:
+            bool: False if the writer did not catch up within `timeout`
+        """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """
+        Writes out queued attempts and stops the writer thread.
+        """
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Attempt buffer did not drain before shutdown, {self._queue.qsize()} attempts lost")
+            return
+        self._thread.join(timeout)
+        logger.info(f"Attempt buffer closed after writing {self.written} attempts in {self.flushes} flushes")
+
+    def stats(self):
+        """
+        Returns counters for monitoring queue depth and flush latency.
+        """
+        return {
+            'depth': self._queue.qsize(),
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'written': self.written,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'mean_flush_seconds': self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+        }
+
+    def _run(self):
+        batch = []
+        rows = 0
+        deadline = None
+        while True:
+            timeout = None if not batch else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # The oldest buffered attempt is due
+
+            if item is not None and item is not _STOP and not isinstance(item, threading.Event):
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                rows += len(item.responses) + 1
+                if rows < self.max_batch_rows:
+                    continue
+
+            if batch:
+                self._write(batch)
+                batch = []
+                rows = 0
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                break
+        close_old_connections()
+
+    def _write(self, batch):
+        close_old_connections()
+        start = time.perf_counter()
+        written = len(batch)
+        for attempt in range(self.write_retries + 1):
+            try:
+                self.writer(batch)
+                break
+            except OperationalError as e:
+                # SQLite reports lock timeouts as OperationalError; back off and retry
+                if attempt == self.write_retries:
+                    self._fail(batch, e)
+                    return
+                time.sleep(0.05 * 2 ** attempt)
+            except Exception as e:
+                # The batch was rolled back; isolate the attempts that cannot be stored
+                logger.error(f"Error writing {len(batch)} buffered attempts, writing them one at a time: {e}")
+                written = self._write_each(batch)
+                break
+        elapsed = time.perf_counter() - start
+        self.written += written
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def _write_each(self, batch):
+        written = 0
+        for graded in batch:
+            try:
+                self.writer([graded])
+                written += 1
+            except Exception as e:
+                self._fail([graded], e)
+        return written
+
+    def _fail(self, batch, error):
+        self.failed += len(batch)
+        logger.error(f"Error writing {len(batch)} buffered attempts: {error}")
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_attempt_buffer():
+    """
+    Returns the process-wide attempt buffer, or None when buffering is disabled.
+    """
+    global _buffer
+    config = {**DEFAULTS, **getattr(settings, 'QUIZ_ATTEMPT_BUFFER', {})}
+    if not config['ENABLED']:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AttemptBuffer(
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    max_batch_rows=config['MAX_BATCH_ROWS'],
+                    queue_size=config['QUEUE_SIZE'],
+                    write_retries=config['WRITE_RETRIES'],
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def reset_attempt_buffer():
+    """
+    Writes out and discards the process-wide buffer so settings are re-read.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.close)
+            _buffer.close()
+            _buffer = None
+
+
+def ingest_attempt(graded):
+    """
+    Stores a graded attempt, through the buffer when it is enabled.
+
+    Returns:
+        bool: False if the buffer is full and the attempt was not accepted
+    """
+    buffer = get_attempt_buffer()
+    if buffer is None:
+        record_attempt(graded)
+        return True
+    if not buffer.submit(graded):
+        logger.error(f"Attempt buffer full, refused attempt on quiz {graded.attempt.quiz_id}")
+        return False
+    return True
@@ -0,0 +1,132 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .generation import QuizGenerationError, generate_quiz
+from .models import GenerationJob
+
+logger = logging.getLogger('custom_logger')
+
+STALE_JOB_ERROR = 'Quiz generation was interrupted. Please try again.'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide worker pool, creating it on first use.
+
+    The pool size (settings.QUIZ_JOB_WORKERS) caps how many generations talk
+    to the LLM at once. Jobs left pending by a previous process are
+    re-submitted when the pool starts; jobs it left running are failed
+    once they are stale (see fail_stale_jobs).
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'QUIZ_JOB_WORKERS', 4)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='quiz-job')
+                fail_stale_jobs()
+                pending = list(GenerationJob.objects.filter(status=GenerationJob.PENDING).values_list('pk', flat=True))
+                for job_id in pending:
+                    _executor.submit(_run_job_in_worker, job_id)
+                if pending:
+                    logger.info(f"Resumed {len(pending)} pending generation jobs")
+    return _executor
+
+
+def enqueue_generation(description):
+    """
+    Queues a quiz generation and returns the job without waiting for it.
+
+    Args:
+        description (str): What the quiz should be about
+
+    Returns:
+        GenerationJob: The newly created job
+    """
+    job = GenerationJob.objects.create(description=description)
+    if getattr(settings, 'QUIZ_JOBS_EAGER', False):
+        run_job(job.pk)
+        job.refresh_from_db()
+    else:
+        # Workers use their own connections, so only hand over committed rows
+        transaction.on_commit(lambda: get_executor().submit(_run_job_in_worker, job.pk))
+    logger.info(f"Queued generation job {job.pk}")
+    return job
+
+
+def run_job(job_id):
+    """
+    Runs the prompt -> validate -> create_quiz pipeline for one job.
+
+    The job is claimed with a conditional update so it runs at most once even
+    if it was submitted twice.
+    """
+    claimed = GenerationJob.objects.filter(pk=job_id, status=GenerationJob.PENDING).update(
+        status=GenerationJob.RUNNING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return
+
+    description = GenerationJob.objects.values_list('description', flat=True).get(pk=job_id)
+    try:
+        quiz_id, _ = async_to_sync(generate_quiz)(description)
+    except QuizGenerationError as e:
+        _finish_job(job_id, status=GenerationJob.FAILED, error=e.message)
+    except Exception as e:
+        logger.error(f"Generation job {job_id} crashed: {e}")
+        _finish_job(job_id, status=GenerationJob.FAILED, error=str(e))
+    else:
+        _finish_job(job_id, status=GenerationJob.SUCCEEDED, quiz_id=quiz_id)
+
+
+def fail_stale_jobs(jobs=None):
+    """
+    Fails jobs that have been running for longer than settings.QUIZ_JOB_STALE_AFTER.
+
+    A job whose worker process died stays RUNNING for good, and whoever
+    polls it would wait forever. Other processes may still be running
+    their own jobs, so only jobs older than any generation can take are
+    presumed lost.
+
+    Args:
+        jobs (QuerySet): Only consider these jobs, defaults to all
+
+    Returns:
+        int: The number of jobs failed
+    """
+    stale_after = timedelta(seconds=getattr(settings, 'QUIZ_JOB_STALE_AFTER', 600))
+    now = timezone.now()
+    failed = (GenerationJob.objects.all() if jobs is None else jobs).filter(
+        status=GenerationJob.RUNNING, updated_at__lt=now - stale_after,
+    ).update(status=GenerationJob.FAILED, error=STALE_JOB_ERROR, updated_at=now)
+    if failed:
+        logger.warning(f"Failed {failed} generation jobs left running by a lost worker")
+    return failed
+
+
+def _run_job_in_worker(job_id):
+    # Pool threads keep their own connections; release them between jobs
+    try:
+        run_job(job_id)
+    except Exception as e:
+        logger.error(f"Generation job {job_id} could not be run: {e}")
+    finally:
+        close_old_connections()
+
+
+def _finish_job(job_id, **fields):
+    job = GenerationJob.objects.get(pk=job_id)
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, 'updated_at'])
+    logger.info(f"Generation job {job_id} finished with status {job.status}")
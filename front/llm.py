@@ -0,0 +1,653 @@
+"""
+Client layer between the quiz pipeline and the LLM provider.
+
+One LLMClient per process wraps a provider backend and owns:
+
+- the backend's SDK client, so HTTP/gRPC connections are pooled and reused
+  (async SDK clients are bound to an event loop, so backends keep one per loop)
+- a token-bucket rate limiter shared by every thread
+- a cap on calls in flight, so a slow upstream cannot tie up every worker
+- jittered exponential retries on transient errors (429, 5xx, timeouts)
+- a circuit breaker that fails fast while the provider keeps failing
+
+Backends are chosen with settings.QUIZ_LLM['BACKEND']: 'gemini', 'anthropic',
+'litellm', or 'fake' for tests and benchmarks. Backends whose
+supports_response_schema is true also accept a JSON schema and return
+JSON text matching it, using the provider's native structured output.
+Nothing provider-specific is imported until the first call: the client, its
+backend class and the backend's SDK are all loaded by get_llm_client().
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import LLM_RETRIES, record_llm_tokens
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'BACKEND': 'gemini',
+    'BACKENDS': {},  # Extra name -> dotted path of a backend class
+    'MODEL': None,  # Defaults to the backend's DEFAULT_MODEL
+    'MAX_RETRIES': 3,
+    'BACKOFF': 0.5,  # Seconds before the first retry, doubled after each
+    'MAX_BACKOFF': 8.0,
+    'RATE': 10.0,  # Calls per second across the process; None for no limit
+    'BURST': 20,
+    'MAX_CONCURRENCY': 32,  # Calls in flight across the process
+    'FAILURE_THRESHOLD': 5,  # Consecutive failures that open the circuit
+    'RESET_TIMEOUT': 30.0,  # Seconds the circuit stays open before a trial call
+}
+
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when the LLM call fails for good.
+    """
+
+
+class LLMTimeout(LLMError):
+    """
+    The call did not finish before its deadline.
+    """
+
+
+class RateLimited(LLMError):
+    """
+    No call slot or rate-limit token was free before the deadline, or the
+    provider kept answering 429.
+    """
+
+
+class CircuitOpen(LLMError):
+    """
+    The provider has been failing and calls are refused until the reset timeout.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def status_code(error):
+    """
+    Returns the HTTP status carried by a provider SDK exception, if any.
+    """
+    for attribute in ('status_code', 'code', 'status'):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient(error):
+    """
+    Returns whether a failed call is worth retrying.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return status_code(error) in TRANSIENT_STATUSES
+
+
+def inline_schema(schema, keywords=None):
+    """
+    Returns a copy of a JSON schema with every $ref replaced by its definition.
+
+    Titles, which pydantic derives from the property names, are dropped to
+    save input tokens. Some providers accept neither references nor every
+    keyword: if given, `keywords` maps each keyword to keep to the
+    provider's name for it, and all others (pattern, ...) are dropped too.
+    """
+    definitions = schema.get('$defs', {})
+
+    def resolve(node):
+        if '$ref' in node:
+            node = definitions[node['$ref'].rsplit('/', 1)[-1]]
+        resolved = {}
+        for keyword, value in node.items():
+            if keyword in ('$defs', 'title') or (keywords is not None and keyword not in keywords):
+                continue
+            if keyword == 'properties':
+                value = {name: resolve(child) for name, child in value.items()}
+            elif keyword == 'items':
+                value = resolve(value)
+            resolved[keyword if keywords is None else keywords[keyword]] = value
+        return resolved
+
+    return resolve(schema)
+
+
+# Tool inputs and OpenAI-style response formats must be objects, so other schemas are wrapped
+WRAPPED_KEY = 'result'
+
+
+def object_schema(schema):
+    """
+    Returns `schema` inlined, wrapped in an object under WRAPPED_KEY unless it is one.
+    """
+    schema = inline_schema(schema)
+    if schema.get('type') == 'object':
+        return schema
+    return {'type': 'object', 'properties': {WRAPPED_KEY: schema}, 'required': [WRAPPED_KEY]}
+
+
+def unwrap(schema, value):
+    """
+    Returns the JSON text of a value produced for object_schema(schema).
+
+    `value` is the parsed value or its JSON text. A malformed answer (text
+    that does not parse, or a value missing the wrapper) is passed on as it
+    is, so that validation and repair see it instead of the call failing.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            logger.warning("Structured answer is not valid JSON; returning it as text")
+            return value
+    if schema.get('type') != 'object':
+        if not isinstance(value, dict) or WRAPPED_KEY not in value:
+            logger.warning(f"Structured answer has no '{WRAPPED_KEY}' wrapper; returning it as is")
+            return json.dumps(value, ensure_ascii=False)
+        value = value[WRAPPED_KEY]
+    return json.dumps(value, ensure_ascii=False)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by every thread and event loop in the process.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until the next one
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self, deadline):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited("Rate limit reached")
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and refuses calls
+    for `reset_timeout` seconds, then lets a single trial call through
+    (half-open). The trial's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        Raises CircuitOpen unless a call may go ahead.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining <= 0:
+                # One trial call; another only if it never reports back
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return
+            raise CircuitOpen("LLM provider is failing; not calling it for now", retry_after=max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _CallSlots:
+    """
+    Caps calls in flight across threads; async callers poll instead of blocking the loop.
+    """
+
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, limit):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    async def acquire(self, deadline):
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise RateLimited("Too many LLM calls in flight")
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def release(self):
+        self._semaphore.release()
+
+
+class LLMClient:
+    """
+    Resilient calls to one backend; see the module docstring.
+    """
+
+    def __init__(self, backend, rate_limiter=None, breaker=None, max_retries=3, backoff=0.5, max_backoff=8.0, max_concurrency=32):
+        self.backend = backend
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._slots = _CallSlots(max_concurrency)
+        self.retries = 0
+
+    def _delay(self, attempt):
+        # Full jitter: uniform over [0, capped exponential backoff]
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _with_retries(self, call, deadline):
+        """
+        Runs `call()` (a fresh awaitable per attempt) under the rate limit and retry policy.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout("LLM call timed out")
+            try:
+                result = await asyncio.wait_for(call(), timeout=remaining)
+            except asyncio.TimeoutError:
+                self.breaker.record_failure()
+                raise LLMTimeout(f"No response from {self.backend.name} before the deadline")
+            except Exception as e:
+                if not is_transient(e):
+                    # The provider answered, so it is up; the request itself was bad
+                    self.breaker.record_success()
+                    raise LLMError(str(e)) from e
+                delay = self._delay(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    error_class = RateLimited if status_code(e) == 429 else LLMError
+                    raise error_class(f"{self.backend.name} failed after {attempt + 1} attempts: {e}") from e
+                logger.warning(f"Transient error from {self.backend.name} ({e}); retrying in {delay:.2f}s")
+                self.retries += 1
+                LLM_RETRIES.inc(backend=self.backend.name)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    @property
+    def supports_response_schema(self):
+        return getattr(self.backend, 'supports_response_schema', False)
+
+    async def generate(self, prompt, timeout, generation_config=None, response_schema=None):
+        """
+        Returns the model's complete answer to `prompt`.
+
+        Args:
+            prompt (str): The full prompt
+            timeout (float): Seconds for the whole call, retries and waits included
+            generation_config (dict): Sampling options (temperature, top_p, top_k)
+            response_schema (dict): JSON schema the answer must match, for
+                backends with supports_response_schema
+
+        Raises:
+            LLMError: LLMTimeout, RateLimited, CircuitOpen or a permanent failure
+        """
+        deadline = time.monotonic() + timeout
+        config = generation_config or {}
+        # Backends without a JSON mode keep the two-argument generate()
+        extra = {}
+        if response_schema is not None:
+            if not self.supports_response_schema:
+                raise LLMError(f"{self.backend.name} does not support response schemas")
+            extra['response_schema'] = response_schema
+        self.breaker.check()
+        await self._slots.acquire(deadline)
+        try:
+            return await self._with_retries(lambda: self.backend.generate(prompt, config, **extra), deadline)
+        finally:
+            self._slots.release()
+
+    async def stream(self, prompt, timeout, generation_config=None):
+        """
+        Yields the model's answer as text chunks.
+
+        The opening call is retried like generate(); once text has arrived,
+        errors propagate. Each wait, for the first chunk or the next one, is
+        bounded by `timeout`.
+        """
+        self.breaker.check()
+        await self._slots.acquire(time.monotonic() + timeout)
+        try:
+            chunks = None
+
+            async def first_chunk():
+                nonlocal chunks
+                chunks = self.backend.stream(prompt, generation_config or {}).__aiter__()
+                return await chunks.__anext__()
+
+            try:
+                chunk = await self._with_retries(first_chunk, time.monotonic() + timeout)
+            except LLMError as e:
+                if isinstance(e.__cause__, StopAsyncIteration):
+                    return
+                raise
+            yield chunk
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self.breaker.record_failure()
+                    raise LLMTimeout(f"{self.backend.name} stream stalled for more than {timeout} seconds")
+                yield chunk
+        finally:
+            self._slots.release()
+
+
+class GeminiBackend:
+    name = 'gemini'
+    DEFAULT_MODEL = 'gemini-2.5-flash-preview-05-20'
+    supports_response_schema = True
+    # The OpenAPI subset the Gemini SDK accepts in a response schema, by its field names
+    SCHEMA_KEYWORDS = {
+        'type': 'type', 'format': 'format', 'description': 'description', 'nullable': 'nullable', 'enum': 'enum',
+        'items': 'items', 'minItems': 'min_items', 'maxItems': 'max_items', 'properties': 'properties', 'required': 'required',
+    }
+
+    def __init__(self, model_name=None):
+        import google.generativeai as genai
+        from google.generativeai import client as genai_client
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            logger.error("Warning: GEMINI_API_KEY environment variable not set.")
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._genai_client = genai_client
+        self.model_name = model_name or self.DEFAULT_MODEL
+        self._models = weakref.WeakKeyDictionary()
+
+    def _model(self):
+        # The SDK keeps one gRPC aio client per process, bound to the loop that
+        # first used it; give each event loop its own model and client instead
+        loop = asyncio.get_running_loop()
+        model = self._models.get(loop)
+        if model is None:
+            model = self._genai.GenerativeModel(self.model_name)
+            model._async_client = self._genai_client._client_manager.make_client('generative_async')
+            self._models[loop] = model
+        return model
+
+    async def generate(self, prompt, config, response_schema=None):
+        if response_schema is not None:
+            config = dict(
+                config, response_mime_type='application/json',
+                response_schema=inline_schema(response_schema, self.SCHEMA_KEYWORDS),
+            )
+        response = await self._model().generate_content_async(prompt, generation_config=config)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            record_llm_tokens(self.name, usage.prompt_token_count, usage.candidates_token_count)
+        return response.text if response.parts else ''
+
+    async def stream(self, prompt, config):
+        response = await self._model().generate_content_async(prompt, generation_config=config, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+class AnthropicBackend:
+    name = 'anthropic'
+    DEFAULT_MODEL = 'claude-3-5-haiku-latest'
+    MAX_TOKENS = 8192
+    supports_response_schema = True
+    # Structured answers are requested as the input of a tool the model must call
+    TOOL_NAME = 'submit_answer'
+
+    def __init__(self, model_name=None):
+        import anthropic
+
+        self._anthropic = anthropic
+        self.model_name = model_name or self.DEFAULT_MODEL
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        # One pooled client per event loop; retries are LLMClient's job
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._anthropic.AsyncAnthropic(max_retries=0)
+        return client
+
+    def _arguments(self, prompt, config):
+        arguments = dict(model=self.model_name, max_tokens=self.MAX_TOKENS, messages=[{'role': 'user', 'content': prompt}])
+        if 'temperature' in config:
+            arguments['temperature'] = config['temperature']
+        return arguments
+
+    async def generate(self, prompt, config, response_schema=None):
+        arguments = self._arguments(prompt, config)
+        if response_schema is not None:
+            arguments['tools'] = [{
+                'name': self.TOOL_NAME, 'description': "Submit the answer.",
+                'input_schema': object_schema(response_schema),
+            }]
+            arguments['tool_choice'] = {'type': 'tool', 'name': self.TOOL_NAME}
+        message = await self._client().messages.create(**arguments)
+        record_llm_tokens(self.name, message.usage.input_tokens, message.usage.output_tokens)
+        if response_schema is not None:
+            return next((unwrap(response_schema, block.input) for block in message.content if block.type == 'tool_use'), '')
+        return ''.join(block.text for block in message.content if block.type == 'text')
+
+    async def stream(self, prompt, config):
+        async with self._client().messages.stream(**self._arguments(prompt, config)) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+
+class LiteLLMBackend:
+    name = 'litellm'
+    DEFAULT_MODEL = 'gemini/gemini-2.5-flash-preview-05-20'
+    supports_response_schema = True
+
+    def __init__(self, model_name=None):
+        import litellm
+
+        self._litellm = litellm
+        self.model_name = model_name or self.DEFAULT_MODEL
+
+    def _arguments(self, prompt, config):
+        arguments = dict(model=self.model_name, messages=[{'role': 'user', 'content': prompt}], num_retries=0)
+        arguments.update({key: config[key] for key in ('temperature', 'top_p') if key in config})
+        return arguments
+
+    async def generate(self, prompt, config, response_schema=None):
+        arguments = self._arguments(prompt, config)
+        if response_schema is not None:
+            arguments['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'answer', 'schema': object_schema(response_schema)},
+            }
+        response = await self._litellm.acompletion(**arguments)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            record_llm_tokens(self.name, usage.prompt_tokens, usage.completion_tokens)
+        text = response.choices[0].message.content or ''
+        if response_schema is not None and text:
+            return unwrap(response_schema, text)
+        return text
+
+    async def stream(self, prompt, config):
+        response = await self._litellm.acompletion(stream=True, **self._arguments(prompt, config))
+        async for chunk in response:
+            text = chunk.choices[0].delta.content
+            if text:
+                yield text
+
+
+class FakeBackend:
+    """
+    Local stand-in for a provider, for tests and benchmarks.
+
+    Answers every prompt with `response_text` (or `responder(prompt)`) after
+    `latency` seconds; streams it in `chunk_size` pieces spread over the
+    same latency. If `errors` is given, its items are raised by successive
+    calls first. Prompts are recorded in `prompts`. With `structured`, it
+    accepts response schemas like a provider with a JSON mode, recording
+    them in `response_schemas`; the answer is returned as given either way.
+    """
+
+    name = 'fake'
+    DEFAULT_MODEL = 'fake'
+
+    def __init__(self, response_text='', latency=0.0, chunk_size=200, responder=None, errors=(), structured=False, model_name=None):
+        self.response_text = response_text
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.responder = responder
+        self.errors = list(errors)
+        self.supports_response_schema = structured
+        self.prompts = []
+        self.response_schemas = []
+
+    def _answer(self, prompt):
+        self.prompts.append(prompt)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.responder(prompt) if self.responder else self.response_text
+
+    async def generate(self, prompt, config, response_schema=None):
+        if response_schema is not None:
+            self.response_schemas.append(response_schema)
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def stream(self, prompt, config):
+        text = self._answer(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+
+# Dotted paths, imported only for the backend a process actually uses
+BACKENDS = {
+    'gemini': 'front.llm.GeminiBackend',
+    'anthropic': 'front.llm.AnthropicBackend',
+    'litellm': 'front.llm.LiteLLMBackend',
+    'fake': 'front.llm.FakeBackend',
+}
+
+
+def get_backend_class(name, extra=None):
+    """
+    Resolves a backend name from BACKENDS, or from `extra`, to its class.
+
+    Raises:
+        LLMError: If no backend is registered under `name`
+    """
+    registry = {**BACKENDS, **(extra or {})}
+    if name not in registry:
+        raise LLMError(f"Unknown LLM backend '{name}'. Choose from: {', '.join(sorted(registry))}")
+    backend = registry[name]
+    return import_string(backend) if isinstance(backend, str) else backend
+
+
+def load_api_keys():
+    """
+    Loads provider API keys (GEMINI_API_KEY, ANTHROPIC_API_KEY, ...) from .env.
+
+    Existing environment variables win. Called on first use of a provider
+    rather than at import time.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Returns the process-wide LLM client, creating it from settings.QUIZ_LLM on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                load_api_keys()
+                config = {**DEFAULTS, **getattr(settings, 'QUIZ_LLM', {})}
+                backend_class = get_backend_class(config['BACKEND'], config['BACKENDS'])
+                _client = LLMClient(
+                    backend=backend_class(model_name=config['MODEL']),
+                    rate_limiter=TokenBucket(config['RATE'], config['BURST']) if config['RATE'] else None,
+                    breaker=CircuitBreaker(config['FAILURE_THRESHOLD'], config['RESET_TIMEOUT']),
+                    max_retries=config['MAX_RETRIES'],
+                    backoff=config['BACKOFF'],
+                    max_backoff=config['MAX_BACKOFF'],
+                    max_concurrency=config['MAX_CONCURRENCY'],
+                )
+    return _client
+
+
+def reset_llm_client():
+    """
+    Discards the process-wide client so it is rebuilt from settings.
+    """
+    global _client
+    with _client_lock:
+        _client = None
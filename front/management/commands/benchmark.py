@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from front.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Runs a named performance benchmark against a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help="Benchmark to run; omit to list them")
+        parser.add_argument('--concurrency', type=int, help="Number of concurrent requests")
+        parser.add_argument('--latency', type=float, help="Fake model latency in seconds")
+        parser.add_argument('--workers', type=int, help="Size of the simulated worker pool")
+        parser.add_argument('--size', type=int, help="Number of questions (or rows) per item")
+        parser.add_argument('--iterations', type=int, help="Number of timed iterations")
+
+    def handle(self, *args, **options):
+        name = options['name']
+        if not name:
+            for bench_name, func in sorted(BENCHMARKS.items()):
+                summary = (func.__doc__ or '').strip().split('\n')[0]
+                self.stdout.write(f"{bench_name}: {summary}")
+            return
+        if name not in BENCHMARKS:
+            raise CommandError(f"Unknown benchmark '{name}'. Choose from: {', '.join(sorted(BENCHMARKS))}")
+
+        params = {
+            key: options[key]
+            for key in ('concurrency', 'latency', 'workers', 'size', 'iterations')
+            if options[key] is not None
+        }
+        BENCHMARKS[name](self.stdout.write, **params)
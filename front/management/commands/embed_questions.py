@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from front.vectors import get_question_vectors
+
+
+class Command(BaseCommand):
+    help = "Embeds questions that have no embedding yet (such as bulk imports) in batches"
+
+    def handle(self, *args, **options):
+        question_vectors = get_question_vectors()
+        if question_vectors is None:
+            raise CommandError("The vector index is disabled (QUIZ_VECTOR_INDEX['ENABLED'] or ['EMBEDDER'])")
+        start = time.perf_counter()
+        embedded = question_vectors.embed_missing()
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {embedded} questions in {time.perf_counter() - start:.1f}s"
+        ))
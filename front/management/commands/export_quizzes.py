@@ -0,0 +1,49 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from front.bulk import serialize_quiz
+from front.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Streams every quiz to a JSON or JSON Lines file in the create_quiz format"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write")
+        parser.add_argument('--format', choices=['json', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Quizzes fetched per query")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith('.jsonl') else 'json')
+
+        # iterator() with prefetching loads questions and options one chunk at a time
+        quizzes = Quiz.objects.with_questions().order_by('quiz_id').iterator(chunk_size=options['chunk_size'])
+
+        exported = skipped = 0
+        start = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as fileobj:
+            if fmt == 'json':
+                fileobj.write('[\n')
+            for quiz in quizzes:
+                try:
+                    line = json.dumps(serialize_quiz(quiz), ensure_ascii=False)
+                except ValueError as e:
+                    skipped += 1
+                    self.stderr.write(f"Skipping quiz {quiz.quiz_id}: {e}")
+                    continue
+                if fmt == 'json':
+                    fileobj.write((',\n' if exported else '') + line)
+                else:
+                    fileobj.write(line + '\n')
+                exported += 1
+            if fmt == 'json':
+                fileobj.write('\n]\n')
+
+        elapsed = time.perf_counter() - start
+        rate = exported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {exported} quizzes to {path}, skipped {skipped}, in {elapsed:.1f}s ({rate:.0f} quizzes/s)"
+        ))
@@ -0,0 +1,53 @@
+import sys
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from front.batch import generate_quizzes
+
+
+class Command(BaseCommand):
+    help = "Generates one quiz per description, packing several descriptions into each model call"
+
+    def add_arguments(self, parser):
+        parser.add_argument('descriptions', nargs='*', help="Quiz descriptions")
+        parser.add_argument('--file', help="Read descriptions from this file, one per line ('-' for stdin)")
+        parser.add_argument('--num-questions', type=int, help="Questions per quiz")
+        parser.add_argument('--no-pack', action='store_true', help="Send each description in its own call")
+        parser.add_argument('--concurrency', type=int, help="Model calls in flight at once")
+
+    def handle(self, *args, **options):
+        descriptions = list(options['descriptions'])
+        path = options['file']
+        if path:
+            try:
+                if path == '-':
+                    lines = sys.stdin.read().splitlines()
+                else:
+                    with open(path, encoding='utf-8') as fileobj:
+                        lines = fileobj.read().splitlines()
+            except OSError as e:
+                raise CommandError(f"Could not read {path}: {e}")
+            descriptions.extend(line.strip() for line in lines if line.strip())
+        if not descriptions:
+            raise CommandError("Give descriptions as arguments or with --file")
+
+        start = time.perf_counter()
+        results = async_to_sync(generate_quizzes)(
+            descriptions,
+            num_questions=options['num_questions'],
+            pack=not options['no_pack'],
+            concurrency=options['concurrency'],
+        )
+        elapsed = time.perf_counter() - start
+
+        for result in results:
+            if result.ok:
+                self.stdout.write(f"{result.description}: quiz {result.quiz_id}")
+            else:
+                self.stderr.write(f"{result.description}: {result.error}")
+        succeeded = sum(1 for result in results if result.ok)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {succeeded} of {len(results)} quizzes in {elapsed:.1f}s"
+        ))
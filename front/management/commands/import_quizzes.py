@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import ValidationError
+
+from front.bulk import iter_quiz_file, parse_quiz
+from front.persistence import save_quizzes
+
+
+class Command(BaseCommand):
+    help = "Streams quizzes from a JSON or JSON Lines file into the database in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--format', choices=['json', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=500, help="Quizzes per transaction")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith('.jsonl') else 'json')
+        batch_size = options['batch_size']
+
+        imported = skipped = 0
+        batch = []
+        start = time.perf_counter()
+
+        def flush():
+            nonlocal imported
+            save_quizzes(batch)
+            imported += len(batch)
+            batch.clear()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"Imported {imported} quizzes ({imported / elapsed:.0f} quizzes/s)")
+
+        try:
+            with open(path, 'rb') as fileobj:
+                for index, raw_quiz in iter_quiz_file(fileobj, fmt):
+                    try:
+                        questions = parse_quiz(raw_quiz)
+                    except ValidationError as e:
+                        skipped += 1
+                        self.stderr.write(f"Skipping quiz {index}: {e.error_count()} validation error(s)")
+                        continue
+                    if not questions:
+                        skipped += 1
+                        continue
+                    batch.append(questions)
+                    if len(batch) >= batch_size:
+                        flush()
+                if batch:
+                    flush()
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        elapsed = time.perf_counter() - start
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} quizzes, skipped {skipped}, in {elapsed:.1f}s ({rate:.0f} quizzes/s)"
+        ))
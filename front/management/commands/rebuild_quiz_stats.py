@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from front.analytics import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes per-question stats from recorded responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int, help="Quizzes to rebuild; omit to rebuild all")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuilt = rebuild_stats(options['quiz_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {rebuilt} questions in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from front.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index from the question tables"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index in {time.perf_counter() - start:.1f}s"))
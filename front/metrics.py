@@ -0,0 +1,365 @@
+"""
+In-process performance metrics, exposed in Prometheus text format at /metrics.
+
+MetricsMiddleware times every request and counts its database queries;
+timer() and timed() measure the model call, response validation and quiz
+storage. Observations are aggregated per process into counters and
+histograms, so with several workers each one is scraped separately. With
+QUIZ_METRICS['OPIK'] on, each request also becomes an Opik trace, with
+every timed step inside it as a span.
+"""
+import contextvars
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'OPIK': False,  # Also send traces to Opik (needs the opik package and its API key)
+    'OPIK_PROJECT': 'quiz2',
+}
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REGISTRY = []
+
+
+def get_metrics_config():
+    return {**DEFAULTS, **getattr(settings, 'QUIZ_METRICS', {})}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per label combination.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}"
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label combination, with their sum.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts, sum, count]
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels[name]) for name in self.labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_number(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+def render(registry=REGISTRY):
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+# The method is client-controlled: any other value is labelled 'other' so it cannot add series
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+REQUEST_SECONDS = Histogram(
+    'quiz_http_request_duration_seconds', "Time to produce a response, by view",
+    ('method', 'view', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'quiz_http_request_db_queries', "Database queries per request, by view",
+    ('view',), buckets=COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'quiz_http_request_db_duration_seconds', "Time spent in database queries per request, by view",
+    ('view',),
+)
+LLM_SECONDS = Histogram(
+    'quiz_llm_request_duration_seconds', "Model call latency including retries",
+    ('backend', 'kind', 'outcome'),
+)
+LLM_TOKENS = Counter('quiz_llm_tokens_total', "Tokens used, as reported by the provider", ('backend', 'direction'))
+LLM_RETRIES = Counter('quiz_llm_retries_total', "Model calls retried after a transient error", ('backend',))
+STEP_SECONDS = Histogram('quiz_step_duration_seconds', "Time spent in quiz pipeline steps", ('step',))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+# Set by MetricsMiddleware for the duration of a request. Context variables
+# follow sync_to_async into worker threads, so queries made there count too.
+_request_stats = contextvars.ContextVar('quiz_request_stats', default=None)
+_trace = contextvars.ContextVar('quiz_opik_trace', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the current request's stats.
+    """
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def instrument_connection(connection):
+    """
+    Installs count_queries on a newly opened database connection.
+    """
+    if get_metrics_config()['ENABLED'] and count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+_opik_client = None
+_opik_lock = threading.Lock()
+
+
+def get_opik_client():
+    """
+    Returns the Opik client when forwarding is on, or None.
+
+    Opik is imported on first use; if it cannot be set up, forwarding is
+    disabled for the life of the process.
+    """
+    global _opik_client
+    if not get_metrics_config()['OPIK']:
+        return None
+    if _opik_client is None:
+        with _opik_lock:
+            if _opik_client is None:
+                try:
+                    import opik
+
+                    _opik_client = opik.Opik(project_name=get_metrics_config()['OPIK_PROJECT'])
+                except Exception as e:
+                    logger.error(f"Opik forwarding disabled: {e}")
+                    _opik_client = False
+    return _opik_client or None
+
+
+def _send_span(name, start, end, metadata):
+    client = get_opik_client()
+    if client is None:
+        return
+    started_at = datetime.fromtimestamp(start, timezone.utc)
+    ended_at = datetime.fromtimestamp(end, timezone.utc)
+    try:
+        trace = _trace.get()
+        if trace is not None:
+            trace.span(name=name, start_time=started_at, end_time=ended_at, metadata=metadata)
+        else:
+            client.trace(name=name, start_time=started_at, end_time=ended_at, metadata=metadata)
+    except Exception as e:
+        logger.error(f"Failed to send span {name} to Opik: {e}")
+
+
+@contextmanager
+def timer(histogram, **labels):
+    """
+    Observes the duration of the enclosed block in `histogram`.
+
+    If the histogram has an 'outcome' label it is set to 'ok', or to
+    'error' when the block raises.
+    """
+    start = time.perf_counter()
+    started = time.time()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        if 'outcome' in histogram.labels:
+            labels['outcome'] = outcome
+        histogram.observe(time.perf_counter() - start, **labels)
+        _send_span(labels.get('step') or labels.get('kind') or histogram.name, started, time.time(), labels)
+
+
+def timed(histogram, **labels):
+    """
+    Decorator form of timer() for synchronous functions.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(histogram, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_tokens(backend, prompt_tokens, completion_tokens):
+    """
+    Adds the token counts a provider reported for one call.
+    """
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, backend=backend, direction='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, backend=backend, direction='completion')
+
+
+class MetricsMiddleware:
+    """
+    Times each request and counts its database queries, by view.
+
+    For streamed responses the time is until the response starts, not
+    until the stream ends.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = get_metrics_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        stats, tokens = self._start(request, config)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._reset(tokens)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        config = get_metrics_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        stats, tokens = self._start(request, config)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._reset(tokens)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def _start(self, request, config):
+        stats = RequestStats()
+        tokens = [_request_stats.set(stats)]
+        client = get_opik_client() if config['OPIK'] else None
+        if client is not None:
+            try:
+                trace = client.trace(name=f"{request.method} {request.path}", start_time=datetime.now(timezone.utc))
+                tokens.append(_trace.set(trace))
+            except Exception as e:
+                logger.error(f"Failed to start Opik trace: {e}")
+        return stats, tokens
+
+    def _reset(self, tokens):
+        trace = _trace.get() if len(tokens) > 1 else None
+        if trace is not None:
+            try:
+                trace.end(end_time=datetime.now(timezone.utc))
+            except Exception as e:
+                logger.error(f"Failed to end Opik trace: {e}")
+        for token in reversed(tokens):
+            token.var.reset(token)
+
+    def _record(self, request, response, stats, seconds):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        REQUEST_SECONDS.observe(seconds, method=method, view=view, status=response.status_code)
+        REQUEST_QUERIES.observe(stats.queries, view=view)
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, view=view)
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0003_attempt_response_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptionStats',
+            fields=[
+                ('option', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='front.answeroption')),
+                ('selected', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'option stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='front.question')),
+                ('answered', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'question stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='seconds_to_answer',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AnswerTimeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_buckets', to='front.question')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'unique_together': {('question', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE front_search USING fts5(quiz_title, question_text, options, tokenize = 'porter unicode61')",
+        """
+        INSERT INTO front_search (rowid, quiz_title, question_text, options)
+        SELECT q.question_id, z.title, q.question_text, COALESCE(GROUP_CONCAT(o.option_text, ' '), '')
+        FROM front_question q
+        JOIN front_quiz z ON z.quiz_id = q.quiz_id
+        LEFT JOIN front_answeroption o ON o.question_id = q.question_id
+        GROUP BY q.question_id, z.title, q.question_text
+        """,
+    ],
+    'postgresql': [
+        """
+        CREATE TABLE front_search (
+            question_id integer PRIMARY KEY REFERENCES front_question (question_id) ON DELETE CASCADE,
+            document tsvector NOT NULL
+        )
+        """,
+        "CREATE INDEX front_search_document ON front_search USING GIN (document)",
+        """
+        INSERT INTO front_search (question_id, document)
+        SELECT q.question_id,
+            setweight(to_tsvector('english', q.question_text), 'A')
+            || setweight(to_tsvector('english', z.title), 'B')
+            || setweight(to_tsvector('english', COALESCE(STRING_AGG(o.option_text, ' '), '')), 'C')
+        FROM front_question q
+        JOIN front_quiz z ON z.quiz_id = q.quiz_id
+        LEFT JOIN front_answeroption o ON o.question_id = q.question_id
+        GROUP BY q.question_id, z.title, q.question_text
+        """,
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for statement in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute("DROP TABLE front_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0004_question_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
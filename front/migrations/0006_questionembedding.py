@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionEmbedding',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='front.question')),
+                ('embedder', models.CharField(max_length=50)),
+                ('vector', models.BinaryField()),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='front.quiz')),
+            ],
+        ),
+    ]
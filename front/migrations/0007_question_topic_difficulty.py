@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def topics_from_titles(apps, schema_editor):
+    # Generated quizzes are titled "Quiz about <topic>" (see persistence.quiz_title)
+    Quiz = apps.get_model('front', 'Quiz')
+    Question = apps.get_model('front', 'Question')
+    prefix = "Quiz about "
+    for quiz_id, title in Quiz.objects.filter(title__startswith=prefix).values_list('quiz_id', 'title'):
+        Question.objects.filter(quiz_id=quiz_id, topic='').update(topic=title[len(prefix):][:100])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0006_questionembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='difficulty',
+            field=models.CharField(blank=True, choices=[('Easy', 'Easy'), ('Medium', 'Medium'), ('Hard', 'Hard')], max_length=6),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='origin',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='front.question'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='topic',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['topic', 'difficulty'], name='front_quest_topic_3b292d_idx'),
+        ),
+        migrations.RunPython(topics_from_titles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def topics_from_first_questions(apps, schema_editor):
+    # One UPDATE, before the indexes exist, rather than a save per quiz
+    Quiz = apps.get_model('front', 'Quiz')
+    Question = apps.get_model('front', 'Question')
+    first_topic = Question.objects.filter(quiz_id=OuterRef('pk')).order_by('order_in_quiz').values('topic')[:1]
+    Quiz.objects.update(topic=Coalesce(Subquery(first_topic), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0007_question_topic_difficulty'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='quiz',
+            options={'ordering': ['-created_at', '-quiz_id'], 'verbose_name_plural': 'quizzes'},
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='topic',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(topics_from_first_questions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['created_at', 'quiz_id'], name='front_quiz_created_0e0689_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['topic', 'created_at', 'quiz_id'], name='front_quiz_topic_65a027_idx'),
+        ),
+    ]
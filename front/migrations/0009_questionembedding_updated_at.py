@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('front', '0008_quiz_topic_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionembedding',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
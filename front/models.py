@@ -1,6 +1,29 @@
+import uuid
+
 from django.db import models
 from django.core.validators import MinValueValidator
 
+
+class QuizQuerySet(models.QuerySet):
+    """
+    QuerySet helpers for loading quizzes together with their content.
+    """
+
+    def with_questions(self):
+        """
+        Prefetch ordered questions and their answer options.
+
+        Rendering a quiz then costs a fixed three queries (quiz, questions,
+        options) no matter how many questions it holds.
+        """
+        return self.prefetch_related(
+            models.Prefetch(
+                'questions',
+                queryset=Question.objects.order_by('order_in_quiz').prefetch_related('options'),
+            )
+        )
+
+
 class Quiz(models.Model):
     """
     Represents a collection of questions forming a complete quiz.
@@ -12,10 +35,18 @@ class Quiz(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    topic = models.CharField(max_length=100, blank=True)  # Topic of the first question, for browsing
+
+    objects = QuizQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "quizzes"
-        ordering = ['-created_at']  # Newest quizzes first
+        ordering = ['-created_at', '-quiz_id']  # Newest quizzes first
+        # Keyset pagination of the catalogue, overall and per topic (see front/catalogue.py)
+        indexes = [
+            models.Index(fields=['created_at', 'quiz_id']),
+            models.Index(fields=['topic', 'created_at', 'quiz_id']),
+        ]
 
     def __str__(self):
         return f"{self.title} (ID: {self.quiz_id})"
@@ -31,6 +62,11 @@ class Question(models.Model):
         ('MCQ', 'Multiple Choice'),
         ('TF', 'True/False'),
     ]
+    DIFFICULTIES = [
+        ('Easy', 'Easy'),
+        ('Medium', 'Medium'),
+        ('Hard', 'Hard'),
+    ]
 
     question_id = models.AutoField(primary_key=True)
     quiz = models.ForeignKey(
@@ -48,10 +84,22 @@ class Question(models.Model):
         default=1,
         validators=[MinValueValidator(1)]
     )
+    topic = models.CharField(max_length=100, blank=True)
+    difficulty = models.CharField(max_length=6, choices=DIFFICULTIES, blank=True)
+    # Set on copies made when a quiz reuses a question; the question bank
+    # only samples originals
+    origin = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='copies'
+    )
 
     class Meta:
         ordering = ['order_in_quiz']
         unique_together = ['quiz', 'order_in_quiz']
+        indexes = [models.Index(fields=['topic', 'difficulty'])]
 
     def __str__(self):
         return f"Question {self.order_in_quiz} in {self.quiz.title}"
@@ -77,3 +125,197 @@ class AnswerOption(models.Model):
 
     def __str__(self):
         return f"Option for {self.question}: {self.option_text[:30]}"
+
+
+class GenerationJob(models.Model):
+    """
+    Represents a queued quiz generation request.
+
+    Jobs are created by the API and picked up by the local worker pool in
+    front/jobs.py; the row doubles as the queue entry and the status record.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    description = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='generation_jobs'
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Job {self.job_id} ({self.status})"
+
+
+class Attempt(models.Model):
+    """
+    Represents one graded submission of a quiz.
+
+    The primary key is a UUID generated in Python so an attempt and its
+    responses can be built, and bulk inserted, before touching the database.
+    """
+    attempt_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name='attempts'
+    )
+    score = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    submitted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-submitted_at']
+        indexes = [models.Index(fields=['quiz', 'submitted_at'])]
+
+    def __str__(self):
+        return f"Attempt on {self.quiz_id}: {self.score}/{self.total}"
+
+
+class Response(models.Model):
+    """
+    Represents the answer given to one question within an attempt.
+    """
+    response_id = models.BigAutoField(primary_key=True)
+    attempt = models.ForeignKey(
+        Attempt,
+        on_delete=models.CASCADE,
+        related_name='responses'
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='responses'
+    )
+    selected_option = models.ForeignKey(
+        AnswerOption,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='responses'
+    )
+    is_correct = models.BooleanField(default=False)
+    seconds_to_answer = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['attempt', 'question']
+
+    def __str__(self):
+        return f"Response to {self.question_id} in {self.attempt_id}"
+
+
+class QuestionStats(models.Model):
+    """
+    Running totals of the responses to one question.
+
+    Updated incrementally as attempts are recorded (see front/analytics.py)
+    so reading stats costs O(questions), not O(attempts). Rebuild with
+    ``python manage.py rebuild_quiz_stats`` if they drift.
+    """
+    question = models.OneToOneField(
+        Question,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    answered = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'question stats'
+
+    @property
+    def percent_correct(self):
+        return round(self.correct * 100 / self.answered, 1) if self.answered else None
+
+    def __str__(self):
+        return f"Stats for {self.question_id}: {self.correct}/{self.answered}"
+
+
+class OptionStats(models.Model):
+    """
+    Running count of how often one answer option was chosen.
+    """
+    option = models.OneToOneField(
+        AnswerOption,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    selected = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'option stats'
+
+    def __str__(self):
+        return f"Stats for option {self.option_id}: {self.selected}"
+
+
+class AnswerTimeBucket(models.Model):
+    """
+    One bar of a question's time-to-answer histogram.
+
+    Bucket bounds are fixed in front/analytics.py; the median is
+    interpolated from the counts.
+    """
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='time_buckets'
+    )
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['bucket']
+        unique_together = ['question', 'bucket']
+
+    def __str__(self):
+        return f"Bucket {self.bucket} of {self.question_id}: {self.count}"
+
+
+class QuestionEmbedding(models.Model):
+    """
+    Stores the embedding of a question's text for similarity lookups.
+
+    Vectors are packed float32 so the table works on every backend; the
+    in-process or pgvector index in front/vectors.py is built from it.
+    """
+    question = models.OneToOneField(
+        Question,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='embedding'
+    )
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name='embeddings'
+    )
+    embedder = models.CharField(max_length=50)
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Lets other processes' indexes pick up changes
+
+    def __str__(self):
+        return f"Embedding of {self.question_id} ({self.embedder})"
@@ -0,0 +1,156 @@
+import logging
+
+from django.db import connections, router, transaction
+
+from .models import Quiz, Question, AnswerOption
+from .schemas import QuizQuestion
+from .search import index_questions, index_quizzes
+
+logger = logging.getLogger('custom_logger')
+
+
+def quiz_title(questions: list[QuizQuestion]) -> tuple[str, str]:
+    """
+    Builds the title and description stored for a generated quiz.
+    """
+    topic = questions[0].topic or 'General Knowledge'
+    return f"Quiz about {topic}", f"A quiz containing {len(questions)} questions about {topic}"
+
+
+def question_orders(questions: list[QuizQuestion]) -> list[int]:
+    """
+    Returns order_in_quiz for each question.
+
+    The order comes from the numeric suffix of the question id
+    ('q_topic_007' -> 7). If the model repeated a suffix, questions are
+    numbered by position instead so the (quiz, order_in_quiz) constraint holds.
+    """
+    orders = [int(question.id.split('_')[-1]) for question in questions]
+    if len(set(orders)) != len(orders) or min(orders) < 1:
+        return list(range(1, len(questions) + 1))
+    return orders
+
+
+def save_quizzes(quizzes: list[list[QuizQuestion]]) -> list[int]:
+    """
+    Atomically stores many quizzes with one bulk insert per table.
+
+    Either every quiz is written or none is, together with its search index
+    entries. On backends that return primary keys from bulk inserts
+    (PostgreSQL, SQLite 3.35+, MariaDB 10.5+) this is three INSERT
+    round-trips regardless of size, plus the index update. Elsewhere quizzes
+    are inserted one at a time and question ids are read back by
+    (quiz, order_in_quiz), which is unique.
+
+    Args:
+        quizzes (list[list[QuizQuestion]]): Validated questions, one list per quiz
+
+    Returns:
+        list[int]: IDs of the created quizzes, in input order
+    """
+    if not quizzes:
+        return []
+
+    using = router.db_for_write(Quiz)
+    returns_pks = connections[using].features.can_return_rows_from_bulk_insert
+
+    with transaction.atomic(using=using):
+        quiz_objects = []
+        for questions in quizzes:
+            title, description = quiz_title(questions)
+            quiz_objects.append(Quiz(title=title, description=description, topic=questions[0].topic[:100]))
+        if returns_pks:
+            Quiz.objects.using(using).bulk_create(quiz_objects)
+        else:
+            for quiz in quiz_objects:
+                quiz.save(using=using)
+
+        question_objects = []
+        for quiz, questions in zip(quiz_objects, quizzes):
+            for order, question in zip(question_orders(questions), questions):
+                question_objects.append(Question(
+                    quiz_id=quiz.quiz_id,
+                    question_text=question.question_text,
+                    question_type=question.type,
+                    order_in_quiz=order,
+                    topic=question.topic[:100],
+                    difficulty=question.difficulty,
+                ))
+        Question.objects.using(using).bulk_create(question_objects)
+        if not returns_pks:
+            _load_question_ids(question_objects, using)
+
+        all_questions = [question for questions in quizzes for question in questions]
+        AnswerOption.objects.using(using).bulk_create([
+            AnswerOption(
+                question_id=question_object.question_id,
+                option_text=option.text,
+                is_correct=(option.option_id == question.correct_answer_id),
+            )
+            for question_object, question in zip(question_objects, all_questions)
+            for option in question.options
+        ])
+        index_quizzes([quiz.quiz_id for quiz in quiz_objects], using=using, replace=False)
+
+    logger.info(f"Saved {len(quiz_objects)} quizzes with {len(question_objects)} questions")
+    return [quiz.quiz_id for quiz in quiz_objects]
+
+
+def save_quiz(questions: list[QuizQuestion]) -> int:
+    """
+    Atomically stores one quiz, returning its ID.
+    """
+    return save_quizzes([questions])[0]
+
+
+def copy_questions(question_ids: list[int], quiz_id: int, first_order: int = 1) -> list[tuple[int, int]]:
+    """
+    Copies stored questions with their options into a quiz, in the given order.
+
+    Each copy points at its original question through `origin`, and is added
+    to the search index.
+
+    Returns:
+        list[tuple[int, int]]: (original id, copy id) pairs
+    """
+    if not question_ids:
+        return []
+
+    using = router.db_for_write(Question)
+    originals = Question.objects.using(using).prefetch_related('options').in_bulk(question_ids)
+    sources = [originals[question_id] for question_id in question_ids if question_id in originals]
+
+    with transaction.atomic(using=using):
+        copies = [
+            Question(
+                quiz_id=quiz_id,
+                question_text=source.question_text,
+                question_type=source.question_type,
+                order_in_quiz=first_order + i,
+                topic=source.topic,
+                difficulty=source.difficulty,
+                origin_id=source.origin_id or source.question_id,
+            )
+            for i, source in enumerate(sources)
+        ]
+        Question.objects.using(using).bulk_create(copies)
+        if not connections[using].features.can_return_rows_from_bulk_insert:
+            _load_question_ids(copies, using)
+        AnswerOption.objects.using(using).bulk_create([
+            AnswerOption(question_id=copy.question_id, option_text=option.option_text, is_correct=option.is_correct)
+            for copy, source in zip(copies, sources)
+            for option in source.options.all()
+        ])
+        index_questions([copy.question_id for copy in copies], using=using)
+
+    return [(source.question_id, copy.question_id) for source, copy in zip(sources, copies)]
+
+
+def _load_question_ids(question_objects, using):
+    quiz_ids = {question.quiz_id for question in question_objects}
+    rows = Question.objects.using(using).filter(quiz_id__in=quiz_ids).values_list(
+        'quiz_id', 'order_in_quiz', 'question_id'
+    )
+    ids = {(quiz_id, order): question_id for quiz_id, order, question_id in rows}
+    for question in question_objects:
+        question.question_id = ids[(question.quiz_id, question.order_in_quiz)]
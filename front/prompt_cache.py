@@ -0,0 +1,300 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+
+from .llm import load_api_keys
+from .models import Quiz, Question
+from .persistence import copy_questions
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 60 * 60,  # Seconds a generated quiz can be reused
+    'MAX_ENTRIES': 1000,
+    'SIMILARITY_THRESHOLD': 0.9,
+    'EMBEDDER': None,  # None for exact matches only, 'google', or 'hashing' (lexical, for tests)
+    'CLONE': False,  # Serve a copy instead of the original quiz
+}
+
+STOPWORDS = {
+    'a', 'about', 'an', 'and', 'around', 'create', 'for', 'generate', 'give',
+    'in', 'make', 'me', 'of', 'on', 'please', 'question', 'questions', 'quiz',
+    'quizzes', 'some', 'test', 'the', 'to', 'with',
+}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_description(description):
+    """
+    Reduces a quiz description to a canonical key.
+
+    Lowercases, drops punctuation and filler words, and sorts the remaining
+    words so that "Photosynthesis quiz for 8th grade" and "8th grade
+    photosynthesis" share a key.
+    """
+    tokens = {token for token in _TOKEN_RE.findall(description.lower()) if token not in STOPWORDS}
+    return ' '.join(sorted(tokens))
+
+
+class HashingEmbedder:
+    """
+    Deterministic, offline embedder based on feature hashing.
+
+    Words and their character trigrams are hashed into a fixed number of
+    buckets, so near-identical descriptions land close together without a
+    model call. It only sees spelling, not meaning ("world war 1" and
+    "world war 2" score 0.8), so it is meant for tests, not production.
+    """
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.dimensions
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in text.split():
+                vector[self._bucket(word)] += 1.0
+                padded = f"#{word}#"
+                for i in range(len(padded) - 2):
+                    vector[self._bucket(padded[i:i + 3])] += 0.5
+            vectors.append(_normalize(vector))
+        return vectors
+
+
+class GoogleEmbedder:
+    """
+    Embedder backed by the Google GenAI embedding model via llama-index.
+    """
+
+    def __init__(self, model_name='text-embedding-004'):
+        from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+
+        load_api_keys()
+        self._model = GoogleGenAIEmbedding(model_name=model_name)
+
+    def embed(self, texts):
+        return [_normalize(vector) for vector in self._model.get_text_embedding_batch(texts)]
+
+
+EMBEDDERS = {
+    'hashing': HashingEmbedder,
+    'google': GoogleEmbedder,
+}
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def _cosine(a, b):
+    # Vectors are stored normalized, so the dot product is the cosine
+    return sum(x * y for x, y in zip(a, b))
+
+
+def cache_key(description, num_questions=None):
+    """
+    Returns the cache key for a request: its normalized description, plus the
+    number of questions when the caller asked for one.
+    """
+    key = normalize_description(description)
+    if key and num_questions:
+        # Carries a digit, so requests for different sizes never match as similar
+        key += f' n{num_questions}'
+    return key
+
+
+def _numbers(key):
+    return {token for token in key.split() if any(char.isdigit() for char in token)}
+
+
+@dataclass
+class CacheEntry:
+    quiz_id: int
+    stored_at: float
+    vector: list = field(default=None, repr=False)
+
+
+class PromptCache:
+    """
+    LRU cache from normalized descriptions to previously generated quizzes.
+
+    Lookups try an exact match on the normalized key first, then (if an
+    embedder is configured) the most similar unexpired entry above the
+    similarity threshold that mentions the same numbers. Safe to share
+    between threads.
+    """
+
+    def __init__(self, ttl, max_entries, similarity_threshold, embedder=None, clone=False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder
+        self.clone = clone
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, description, num_questions=None):
+        """
+        Returns the id of a quiz that can serve this description and size, or None.
+        """
+        key = cache_key(description, num_questions)
+        now = time.monotonic()
+        if not key:
+            return None
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                match = entry
+            else:
+                match = self._most_similar(key)
+                if match is not None:
+                    self.similar_hits += 1
+                else:
+                    self.misses += 1
+        if match is None:
+            return None
+        if not Quiz.objects.filter(pk=match.quiz_id).exists():
+            self.forget(match.quiz_id)
+            return None
+        logger.info(f"Prompt cache hit for '{description}': quiz {match.quiz_id}")
+        return clone_quiz(match.quiz_id) if self.clone else match.quiz_id
+
+    def store(self, description, quiz_id, num_questions=None):
+        """
+        Records the quiz generated for a description and size.
+        """
+        key = cache_key(description, num_questions)
+        if not key:
+            return
+        vector = self.embedder.embed([key])[0] if self.embedder else None
+        with self._lock:
+            self._entries[key] = CacheEntry(quiz_id=quiz_id, stored_at=time.monotonic(), vector=vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget(self, quiz_id):
+        """
+        Drops every entry pointing at the given quiz.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.quiz_id == quiz_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _expire(self, now):
+        # Entries are in insertion/use order, but a touched entry keeps its
+        # original timestamp, so scan them all
+        expired = [key for key, entry in self._entries.items() if now - entry.stored_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def _most_similar(self, key):
+        if not self.embedder:
+            return None
+        query = self.embedder.embed([key])[0]
+        numbers = _numbers(key)
+        best_key, best_score = None, self.similarity_threshold
+        for candidate_key, entry in self._entries.items():
+            # "World war 1" is never "world war 2", however close the embeddings
+            if entry.vector is None or _numbers(candidate_key) != numbers:
+                continue
+            score = _cosine(query, entry.vector)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+
+def clone_quiz(quiz_id):
+    """
+    Copies a quiz with its questions and options, returning the new quiz id.
+
+    The copies go through persistence.copy_questions, so they are searchable
+    and, like bank copies, share their originals' embeddings.
+    """
+    # Imported here: the vector index imports this module for its embedders
+    from .vectors import get_question_vectors
+
+    source = Quiz.objects.get(pk=quiz_id)
+    question_ids = list(Question.objects.filter(quiz_id=quiz_id).order_by('order_in_quiz').values_list('question_id', flat=True))
+    with transaction.atomic():
+        quiz = Quiz.objects.create(title=source.title, description=source.description, topic=source.topic)
+        copies = copy_questions(question_ids, quiz.quiz_id)
+    question_vectors = get_question_vectors()
+    if question_vectors is not None:
+        try:
+            question_vectors.add_copies(copies, quiz.quiz_id)
+        except Exception as e:
+            logger.error(f"Failed to index quiz {quiz.quiz_id}: {e}")
+    return quiz.quiz_id
+
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """
+    Returns the process-wide prompt cache, or None when it is disabled.
+    """
+    global _prompt_cache
+    config = {**DEFAULTS, **getattr(settings, 'QUIZ_PROMPT_CACHE', {})}
+    if not config['ENABLED']:
+        return None
+    if _prompt_cache is None:
+        with _prompt_cache_lock:
+            if _prompt_cache is None:
+                embedder_class = EMBEDDERS.get(config['EMBEDDER'])
+                _prompt_cache = PromptCache(
+                    ttl=config['TTL'],
+                    max_entries=config['MAX_ENTRIES'],
+                    similarity_threshold=config['SIMILARITY_THRESHOLD'],
+                    embedder=embedder_class() if embedder_class else None,
+                    clone=config['CLONE'],
+                )
+    return _prompt_cache
+
+
+def reset_prompt_cache():
+    """
+    Discards the process-wide prompt cache so it is rebuilt from settings.
+    """
+    global _prompt_cache
+    with _prompt_cache_lock:
+        _prompt_cache = None
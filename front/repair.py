@@ -0,0 +1,251 @@
+"""
+Repair of malformed model output, between the model and QuizSchema.
+
+Most invalid responses are nearly right: prose or a code fence around the
+array, a trailing comma, an id like 'q1', 'easy' instead of 'Easy', options
+given as plain strings, or an answer letter in upper case. These are fixed
+locally. Questions that still fail validation are dropped, or, as a last
+resort, sent back to the model in one small re-ask that contains only the
+broken questions, instead of regenerating the whole quiz.
+"""
+import json
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from .schemas import QuizQuestion
+from .utils import strip_code_fences
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'REASK': True,  # Ask the model to fix questions local repair could not
+    'MAX_REASK_QUESTIONS': 10,  # Larger failures are not worth a re-ask
+}
+
+OPTION_IDS = ('a', 'b', 'c', 'd')
+DIFFICULTIES = {'easy': 'Easy', 'medium': 'Medium', 'hard': 'Hard'}
+ID_RE = re.compile(r'^q_[a-zA-Z_]*[0-9]{3}$')
+
+
+def get_repair_config():
+    return {**DEFAULTS, **getattr(settings, 'QUIZ_RESPONSE_REPAIR', {})}
+
+
+def _strip_trailing_commas(text):
+    """
+    Removes commas directly before a closing bracket or brace, outside strings.
+    """
+    out = []
+    in_string = escaped = False
+    pending_comma = None
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in ']}':
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+        if char == ',':
+            pending_comma = [char]
+            continue
+        if char == '"':
+            in_string = True
+        out.append(char)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return ''.join(out)
+
+
+def tolerant_loads(text):
+    """
+    Parses model output that should be a JSON value but may be wrapped or damaged.
+
+    Tries, in order: the text without code fences; the outermost array or
+    object cut out of surrounding prose, without trailing commas; and for
+    arrays, every complete top-level object (salvaging truncated output).
+
+    Raises:
+        ValueError: If nothing usable can be recovered
+    """
+    cleaned = strip_code_fences(text)
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        pass
+
+    starts = [i for i in (cleaned.find('['), cleaned.find('{')) if i != -1]
+    if not starts:
+        raise ValueError("No JSON array or object in the response")
+    start = min(starts)
+    end = cleaned.rfind(']' if cleaned[start] == '[' else '}')
+    candidate = _strip_trailing_commas(cleaned[start:end + 1] if end > start else cleaned[start:])
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        if cleaned[start] != '[':
+            raise ValueError("Could not parse the JSON object in the response")
+
+    from .streaming import QuestionStreamParser  # streaming imports this module
+
+    # Truncated output: the last ']' may close an options list, so scan everything
+    parser = QuestionStreamParser()
+    objects = [obj for obj, error in parser.feed(_strip_trailing_commas(cleaned[start:])) if obj is not None]
+    if not objects:
+        raise ValueError("No complete question objects in the response")
+    return objects
+
+
+def _slug(topic):
+    return re.sub(r'[^a-z_]', '', re.sub(r'\s+', '_', str(topic).strip().lower())).strip('_') or 'topic'
+
+
+def repair_question(raw, position, default_topic='General Knowledge'):
+    """
+    Fixes the common near-misses in one question dict, returning a new dict.
+
+    The result may still be invalid (e.g. only three options); callers
+    validate it afterwards.
+    """
+    if not isinstance(raw, dict):
+        return raw
+    question = dict(raw)
+
+    topic = question.get('topic')
+    if not isinstance(topic, str) or not topic.strip():
+        question['topic'] = topic = default_topic
+    if not isinstance(question.get('id'), str) or not ID_RE.match(question['id']):
+        question['id'] = f"q_{_slug(topic)}_{position % 1000:03d}"
+
+    difficulty = str(question.get('difficulty', '')).strip().lower()
+    question['difficulty'] = DIFFICULTIES.get(difficulty, 'Medium')
+    if str(question.get('type', 'MCQ')).strip().lower() in ('mcq', 'multiple choice', 'multiple_choice', ''):
+        question['type'] = 'MCQ'
+    if not isinstance(question.get('question_text'), str) and isinstance(question.get('question'), str):
+        question['question_text'] = question.pop('question')
+    if not isinstance(question.get('explanation'), str):
+        question['explanation'] = ''
+
+    options = question.get('options')
+    if isinstance(options, dict):
+        options = [{'option_id': key, 'text': value} for key, value in options.items()]
+    if isinstance(options, list):
+        options = [
+            {'option_id': OPTION_IDS[i] if i < 4 else str(i), 'text': option} if isinstance(option, str)
+            else dict(option, option_id=str(option.get('option_id', '')).strip().lower()) if isinstance(option, dict)
+            else option
+            for i, option in enumerate(options)
+        ]
+
+    answer = question.get('correct_answer_id')
+    if isinstance(answer, str) and isinstance(options, list):
+        answer = answer.strip()
+        if answer.lower() in OPTION_IDS:
+            answer = answer.lower()
+        else:
+            # The model gave the answer's text instead of its id
+            matches = [option.get('option_id') for option in options if isinstance(option, dict) and option.get('text') == answer]
+            answer = matches[0] if matches else answer
+        question['correct_answer_id'] = answer
+
+    if isinstance(options, list) and len(options) > 4:
+        # Keep the correct option and fill up to four with the first others, re-lettered
+        correct = [option for option in options if isinstance(option, dict) and option.get('option_id') == answer]
+        others = [option for option in options if option not in correct]
+        kept = [option for option in options if option in correct or option in others[:4 - len(correct)]]
+        relettered = []
+        for letter, option in zip(OPTION_IDS, kept):
+            if option in correct:
+                question['correct_answer_id'] = letter
+            relettered.append(dict(option, option_id=letter))
+        options = relettered
+    if options is not None:
+        question['options'] = options
+    return question
+
+
+@dataclass
+class RepairReport:
+    """
+    Outcome of repairing one response.
+
+    `questions` are valid, in response order. `broken` holds (position,
+    repaired dict, error) for questions that still fail validation.
+    """
+
+    questions: list = field(default_factory=list)
+    broken: list = field(default_factory=list)
+    repaired: int = 0
+
+
+def repair_questions(raw_questions):
+    """
+    Repairs and validates a list of question dicts independently.
+    """
+    report = RepairReport()
+    topics = Counter(q.get('topic') for q in raw_questions if isinstance(q, dict) and isinstance(q.get('topic'), str) and q.get('topic').strip())
+    default_topic = topics.most_common(1)[0][0] if topics else 'General Knowledge'
+    for position, raw in enumerate(raw_questions, start=1):
+        try:
+            report.questions.append(QuizQuestion.model_validate(raw))
+            continue
+        except ValidationError:
+            pass
+        fixed = repair_question(raw, position, default_topic)
+        try:
+            report.questions.append(QuizQuestion.model_validate(fixed))
+            report.repaired += 1
+        except ValidationError as e:
+            report.broken.append((position, fixed, e))
+    return report
+
+
+def repair_response(response_text):
+    """
+    Recovers as many valid questions as possible from a raw model response.
+
+    Raises:
+        ValueError: If no question list can be found in the response
+    """
+    data = tolerant_loads(response_text)
+    if isinstance(data, dict):
+        # A single question, or the array wrapped in an object
+        lists = [value for value in data.values() if isinstance(value, list)]
+        data = lists[0] if len(lists) == 1 else [data]
+    if not isinstance(data, list):
+        raise ValueError("Response is not a list of questions")
+    return repair_questions(data)
+
+
+def reask_prompt(description, broken):
+    """
+    Builds a short prompt asking the model to fix only the broken questions.
+    """
+    items = "\n".join(
+        f"    {json.dumps(question, ensure_ascii=False)}\n    Errors: "
+        + "; ".join(f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+        for _, question, error in broken
+    )
+    return f"""These questions from a quiz about "{description}" failed validation:
+{items}
+    Fix each one and return ONLY a JSON array of the corrected questions, in the same order.
+    Every question needs a 'q_topic_XXX' id, a difficulty of Easy, Medium or Hard, type MCQ,
+    exactly four options with option_id a, b, c and d, a correct_answer_id that is one of
+    them, and an explanation. Do not include Markdown formatting or any other text."""
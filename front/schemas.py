@@ -11,7 +11,7 @@ class QuizQuestion(BaseModel):
     difficulty: str = Field(..., pattern="^(Easy|Medium|Hard)$", description="Difficulty must be 'Easy', 'Medium', or 'Hard'")
     type: str = Field(..., pattern="^MCQ$", description="Type must be 'MCQ'")
     question_text: str = Field(..., description="The text of the question")
-    options: List[Option] = Field(..., min_items=4, max_items=4, description="List of 4 options")
+    options: List[Option] = Field(..., min_length=4, max_length=4, description="List of 4 options")
     correct_answer_id: str = Field(..., pattern="^(a|b|c|d)$", description="Correct answer ID must be one of 'a', 'b', 'c', or 'd'")
     explanation: str = Field(..., description="Explanation of the correct answer")
 
@@ -0,0 +1,212 @@
+"""
+Full-text search over quizzes, questions and answer options.
+
+Each question is indexed as one document holding its quiz title, question
+text and option texts, in a table named front_search created by migration
+0005: an FTS5 virtual table on SQLite (rowid = question_id) and a tsvector
+column with a GIN index on PostgreSQL. Other backends fall back to LIKE
+scans. The index is updated by save_quizzes() for bulk inserts and by the
+signals in front/signals.py for edits.
+"""
+import logging
+import operator
+import re
+from functools import reduce
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Question
+
+logger = logging.getLogger('custom_logger')
+
+MAX_RESULTS = 100
+CHUNK_SIZE = 500  # Ids per statement, well inside every backend's parameter limit
+
+# Builds documents for the questions matched by {where}
+DOCUMENT_SQL = {
+    'sqlite': """
+        INSERT INTO front_search (rowid, quiz_title, question_text, options)
+        SELECT q.question_id, z.title, q.question_text, COALESCE(GROUP_CONCAT(o.option_text, ' '), '')
+        FROM front_question q
+        JOIN front_quiz z ON z.quiz_id = q.quiz_id
+        LEFT JOIN front_answeroption o ON o.question_id = q.question_id
+        WHERE {where}
+        GROUP BY q.question_id, z.title, q.question_text
+    """,
+    'postgresql': """
+        INSERT INTO front_search (question_id, document)
+        SELECT q.question_id,
+            setweight(to_tsvector('english', q.question_text), 'A')
+            || setweight(to_tsvector('english', z.title), 'B')
+            || setweight(to_tsvector('english', COALESCE(STRING_AGG(o.option_text, ' '), '')), 'C')
+        FROM front_question q
+        JOIN front_quiz z ON z.quiz_id = q.quiz_id
+        LEFT JOIN front_answeroption o ON o.question_id = q.question_id
+        WHERE {where}
+        GROUP BY q.question_id, z.title, q.question_text
+        ON CONFLICT (question_id) DO UPDATE SET document = EXCLUDED.document
+    """,
+}
+
+DELETE_SQL = {
+    'sqlite': "DELETE FROM front_search WHERE rowid IN ({ids})",
+    'postgresql': "DELETE FROM front_search WHERE question_id IN ({ids})",
+}
+
+# Every matching question, unranked and uncapped, for use as a subquery
+MATCH_SQL = {
+    'sqlite': "SELECT rowid FROM front_search WHERE front_search MATCH %s",
+    'postgresql': "SELECT question_id FROM front_search WHERE document @@ to_tsquery('english', %s)",
+}
+
+SEARCH_SQL = {
+    'sqlite': "SELECT rowid FROM front_search WHERE front_search MATCH %s ORDER BY rank LIMIT %s",
+    'postgresql': """
+        SELECT question_id FROM front_search, to_tsquery('english', %s) query
+        WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s
+    """,
+}
+
+
+def _connection(using=None):
+    return connections[using or router.db_for_write(Question)]
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _placeholders(chunk):
+    return ', '.join(['%s'] * len(chunk))
+
+
+def index_quizzes(quiz_ids, using=None, replace=True):
+    """
+    (Re)indexes every question of the given quizzes.
+
+    Pass replace=False for quizzes that were just created, which cannot
+    have index entries yet.
+    """
+    connection = _connection(using)
+    if connection.vendor not in DOCUMENT_SQL:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(quiz_ids):
+            ids = _placeholders(chunk)
+            if replace and connection.vendor == 'sqlite':
+                question_ids = f"SELECT question_id FROM front_question WHERE quiz_id IN ({ids})"
+                cursor.execute(DELETE_SQL['sqlite'].format(ids=question_ids), chunk)
+            cursor.execute(DOCUMENT_SQL[connection.vendor].format(where=f"q.quiz_id IN ({ids})"), chunk)
+
+
+def unindex_quizzes(quiz_ids, using=None):
+    """
+    Drops the index entries of every question of the given quizzes.
+
+    Called before the quizzes are deleted, while their questions still exist,
+    so a cascaded delete costs one statement per chunk of quizzes.
+    """
+    connection = _connection(using)
+    if connection.vendor not in DOCUMENT_SQL:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(quiz_ids):
+            question_ids = f"SELECT question_id FROM front_question WHERE quiz_id IN ({_placeholders(chunk)})"
+            cursor.execute(DELETE_SQL[connection.vendor].format(ids=question_ids), chunk)
+
+
+def index_questions(question_ids, using=None):
+    """
+    (Re)indexes the given questions, dropping any that no longer exist.
+    """
+    connection = _connection(using)
+    if connection.vendor not in DOCUMENT_SQL:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(question_ids):
+            ids = _placeholders(chunk)
+            cursor.execute(DELETE_SQL[connection.vendor].format(ids=ids), chunk)
+            cursor.execute(DOCUMENT_SQL[connection.vendor].format(where=f"q.question_id IN ({ids})"), chunk)
+
+
+def rebuild_index():
+    """
+    Rebuilds the whole index from the question tables.
+    """
+    connection = _connection()
+    if connection.vendor not in DOCUMENT_SQL:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM front_search")
+        cursor.execute(DOCUMENT_SQL[connection.vendor].format(where="1 = 1"))
+    logger.info("Rebuilt the search index")
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _match_query(terms, vendor):
+    # Every word must match; the last one also as a prefix, so results can follow typing
+    if vendor == 'sqlite':
+        return ' '.join(f'"{term}"' for term in terms) + '*'
+    return ' & '.join(terms) + ':*'
+
+
+def _like_condition(terms):
+    # No index on this backend: scan with LIKE as the admin used to
+    return reduce(operator.and_, [
+        Q(question_text__icontains=term) | Q(quiz__title__icontains=term) | Q(options__option_text__icontains=term)
+        for term in terms
+    ])
+
+
+def search_question_ids(query, limit=20):
+    """
+    Returns ids of the questions best matching `query`, best first.
+
+    Every word must match; the last one also matches as a prefix so
+    results can follow typing.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    connection = _connection()
+    if connection.vendor not in SEARCH_SQL:
+        return list(Question.objects.filter(_like_condition(terms)).values_list('pk', flat=True).distinct()[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL[connection.vendor], [_match_query(terms, connection.vendor), limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_quiz_ids(query):
+    """
+    Returns a subquery of the ids of every quiz with a question matching `query`.
+
+    Unlike search_question_ids it is neither ranked nor capped, so it can
+    filter a whole queryset (e.g. `Quiz.objects.filter(pk__in=...)`).
+    """
+    terms = _terms(query)
+    if not terms:
+        return Question.objects.none().values('quiz_id')
+    connection = _connection()
+    if connection.vendor not in MATCH_SQL:
+        return Question.objects.filter(_like_condition(terms)).values('quiz_id')
+    return RawSQL(
+        f"SELECT quiz_id FROM front_question WHERE question_id IN ({MATCH_SQL[connection.vendor]})",
+        [_match_query(terms, connection.vendor)],
+    )
+
+
+def search_questions(query, limit=20):
+    """
+    Returns the questions best matching `query`, with their quizzes, best first.
+    """
+    ids = search_question_ids(query, limit)
+    questions = Question.objects.filter(pk__in=ids).select_related('quiz').in_bulk()
+    return [questions[question_id] for question_id in ids if question_id in questions]
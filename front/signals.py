@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_quiz
+from .db import tune_connection
+from .metrics import instrument_connection
+from .models import Quiz, Question, AnswerOption
+from .search import index_questions, index_quizzes, unindex_quizzes
+
+
+def cascaded(instance, origin):
+    """
+    Returns whether a delete was cascaded from a parent, which handles it in bulk.
+    """
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not type(instance)
+
+
+def invalidate_quiz_after_commit(quiz_id):
+    # Bumped before the commit, the new stamp could be cached with content
+    # read while the change was still invisible to other connections
+    transaction.on_commit(lambda: invalidate_quiz(quiz_id))
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_quiz_on_change(sender, instance, **kwargs):
+    invalidate_quiz_after_commit(instance.quiz_id)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_quiz_on_question_change(sender, instance, origin=None, **kwargs):
+    if not cascaded(instance, origin):
+        invalidate_quiz_after_commit(instance.quiz_id)
+
+
+@receiver([post_save, post_delete], sender=AnswerOption)
+def invalidate_quiz_on_option_change(sender, instance, origin=None, **kwargs):
+    if cascaded(instance, origin):
+        return
+    if AnswerOption.question.is_cached(instance):
+        quiz_id = instance.question.quiz_id
+    else:
+        quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    if quiz_id is not None:
+        invalidate_quiz_after_commit(quiz_id)
+
+
+# Keep the full-text index in step with edits made one row at a time
+# (the admin, the shell); bulk inserts are indexed by save_quizzes().
+# Deleting a quiz drops its questions' entries in one statement, before
+# the cascade runs; the cascaded question and option deletes are skipped.
+
+@receiver(post_save, sender=Quiz)
+def index_quiz_on_save(sender, instance, created, **kwargs):
+    if not created:
+        index_quizzes([instance.quiz_id])
+
+
+@receiver(pre_delete, sender=Quiz)
+def unindex_quiz_on_delete(sender, instance, **kwargs):
+    unindex_quizzes([instance.quiz_id])
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=AnswerOption)
+def index_question_on_change(sender, instance, origin=None, **kwargs):
+    if not cascaded(instance, origin):
+        index_questions([instance.question_id if sender is AnswerOption else instance.pk])
+
+
+@receiver(connection_created)
+def tune_new_connection(sender, connection, **kwargs):
+    tune_connection(connection)
+    instrument_connection(connection)
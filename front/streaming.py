@@ -0,0 +1,201 @@
+import json
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import reverse
+from pydantic import ValidationError
+
+from . import generation
+from .archive import archive_response
+from .llm import LLMError
+from .metrics import LLM_SECONDS, timer
+from .models import Question
+from .persistence import question_orders
+from .repair import repair_question
+from .schemas import QuizQuestion
+from .utils import create_quiz, generate_quiz_prompt
+
+logger = logging.getLogger('custom_logger')
+
+
+class QuestionStreamParser:
+    """
+    Incrementally extracts question objects from a streamed JSON array.
+
+    Feed it text chunks as they arrive; each call returns the top-level
+    objects whose closing brace was seen in that chunk. Anything before the
+    opening '[' (such as a Markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+
+    def feed(self, text):
+        """
+        Consumes a chunk of model output.
+
+        Returns:
+            list: (obj, error) pairs, one per completed object; obj is None
+                and error is set when the object is not valid JSON
+        """
+        completed = []
+        for char in text:
+            if not self._started:
+                self._started = char == '['
+                continue
+            if self._depth == 0:
+                # Between objects: skip commas, whitespace and the closing ']'
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = ''.join(self._buffer)
+                    self._buffer = []
+                    try:
+                        completed.append((json.loads(raw), None))
+                    except json.JSONDecodeError as e:
+                        completed.append((None, f"Invalid JSON format: {str(e)}"))
+        return completed
+
+
+def format_event(event, data):
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _public_question(question, number):
+    return {
+        'number': number,
+        'question_text': question.question_text,
+        'topic': question.topic,
+        'difficulty': question.difficulty,
+        'options': [{'option_id': opt.option_id, 'text': opt.text} for opt in question.options],
+    }
+
+
+def _stored_question_ids(quiz_id, questions):
+    """
+    Maps each streamed question to its stored question id and option ids.
+
+    The browser answers by stream position and option letter; grading needs
+    database ids. Options are stored in the order the model listed them.
+    """
+    stored = {
+        question.order_in_quiz: question
+        for question in Question.objects.filter(quiz_id=quiz_id).prefetch_related('options')
+    }
+    mapping = []
+    for order, question in zip(question_orders(questions), questions):
+        stored_question = stored[order]
+        option_ids = [option.option_id for option in stored_question.options.all()]
+        mapping.append({
+            'question_id': stored_question.question_id,
+            'options': {opt.option_id: option_id for opt, option_id in zip(question.options, option_ids)},
+        })
+    return mapping
+
+
+async def stream_quiz_events(description, timeout=None):
+    """
+    Streams a quiz generation as Server-Sent Events.
+
+    Questions are validated against QuizQuestion as soon as their object
+    closes and sent as 'question' events. Invalid questions produce
+    'invalid' events and are left out. When the model finishes, the valid
+    questions are stored and a 'done' event carries the quiz URL.
+
+    Args:
+        description (str): What the quiz should be about
+        timeout (float): Longest wait for the next chunk, defaults to
+            settings.QUIZ_GENERATION_TIMEOUT
+
+    Yields:
+        str: Encoded SSE messages
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'QUIZ_GENERATION_TIMEOUT', 60)
+
+    try:
+        client = generation.get_client()
+    except generation.QuizGenerationError as e:
+        yield format_event('failed', {'error': e.message})
+        return
+
+    parser = QuestionStreamParser()
+    questions = []
+    received = []
+    request_id = uuid.uuid4().hex
+    try:
+        with timer(LLM_SECONDS, backend=client.backend.name, kind='stream'):
+            async for text in client.stream(generate_quiz_prompt(description), timeout, generation.GENERATION_CONFIG):
+                received.append(text)
+                for obj, error in parser.feed(text):
+                    if obj is not None:
+                        try:
+                            question = QuizQuestion.model_validate(obj)
+                        except ValidationError:
+                            try:
+                                question = QuizQuestion.model_validate(repair_question(obj, len(questions) + 1))
+                            except ValidationError as e:
+                                error = f"Schema validation failed: {str(e)}"
+                    if error:
+                        logger.error(f"Dropping streamed question: {error}")
+                        yield format_event('invalid', {'error': error})
+                        continue
+                    questions.append(question)
+                    yield format_event('question', _public_question(question, len(questions)))
+    except LLMError as e:
+        archive_response(request_id, 'stream', ''.join(received))
+        logger.error(f"Error while streaming from the LLM: {e}")
+        yield format_event('failed', {'error': generation.generation_error(e).message})
+        return
+    except Exception as e:
+        archive_response(request_id, 'stream', ''.join(received))
+        logger.error(f"Error while streaming from the LLM: {e}")
+        yield format_event('failed', {'error': f'An unexpected error occurred: {str(e)}'})
+        return
+
+    archive_response(request_id, 'stream', ''.join(received))
+    if not questions:
+        yield format_event('failed', {'error': 'Received no valid questions from the LLM'})
+        return
+
+    # The questions were already shown, so they are stored as streamed
+    success, message, quiz_id = await sync_to_async(create_quiz)(questions, dedupe=False)
+    if not success:
+        logger.error(f"Failed to create quiz: {message}")
+        yield format_event('failed', {'error': f'Failed to create quiz: {message}'})
+        return
+
+    logger.info(f"Created streamed quiz with ID: {quiz_id}")
+    yield format_event('done', {
+        'quiz_id': quiz_id,
+        'quiz_url': reverse('quiz_detail', args=[quiz_id]),
+        'submit_url': reverse('submit_quiz', args=[quiz_id]),
+        'total': len(questions),
+        'questions': await sync_to_async(_stored_question_ids)(quiz_id, questions),
+    })
@@ -1,8 +1,52 @@
-from django.test import TestCase, Client
+import asyncio
+import gzip
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
-from .utils import validate_quiz_response, generate_quiz_prompt
+from django.utils import timezone
+from .analytics import median_seconds
+from .archive import ResponseArchive
+from .bank import matching_topics, select_questions
+from .batch import PROMPT_OVERHEAD_TOKENS, generate_quizzes, get_batch_config, pack_descriptions
+from .generation import generate_quiz
+from .ingest import AttemptBuffer
+from .benchmarks import FakeBatchBackend, fake_llm, sample_quiz_data, sample_quiz_response
+from .bulk import iter_json_array
+from .persistence import copy_questions, save_quiz, save_quizzes
+from .repair import repair_response, tolerant_loads
+from .search import search_question_ids
+from .schemas import QuizSchema
+from .jobs import STALE_JOB_ERROR, run_job
+from .metrics import LLM_SECONDS, REQUEST_QUERIES, STEP_SECONDS, Histogram, render
+from .llm import (
+    CircuitBreaker, CircuitOpen, FakeBackend, GeminiBackend, LLMClient, LLMError, RateLimited, TokenBucket,
+    get_backend_class, get_llm_client, inline_schema, object_schema, reset_llm_client, unwrap,
+)
+from .prompt_cache import HashingEmbedder, PromptCache, clone_quiz, normalize_description, reset_prompt_cache
+from .streaming import QuestionStreamParser
+from .vectors import MemoryVectorIndex, get_question_vectors, pack_vector, reset_question_vectors
+from .models import Quiz, Question, AnswerOption, Attempt, GenerationJob, QuestionEmbedding, QuestionStats, Response
+from .cache import get_quiz_cache, get_quiz_version
+from .utils import create_quiz, generate_quiz_prompt, parse_quiz_response, quiz_json_schema, validate_quiz_response
 import json
 
+SAMPLE_RESPONSE = '[{"id": "q_topic_001", "topic": "Python", "difficulty": "Easy", "type": "MCQ", "question_text": "What is Python?", "options": [{"option_id": "a", "text": "A snake"}, {"option_id": "b", "text": "A programming language"}, {"option_id": "c", "text": "A car"}, {"option_id": "d", "text": "A fruit"}], "correct_answer_id": "b", "explanation": "Python is a programming language."}]'
+
+
 class UtilsTestCase(TestCase):
     def test_generate_quiz_prompt(self):
         description = "Python programming"
@@ -22,8 +66,24 @@ class UtilsTestCase(TestCase):
         self.assertFalse(is_valid)
         self.assertIn("Schema validation failed", error_message)
         
+    def test_parse_quiz_response_strips_fences_and_returns_models(self):
+        fenced = '```json\n' + SAMPLE_RESPONSE + '\n```'
+        questions, error_message = parse_quiz_response(fenced)
+        self.assertEqual(error_message, "")
+        self.assertEqual(questions[0].correct_answer_id, "b")
+
+        success, message, quiz_id = create_quiz(questions)
+        self.assertTrue(success)
+        self.assertEqual(AnswerOption.objects.get(question__quiz_id=quiz_id, is_correct=True).option_text, "A programming language")
+
+    def test_parse_quiz_response_invalid_json(self):
+        questions, error_message = parse_quiz_response('[{"id": ')
+        self.assertIsNone(questions)
+        self.assertIn("Invalid JSON format", error_message)
+
 class QueryGeminiViewTestCase(TestCase):
     def setUp(self):
+        reset_prompt_cache()
         self.client = Client()
         self.url = reverse('query_gemini')  # Ensure this matches the name in your `urls.py`
 
@@ -38,12 +98,1255 @@ class QueryGeminiViewTestCase(TestCase):
         self.assertEqual(response.json(), {'error': 'Invalid request method'})
 
     def test_query_gemini_valid_request(self):
-        # Mock the model's `generate_content` method
-        from unittest.mock import patch
-        with patch('front.views.model.generate_content') as mock_generate_content:
-            mock_generate_content.return_value.parts = True
-            mock_generate_content.return_value.text = '[{"id": "q_topic_001", "topic": "Python", "difficulty": "Easy", "type": "MCQ", "question_text": "What is Python?", "options": [{"option_id": "a", "text": "A snake"}, {"option_id": "b", "text": "A programming language"}, {"option_id": "c", "text": "A car"}, {"option_id": "d", "text": "A fruit"}], "correct_answer_id": "b", "explanation": "Python is a programming language."}]'
+        # Stand in for the LLM provider
+        with fake_llm(FakeBackend('[{"id": "q_topic_001", "topic": "Python", "difficulty": "Easy", "type": "MCQ", "question_text": "What is Python?", "options": [{"option_id": "a", "text": "A snake"}, {"option_id": "b", "text": "A programming language"}, {"option_id": "c", "text": "A car"}, {"option_id": "d", "text": "A fruit"}], "correct_answer_id": "b", "explanation": "Python is a programming language."}]')):
+            response = self.client.post(self.url, json.dumps({"description": "Python programming"}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertTrue(Quiz.objects.filter(pk=data['quiz_id']).exists())
+        self.assertEqual(data['quiz_url'], reverse('quiz_detail', args=[data['quiz_id']]))
 
+    @override_settings(QUIZ_GENERATION_TIMEOUT=0.01)
+    def test_query_gemini_timeout(self):
+        with fake_llm(FakeBackend(SAMPLE_RESPONSE, latency=1)):
             response = self.client.post(self.url, json.dumps({"description": "Python programming"}), content_type="application/json")
+        self.assertEqual(response.status_code, 504)
+        self.assertIn("timed out", response.json()['error'])
+
+def make_quiz(num_questions, title="Sample quiz"):
+    """Create a quiz with `num_questions` four-option questions."""
+    quiz = Quiz.objects.create(title=title)
+    for order in range(1, num_questions + 1):
+        question = Question.objects.create(
+            quiz=quiz,
+            question_text=f"Question {order}?",
+            order_in_quiz=order,
+        )
+        AnswerOption.objects.bulk_create([
+            AnswerOption(question=question, option_text=f"Option {letter}", is_correct=(letter == 'a'))
+            for letter in 'abcd'
+        ])
+    return quiz
+
+
+@override_settings(QUIZ_JOBS_EAGER=True)
+class GenerationJobTestCase(TestCase):
+    def setUp(self):
+        reset_prompt_cache()
+
+    def post_job(self, description="Python programming"):
+        return self.client.post(reverse('create_generation_job'), json.dumps({"description": description}), content_type="application/json")
+
+    def test_create_job_requires_description(self):
+        response = self.post_job(description="")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_job_succeeds_and_reports_quiz_url(self):
+        with fake_llm(FakeBackend(SAMPLE_RESPONSE)):
+            response = self.post_job()
+
+        self.assertEqual(response.status_code, 202)
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], GenerationJob.SUCCEEDED)
+        self.assertEqual(status['quiz_url'], reverse('quiz_detail', args=[status['quiz_id']]))
+
+    def test_gemini_jobs_each_get_a_client_on_their_own_loop(self):
+        from unittest.mock import patch
+        from google.generativeai import client as genai_client, protos
+
+        class LoopBoundClient:
+            # Like the SDK's gRPC aio client, only usable on the loop it was created on
+            def __init__(self):
+                self.loop = asyncio.get_running_loop()
+
+            async def generate_content(self, request, **kwargs):
+                if asyncio.get_running_loop() is not self.loop:
+                    raise RuntimeError("Event loop is closed")
+                return protos.GenerateContentResponse(candidates=[{'content': {'parts': [{'text': SAMPLE_RESPONSE}]}}])
+
+        with patch.object(genai_client._client_manager, 'make_client', lambda name: LoopBoundClient()), \
+                patch.dict(genai_client._client_manager.clients), \
+                patch('front.llm._client', LLMClient(GeminiBackend(), max_concurrency=10_000)):
+            # Each job runs on a fresh event loop, as on the executor's threads
+            responses = [self.post_job("Python programming"), self.post_job("Python generators")]
+
+        for response in responses:
+            status = self.client.get(response.json()['status_url']).json()
+            self.assertEqual(status['status'], GenerationJob.SUCCEEDED, status.get('error'))
+
+    def test_job_failure_is_reported(self):
+        with fake_llm(FakeBackend('not json')):
+            response = self.post_job()
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], GenerationJob.FAILED)
+        self.assertIn("Invalid response format", status['error'])
+
+    def test_stale_running_job_is_failed(self):
+        job = GenerationJob.objects.create(description="Python", status=GenerationJob.RUNNING)
+        url = reverse('job_status', args=[job.job_id])
+        self.assertEqual(self.client.get(url).json()['status'], GenerationJob.RUNNING)
+
+        GenerationJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        status = self.client.get(url).json()
+        self.assertEqual((status['status'], status['error']), (GenerationJob.FAILED, STALE_JOB_ERROR))
+
+    def test_job_runs_only_once(self):
+        job = GenerationJob.objects.create(description="Python", status=GenerationJob.SUCCEEDED)
+        run_job(job.job_id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.SUCCEEDED)
+
+
+class StreamingTestCase(TestCase):
+    def test_parser_handles_split_chunks_and_fences(self):
+        text = '```json\n[{"a": "brace } in string", "b": {"c": 1}}, {"a": "quote \\" here"}]\n```'
+        parser = QuestionStreamParser()
+        objects = []
+        for i in range(0, len(text), 3):
+            objects.extend(obj for obj, error in parser.feed(text[i:i + 3]))
+        self.assertEqual(objects, [{"a": "brace } in string", "b": {"c": 1}}, {"a": 'quote " here'}])
+
+    async def test_stream_quiz_sends_questions_then_done(self):
+        questions = json.loads(SAMPLE_RESPONSE)
+        broken = dict(questions[0], options=questions[0]['options'][:3])
+        text = json.dumps([questions[0], broken, dict(questions[0], id="q_topic_002")])
+
+        with fake_llm(FakeBackend(text, chunk_size=7)):
+            response = await self.async_client.get(reverse('stream_quiz'), {'description': 'Python'})
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [block.split('\n')[0] for block in body.strip().split('\n\n')]
+        self.assertEqual(events, ['event: question', 'event: invalid', 'event: question', 'event: done'])
+        done = json.loads(body.strip().split('\n\n')[-1].split('data: ', 1)[1])
+        self.assertEqual(await Question.objects.filter(quiz_id=done['quiz_id']).acount(), 2)
+        self.assertNotIn('correct_answer_id', body)
+        correct = await AnswerOption.objects.aget(question_id=done['questions'][0]['question_id'], is_correct=True)
+        self.assertEqual(done['questions'][0]['options']['b'], correct.option_id)
+
+    def test_stream_quiz_requires_description(self):
+        response = self.client.get(reverse('stream_quiz'))
+        self.assertEqual(response.status_code, 400)
+
+
+class PromptCacheTestCase(TestCase):
+    def make_cache(self, **kwargs):
+        options = dict(ttl=60, max_entries=10, similarity_threshold=0.8, embedder=HashingEmbedder())
+        options.update(kwargs)
+        return PromptCache(**options)
+
+    def test_normalize_description_ignores_order_and_filler(self):
+        self.assertEqual(
+            normalize_description("Photosynthesis quiz for 8th grade!"),
+            normalize_description("8th grade photosynthesis"),
+        )
+
+    def test_exact_and_similar_hits(self):
+        quiz = make_quiz(1)
+        cache = self.make_cache()
+        cache.store("photosynthesis quiz for 8th grade", quiz.quiz_id)
+
+        self.assertEqual(cache.lookup("8th grade photosynthesis"), quiz.quiz_id)
+        self.assertEqual(cache.lookup("8th grade photosynthesys"), quiz.quiz_id)
+        self.assertIsNone(cache.lookup("9th grade photosynthesis"))
+        self.assertIsNone(cache.lookup("roman history"))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['similar_hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_different_numbers_never_match(self):
+        quiz = make_quiz(1)
+        cache = self.make_cache(similarity_threshold=0.5)
+        cache.store("world war 1", quiz.quiz_id)
+        cache.store("multiplication tables 7", quiz.quiz_id)
+        self.assertIsNone(cache.lookup("world war 2"))
+        self.assertIsNone(cache.lookup("multiplication tables 8"))
+        self.assertEqual(cache.lookup("world war 1 history"), quiz.quiz_id)
+
+    def test_question_count_is_part_of_the_key(self):
+        quiz = make_quiz(5)
+        cache = self.make_cache(similarity_threshold=0.5)
+        cache.store("volcanoes", quiz.quiz_id, num_questions=5)
+        self.assertIsNone(cache.lookup("volcanoes"))
+        self.assertIsNone(cache.lookup("volcanoes", num_questions=20))
+        self.assertEqual(cache.lookup("volcanoes", num_questions=5), quiz.quiz_id)
+
+    def test_expired_entries_are_not_served(self):
+        quiz = make_quiz(1)
+        cache = self.make_cache(ttl=0)
+        cache.store("volcanoes", quiz.quiz_id)
+        time.sleep(0.01)
+        self.assertIsNone(cache.lookup("volcanoes"))
+
+    def test_lru_bound_evicts_oldest(self):
+        quiz = make_quiz(1)
+        cache = self.make_cache(max_entries=2, embedder=None)
+        for topic in ("volcanoes", "glaciers", "deserts"):
+            cache.store(topic, quiz.quiz_id)
+        self.assertIsNone(cache.lookup("volcanoes"))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_clone_serves_a_copy(self):
+        quiz = make_quiz(3)
+        cache = self.make_cache(clone=True)
+        cache.store("volcanoes", quiz.quiz_id)
+        clone_id = cache.lookup("volcanoes")
+        self.assertNotEqual(clone_id, quiz.quiz_id)
+        self.assertEqual(AnswerOption.objects.filter(question__quiz_id=clone_id).count(), 12)
+
+    def test_clone_is_searchable_and_embedded(self):
+        reset_question_vectors()
+        self.addCleanup(reset_question_vectors)
+        _, _, quiz_id = create_quiz(SAMPLE_RESPONSE)
+        clone_id = clone_quiz(quiz_id)
+
+        clones = Question.objects.filter(quiz_id=clone_id)
+        self.assertEqual([question.origin_id for question in clones], list(Question.objects.filter(quiz_id=quiz_id).values_list('pk', flat=True)))
+        self.assertTrue(set(search_question_ids("programming", limit=10)) & set(clones.values_list('pk', flat=True)))
+        self.assertEqual(QuestionEmbedding.objects.filter(quiz_id=clone_id).count(), clones.count())
+
+    def test_deleted_quiz_is_a_miss(self):
+        quiz = make_quiz(1)
+        cache = self.make_cache()
+        cache.store("volcanoes", quiz.quiz_id)
+        quiz.delete()
+        self.assertIsNone(cache.lookup("volcanoes"))
+
+
+class ResponseArchiveTestCase(TestCase):
+    def test_records_are_compressed_rotated_and_capped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = ResponseArchive(directory, max_bytes=200, backup_count=2, queue_size=100)
+            for i in range(20):
+                archive.submit(f"req{i}", 'generate', os.urandom(64).hex())
+            archive.close()
+
+            files = sorted(Path(directory).glob('*.jsonl.gz'))
+            self.assertLessEqual(len(files), 3)
+            records = [json.loads(line) for path in files for line in gzip.open(path, 'rt')]
+            self.assertEqual(records[-1]['request_id'], "req19")
+            self.assertEqual(archive.written, 20)
+
+    def test_processes_write_separate_files(self):
+        from unittest.mock import patch
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in (101, 102):
+                with patch('front.archive.os.getpid', return_value=pid), patch('front.archive._pid_alive', return_value=True):
+                    archive = ResponseArchive(directory, max_bytes=10 ** 6, backup_count=1, queue_size=10)
+                    archive.submit(f"req{pid}", 'generate', "text")
+                    archive.close()
+            for pid in (101, 102):
+                with gzip.open(Path(directory) / f"responses.{pid}.jsonl.gz", 'rt') as fileobj:
+                    self.assertEqual([json.loads(line)['request_id'] for line in fileobj], [f"req{pid}"])
+
+    def test_files_of_exited_processes_are_rotated_and_capped(self):
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        dead_pid = int(exited.stdout)
+        with tempfile.TemporaryDirectory() as directory:
+            for time_ns in (1_700_000_000_000_000_000, 1_700_000_000_000_000_001):
+                with gzip.open(Path(directory) / f"responses-{time_ns}-1.jsonl.gz", 'wt') as fileobj:
+                    fileobj.write('{"request_id": "old"}\n')
+            with gzip.open(Path(directory) / f"responses.{dead_pid}.jsonl.gz", 'wt') as fileobj:
+                fileobj.write('{"request_id": "orphan"}\n')
+
+            archive = ResponseArchive(directory, max_bytes=10 ** 6, backup_count=2, queue_size=10)
+            archive.close()
+
+            self.assertFalse((Path(directory) / f"responses.{dead_pid}.jsonl.gz").exists())
+            backups = sorted(Path(directory).glob('responses-*.jsonl.gz'))
+            self.assertEqual(len(backups), 2)
+            with gzip.open(backups[-1], 'rt') as fileobj:
+                self.assertEqual(json.loads(fileobj.read())['request_id'], "orphan")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = ResponseArchive(directory, max_bytes=10 ** 6, backup_count=1, queue_size=1)
+            results = [archive.submit(f"req{i}", 'generate', "x" * 1000) for i in range(200)]
+            archive.close()
+            self.assertEqual(results.count(False), archive.dropped)
+
+
+class QuizBankTestCase(TestCase):
+    def test_iter_json_array_reads_in_small_chunks(self):
+        data = [[{"text": "caf\u00e9 {not a brace}"}], [], [{"n": 1}, {"n": 2}]]
+        fileobj = io.BytesIO(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.assertEqual(list(iter_json_array(fileobj, read_size=3)), data)
+
+    def test_export_then_import_round_trip(self):
+        make_quiz(3, title="Quiz about Volcanoes")
+        make_quiz(2, title="Quiz about Glaciers")
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f"bank.{fmt}") for fmt in ('json', 'jsonl')]
+            for path in paths:
+                call_command('export_quizzes', path, stdout=io.StringIO())
+            for path in paths:
+                call_command('import_quizzes', path, batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(Quiz.objects.filter(title="Quiz about Volcanoes").count(), 3)
+        imported = Quiz.objects.with_questions().filter(title="Quiz about Glaciers").first()
+        self.assertEqual([q.question_text for q in imported.questions.all()], ["Question 1?", "Question 2?"])
+        self.assertEqual(AnswerOption.objects.filter(question__quiz=imported, is_correct=True).get(question__order_in_quiz=1).option_text, "Option a")
+
+    def test_export_ids_stay_valid_for_high_orders(self):
+        quiz = make_quiz(2, title="Quiz about Volcanoes")
+        Question.objects.filter(quiz=quiz, order_in_quiz=2).update(order_in_quiz=1000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bank.jsonl")
+            call_command('export_quizzes', path, stdout=io.StringIO())
+            call_command('import_quizzes', path, stdout=io.StringIO())
+
+        imported = Quiz.objects.with_questions().exclude(pk=quiz.pk).get()
+        self.assertEqual([q.question_text for q in imported.questions.all()], ["Question 1?", "Question 2?"])
+
+    def test_import_skips_invalid_quizzes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bank.jsonl")
+            with open(path, 'w') as fileobj:
+                fileobj.write(SAMPLE_RESPONSE + '\n' + '[{"id": "broken"}]\n')
+            call_command('import_quizzes', path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Quiz.objects.count(), 1)
+
+
+class PersistenceTestCase(TestCase):
+    def questions(self, count, topic="Python"):
+        return QuizSchema.model_validate(sample_quiz_data(count, topic=topic)).root
+
+    def test_save_quizzes_in_three_inserts(self):
+        with self.assertNumQueries(6):  # SAVEPOINT + 3 INSERTs + search index INSERT + RELEASE
+            quiz_ids = save_quizzes([self.questions(3), self.questions(5, topic="Rust")])
+        self.assertEqual([Question.objects.filter(quiz_id=quiz_id).count() for quiz_id in quiz_ids], [3, 5])
+        self.assertEqual(Quiz.objects.get(pk=quiz_ids[1]).title, "Quiz about Rust")
+
+    def test_failure_leaves_nothing_behind(self):
+        from unittest.mock import patch
+        original_bulk_create = QuerySet.bulk_create
+
+        def failing_bulk_create(queryset, objs, *args, **kwargs):
+            if queryset.model is AnswerOption:
+                raise RuntimeError("boom")
+            return original_bulk_create(queryset, objs, *args, **kwargs)
+
+        with patch.object(QuerySet, 'bulk_create', failing_bulk_create):
+            success, message, quiz_id = create_quiz(self.questions(3))
+        self.assertFalse(success)
+        self.assertFalse(Quiz.objects.exists())
+        self.assertFalse(Question.objects.exists())
+
+    def test_backend_without_returned_pks(self):
+        from unittest.mock import PropertyMock, patch
+        features = type(connection.features)
+        with patch.object(features, 'can_return_rows_from_bulk_insert', new_callable=PropertyMock, return_value=False):
+            quiz_ids = save_quizzes([self.questions(2), self.questions(3)])
+        for quiz_id in quiz_ids:
+            for question in Question.objects.filter(quiz_id=quiz_id):
+                self.assertEqual(question.options.get(is_correct=True).option_text, f"Option b for question {question.order_in_quiz}")
+
+    def test_repeated_ids_fall_back_to_position(self):
+        questions = self.questions(3)
+        for question in questions:
+            question.id = "q_topic_001"
+        quiz_id = save_quiz(questions)
+        self.assertEqual(list(Question.objects.filter(quiz_id=quiz_id).values_list('order_in_quiz', flat=True)), [1, 2, 3])
+
+
+class QuizDetailViewTestCase(TestCase):
+    def setUp(self):
+        get_quiz_cache().clear()
+
+    def test_quiz_detail_renders_questions_in_order(self):
+        quiz = make_quiz(3)
+        response = self.client.get(reverse('quiz_detail', args=[quiz.quiz_id]))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertLess(content.index("Question 1?"), content.index("Question 3?"))
+
+    def test_quiz_detail_query_count_is_constant(self):
+        small = make_quiz(1, title="Small")
+        large = make_quiz(50, title="Large")
+        with self.assertNumQueries(3):
+            self.client.get(reverse('quiz_detail', args=[small.quiz_id]))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('quiz_detail', args=[large.quiz_id]))
+
+    def test_admin_change_view_query_count_is_constant(self):
+        from django.contrib.auth.models import User
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        counts = []
+        for quiz in (make_quiz(1, title="Small"), make_quiz(20, title="Large")):
+            url = reverse('admin:front_quiz_change', args=[quiz.quiz_id])
+            self.client.get(url)  # Warm the content type cache
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_quiz_detail_cache_hit_makes_no_queries(self):
+        quiz = make_quiz(5)
+        url = reverse('quiz_detail', args=[quiz.quiz_id])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+
+    def test_quiz_detail_cache_invalidated_on_edit(self):
+        quiz = make_quiz(2)
+        url = reverse('quiz_detail', args=[quiz.quiz_id])
+        self.client.get(url)
+        version = get_quiz_version(quiz.quiz_id)
+
+        option = AnswerOption.objects.filter(question__quiz=quiz).first()
+        option.option_text = "Edited option"
+        with self.captureOnCommitCallbacks(execute=True):
+            option.save()
+            # Until the edit commits, other connections may still read the old content
+            self.assertEqual(get_quiz_version(quiz.quiz_id), version)
+        self.assertContains(self.client.get(url), "Edited option")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.filter(quiz=quiz, order_in_quiz=2).get().delete()
+        self.assertNotContains(self.client.get(url), "Question 2?")
+
+    def test_quiz_detail_missing_quiz(self):
+        response = self.client.get(reverse('quiz_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_quizzes_leave_nothing_in_the_cache(self):
+        self.assertEqual(self.client.get(reverse('quiz_detail', args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('quiz_api', args=[999])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('submit_quiz', args=[999]), '{}', content_type='application/json').status_code, 404)
+        self.assertEqual(list(get_quiz_cache()._cache), [])
+
+        quiz = make_quiz(1)
+        self.client.get(reverse('quiz_detail', args=[quiz.quiz_id]))
+        self.assertEqual(get_quiz_cache().get(f"quiz:{quiz.quiz_id}:version"), get_quiz_version(quiz.quiz_id))
+
+
+class QuizApiTestCase(TestCase):
+    def setUp(self):
+        get_quiz_cache().clear()
+        self.quiz = make_quiz(5)
+        self.url = reverse('quiz_api', args=[self.quiz.quiz_id])
+
+    def test_returns_compact_quiz_without_answers(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_questions'], 5)
+        self.assertEqual([question['text'] for question in data['questions']], [f"Question {n}?" for n in range(1, 6)])
+        self.assertEqual(len(data['questions'][0]['options']), 4)
+        self.assertNotIn(b'is_correct', response.content)
+        self.assertNotIn(b', ', response.content)
+
+    def test_etag_revalidation_makes_no_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_on_edit(self):
+        etag = self.client.get(self.url)['ETag']
+        option = AnswerOption.objects.filter(question__quiz=self.quiz).first()
+        option.option_text = "Edited option"
+        with self.captureOnCommitCallbacks(execute=True):
+            option.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, "Edited option")
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        revalidated = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_pages(self):
+        data = self.client.get(self.url, {'page': 2, 'page_size': 2}).json()
+        self.assertEqual((data['page'], data['num_pages'], data['total_questions']), (2, 3, 5))
+        self.assertEqual([question['text'] for question in data['questions']], ["Question 3?", "Question 4?"])
+        self.assertEqual(self.client.get(self.url, {'page': 4, 'page_size': 2}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'page': 'x'}).status_code, 400)
+
+    def test_missing_quiz(self):
+        self.assertEqual(self.client.get(reverse('quiz_api', args=[999])).status_code, 404)
+
+
+class QuizCatalogueTestCase(TestCase):
+    def walk(self, **params):
+        url, titles = reverse('quiz_catalogue'), []
+        query = params
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url, query).json()
+            titles += [quiz['title'] for quiz in data['quizzes']]
+            url, query = data['next'], None
+        return titles
+
+    def test_pages_newest_first_without_gaps(self):
+        for number in range(5):
+            make_quiz(1, title=f"Quiz {number}")
+        # Equal timestamps are ordered by id, so no quiz is skipped or repeated
+        Quiz.objects.filter(title__in=["Quiz 1", "Quiz 2", "Quiz 3"]).update(created_at=Quiz.objects.get(title="Quiz 1").created_at)
+        self.assertEqual(self.walk(limit=2), [f"Quiz {number}" for number in (4, 3, 2, 1, 0)])
+
+    def test_topic_filter(self):
+        save_quiz(QuizSchema.model_validate(sample_quiz_data(2, topic="Rivers")).root)
+        save_quiz(QuizSchema.model_validate(sample_quiz_data(2, topic="Mountains")).root)
+        self.assertEqual(self.walk(topic="Rivers"), ["Quiz about Rivers"])
+        self.assertEqual(Quiz.objects.get(title="Quiz about Mountains").topic, "Mountains")
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('quiz_catalogue'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DatabaseProfileTestCase(TestCase):
+    def pragmas(self, profile):
+        # (synchronous, busy_timeout) of a connection opened under `profile`
+        with override_settings(QUIZ_DB_PROFILE=profile):
+            db_connection = connections.create_connection('default')
+            try:
+                with db_connection.cursor() as cursor:
+                    cursor.execute("PRAGMA synchronous")
+                    synchronous = cursor.fetchone()[0]
+                    cursor.execute("PRAGMA busy_timeout")
+                    return synchronous, cursor.fetchone()[0]
+            finally:
+                db_connection.close()
+
+    def test_profiles(self):
+        # synchronous: 1 is NORMAL, 2 (the default) is FULL
+        self.assertEqual(self.pragmas('tuned'), (1, 10000))
+        self.assertEqual(self.pragmas('plain')[0], 2)
+
+
+@override_settings(QUIZ_ATTEMPT_BUFFER={'ENABLED': False})
+class SubmitQuizTestCase(TestCase):
+    def setUp(self):
+        get_quiz_cache().clear()
+        self.quiz = make_quiz(3)
+        self.url = reverse('submit_quiz', args=[self.quiz.quiz_id])
+        self.options = {
+            question.question_id: list(question.options.all())
+            for question in self.quiz.questions.prefetch_related('options')
+        }
+
+    def submit(self, answers):
+        return self.client.post(self.url, json.dumps({'answers': answers}), content_type='application/json')
+
+    def test_submission_is_graded_and_recorded(self):
+        first, second, third = self.options
+        response = self.submit({
+            first: self.options[first][0].option_id,  # correct
+            second: self.options[second][1].option_id,  # wrong
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['score'], data['total'], data['percent']), (1, 3, 33))
+        self.assertEqual([result['is_correct'] for result in data['results']], [True, False, False])
+
+        attempt = Attempt.objects.get(attempt_id=data['attempt_id'])
+        self.assertEqual(attempt.score, 1)
+        self.assertEqual(Response.objects.filter(attempt=attempt).count(), 3)
+
+    def test_answer_key_is_cached(self):
+        self.submit({})
+        # Attempt and response inserts plus the question stats upsert, inside a savepoint
+        with self.assertNumQueries(6):
+            self.submit({})
+
+    def test_foreign_option_is_rejected(self):
+        other = make_quiz(1, title="Other")
+        question_id = next(iter(self.options))
+        response = self.submit({question_id: other.questions.get().options.first().option_id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+
+    def test_unknown_quiz(self):
+        response = self.client.post(reverse('submit_quiz', args=[999]), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_quiz_page_does_not_expose_answers(self):
+        response = self.client.get(reverse('quiz_detail', args=[self.quiz.quiz_id]))
+        self.assertNotContains(response, 'data-correct')
+
+    def test_full_attempt_buffer_answers_503(self):
+        from unittest.mock import patch
+        with patch('front.views.ingest_attempt', return_value=False):
+            response = self.submit({})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class AttemptBufferTestCase(TestCase):
+    def make_graded(self, num_responses=1):
+        from types import SimpleNamespace
+        return SimpleNamespace(responses=[None] * num_responses)
+
+    def test_batches_by_rows_and_interval(self):
+        batches = []
+        buffer = AttemptBuffer(flush_interval=0.05, max_batch_rows=4, queue_size=100, writer=batches.append)
+        for _ in range(3):
+            buffer.submit(self.make_graded())  # 2 rows each, so the second fills a batch
+        self.assertTrue(buffer.flush())
+        buffer.close()
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        stats = buffer.stats()
+        self.assertEqual((stats['written'], stats['flushes'], stats['depth']), (3, 2, 0))
+
+        batches.clear()
+        buffer = AttemptBuffer(flush_interval=0.05, max_batch_rows=1000, queue_size=100, writer=batches.append)
+        buffer.submit(self.make_graded())
+        time.sleep(0.3)
+        self.assertEqual(len(batches), 1)  # Written on the interval, without a flush
+        buffer.close()
+
+    def test_full_queue_refuses_and_close_drains(self):
+        import threading
+        release = threading.Event()
+        written = []
+
+        def slow_writer(batch):
+            release.wait(5)
+            written.extend(batch)
+
+        buffer = AttemptBuffer(flush_interval=0, max_batch_rows=1, queue_size=2, writer=slow_writer)
+        accepted = [buffer.submit(self.make_graded()) for _ in range(5)]
+        self.assertIn(False, accepted)
+        self.assertEqual(buffer.stats()['rejected'], accepted.count(False))
+        release.set()
+        buffer.close()
+        self.assertEqual(len(written), accepted.count(True))
+
+    def test_failed_batch_is_counted(self):
+        def broken_writer(batch):
+            raise ValueError("boom")
+
+        buffer = AttemptBuffer(flush_interval=0, max_batch_rows=1, queue_size=10, writer=broken_writer)
+        buffer.submit(self.make_graded())
+        buffer.close()
+        self.assertEqual((buffer.stats()['failed'], buffer.stats()['written']), (1, 0))
+
+    def test_bad_attempt_does_not_lose_the_batch(self):
+        bad = self.make_graded()
+        written = []
+
+        def writer(batch):
+            if any(graded is bad for graded in batch):
+                raise ValueError("quiz was deleted")
+            written.extend(batch)
+
+        buffer = AttemptBuffer(flush_interval=10, max_batch_rows=1000, queue_size=10, writer=writer)
+        good = [self.make_graded() for _ in range(3)]
+        for graded in (good[0], bad, *good[1:]):
+            buffer.submit(graded)
+        buffer.close()
+        self.assertEqual(written, good)
+        self.assertEqual((buffer.stats()['failed'], buffer.stats()['written']), (1, 3))
+
+
+@override_settings(QUIZ_ATTEMPT_BUFFER={'ENABLED': False})
+class QuizStatsTestCase(TestCase):
+    def setUp(self):
+        get_quiz_cache().clear()
+        self.quiz = make_quiz(2)
+        self.questions = list(self.quiz.questions.prefetch_related('options'))
+        self.stats_url = reverse('quiz_stats', args=[self.quiz.quiz_id])
+
+    def submit(self, option_index, seconds):
+        first, second = self.questions
+        body = {
+            'answers': {first.question_id: first.options.all()[option_index].option_id},
+            'seconds': {first.question_id: seconds},
+        }
+        response = self.client.post(reverse('submit_quiz', args=[self.quiz.quiz_id]), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_stats_are_updated_incrementally(self):
+        for option_index, seconds in ((0, 3), (0, 4), (1, 12), (2, 4.5)):
+            self.submit(option_index, seconds)
+
+        stats = self.client.get(self.stats_url).json()
+        self.assertEqual(stats['attempts'], 4)
+        first, second = stats['questions']
+        self.assertEqual((first['answered'], first['correct'], first['percent_correct']), (4, 2, 50.0))
+        self.assertEqual([option['selected'] for option in first['options']], [2, 1, 1, 0])
+        self.assertEqual(first['median_seconds'], 4.0)  # Two of four answers fall in the 2-5s bucket
+        self.assertEqual((second['answered'], second['correct'], second['median_seconds']), (4, 0, None))
+
+    def test_stats_query_count_does_not_grow_with_attempts(self):
+        self.submit(0, 3)
+        with self.assertNumQueries(4):
+            self.client.get(self.stats_url)
+        for _ in range(10):
+            self.submit(1, 8)
+        with self.assertNumQueries(4):
+            self.client.get(self.stats_url)
+
+    def test_rebuild_matches_incremental_stats(self):
+        for option_index, seconds in ((0, 1), (3, 400), (0, 30)):
+            self.submit(option_index, seconds)
+        expected = self.client.get(self.stats_url).json()
+
+        QuestionStats.objects.update(answered=0, correct=0)
+        call_command('rebuild_quiz_stats', str(self.quiz.quiz_id), stdout=io.StringIO())
+        self.assertEqual(self.client.get(self.stats_url).json(), expected)
+
+    def test_median_seconds_interpolates_within_bucket(self):
+        self.assertIsNone(median_seconds({}))
+        self.assertEqual(median_seconds({0: 1, 1: 1}), 2.0)
+        self.assertEqual(median_seconds({2: 4}), 7.5)  # Halfway through the 5-10s bucket
+        self.assertEqual(median_seconds({12: 3}), 300.0)  # Open-ended last bucket
+
+    def test_negative_time_is_rejected(self):
+        first = self.questions[0]
+        body = {'answers': {}, 'seconds': {first.question_id: -1}}
+        response = self.client.post(reverse('submit_quiz', args=[self.quiz.quiz_id]), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.quiz_id = save_quiz(QuizSchema.model_validate_json(SAMPLE_RESPONSE).root)
+        self.question = Question.objects.get(quiz_id=self.quiz_id)
+
+    def search(self, query):
+        return self.client.get(reverse('search'), {'q': query}).json()['results']
+
+    def test_bulk_saved_quizzes_are_searchable(self):
+        self.assertEqual([r['question_id'] for r in self.search("What is Python")], [self.question.question_id])
+        self.assertEqual(len(self.search("programming language")), 1)  # Option text
+        self.assertEqual(len(self.search("quiz about pyth")), 1)  # Title, with a prefix
+        self.assertEqual(self.search("haskell"), [])
+
+    def test_edits_update_the_index(self):
+        quiz = make_quiz(2, title="Geography")
+        question = quiz.questions.get(order_in_quiz=1)
+        self.assertCountEqual(search_question_ids("geography"), quiz.questions.values_list('pk', flat=True))
+
+        option = question.options.first()
+        option.option_text = "Kilimanjaro"
+        option.save()
+        self.assertEqual(search_question_ids("kilimanjaro"), [question.pk])
+
+        quiz.title = "Mountains"
+        quiz.save()
+        self.assertEqual(len(search_question_ids("mountains")), 2)
+
+        question.delete()
+        self.assertEqual(search_question_ids("kilimanjaro"), [])
+
+    def test_quiz_delete_unindexes_in_bulk(self):
+        from django.test.utils import CaptureQueriesContext
+        counts = []
+        for quiz in (make_quiz(1, title="Small volcanoes"), make_quiz(10, title="Large volcanoes")):
+            with CaptureQueriesContext(connection) as queries:
+                quiz.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(search_question_ids("volcanoes"), [])
+
+    def test_search_requires_query(self):
+        self.assertEqual(self.client.get(reverse('search')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'python', 'limit': 'x'}).status_code, 400)
+
+    def test_admin_search_uses_index(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:front_question_changelist'), {'q': 'programming'})
+        self.assertContains(response, str(self.question))
+        response = self.client.get(reverse('admin:front_quiz_changelist'), {'q': 'snake'})
+        self.assertContains(response, "Quiz about Python")
+
+        Quiz.objects.create(title="Empty quiz on glaciers")
+        response = self.client.get(reverse('admin:front_quiz_changelist'), {'q': 'glaciers'})
+        self.assertContains(response, "Empty quiz on glaciers")
+        self.assertNotContains(response, "Quiz about Python")
+
+
+class VectorIndexTestCase(TestCase):
+    def setUp(self):
+        reset_question_vectors()
+
+    def tearDown(self):
+        reset_question_vectors()
+
+    def questions(self, *texts, topic="Python"):
+        base = json.loads(SAMPLE_RESPONSE)[0]
+        return QuizSchema.model_validate([
+            dict(base, id=f"q_topic_{i:03d}", topic=topic, question_text=text)
+            for i, text in enumerate(texts, start=1)
+        ]).root
+
+    def stored_texts(self, quiz_id):
+        return list(Question.objects.filter(quiz_id=quiz_id).values_list('question_text', flat=True))
+
+    def test_duplicates_are_dropped_at_ingest(self):
+        create_quiz(self.questions("What does the len function return for a list?"))
+        success, message, quiz_id = create_quiz(self.questions(
+            "What does the len function return for a list",  # Near-duplicate of the first quiz
+            "Which keyword defines a generator function?",
+            "Which keyword defines a generator function?",  # Repeated within the quiz
+        ))
+        self.assertTrue(success)
+        self.assertEqual(self.stored_texts(quiz_id), ["Which keyword defines a generator function?"])
+        self.assertEqual(QuestionEmbedding.objects.count(), 2)
+
+    def test_similar_questions_are_kept_by_default(self):
+        create_quiz(self.questions("Which year did World War 1 end?"))
+        success, message, quiz_id = create_quiz(self.questions("Which year did World War 2 end?", "Who painted the Mona Lisa?"))
+        self.assertTrue(success)
+        self.assertEqual(self.stored_texts(quiz_id), ["Which year did World War 2 end?", "Who painted the Mona Lisa?"])
+
+    def test_all_duplicate_quiz_is_kept(self):
+        create_quiz(self.questions("What is a Python decorator?"))
+        success, message, quiz_id = create_quiz(self.questions("What is a Python decorator?"))
+        self.assertTrue(success)
+        self.assertEqual(self.stored_texts(quiz_id), ["What is a Python decorator?"])
+
+    def test_related_quizzes(self):
+        _, _, python_id = create_quiz(self.questions("How do Python list comprehensions work?", "What are Python generators used for?"))
+        _, _, cooking_id = create_quiz(self.questions("How long should pasta boil?", "Which oil is best for frying?", topic="Cooking"))
+        _, _, other_python_id = create_quiz(self.questions("When should Python list comprehensions be avoided?", "How are Python generators consumed?"))
+
+        response = self.client.get(reverse('related_quizzes', args=[other_python_id]))
+        related = [quiz['quiz_id'] for quiz in response.json()['related']]
+        self.assertEqual(related[0], python_id)
+        self.assertNotIn(other_python_id, related)
+        self.assertEqual(self.client.get(reverse('related_quizzes', args=[999])).status_code, 404)
+
+    def test_bulk_imports_are_embedded_in_batches(self):
+        from unittest.mock import patch
+        save_quizzes([self.questions(*[f"Bulk question number {i}?" for i in range(5)])])
+        self.assertEqual(QuestionEmbedding.objects.count(), 0)
+        question_vectors = get_question_vectors()
+        with patch.object(question_vectors, 'batch_size', 2), patch.object(question_vectors.embedder, 'embed', wraps=question_vectors.embedder.embed) as embed:
+            call_command('embed_questions', stdout=io.StringIO())
+        self.assertEqual(embed.call_count, 3)
+        self.assertEqual(QuestionEmbedding.objects.count(), 5)
+
+    def test_refresh_sees_late_and_reembedded_rows(self):
+        _, _, quiz_id = create_quiz(self.questions("What is a Python decorator?", "What does yield do?", "What is a list?"))
+        first, second, third = QuestionEmbedding.objects.filter(quiz_id=quiz_id).order_by('question_id')
+        QuestionEmbedding.objects.filter(pk=first.pk).delete()  # Not committed yet by the process writing it
+        index = MemoryVectorIndex(refresh_interval=0)
+        index.search([[1.0] + [0.0] * 255], k=1)
+        self.assertEqual(len(index), 2)
+
+        # Committed after the load, with a lower id than rows already seen
+        QuestionEmbedding.objects.create(question_id=first.question_id, quiz_id=quiz_id, embedder=first.embedder, vector=first.vector)
+        third.vector = pack_vector([1.0] + [0.0] * 255)
+        third.save()  # Re-embedded by another process
+        matches = index.search([[1.0] + [0.0] * 255], k=1)[0]
+        self.assertEqual(len(index), 3)
+        self.assertEqual(matches[0][0], third.question_id)
+        self.assertAlmostEqual(matches[0][2], 1.0, places=5)
+
+    def test_index_is_off_without_an_embedder(self):
+        with override_settings(QUIZ_VECTOR_INDEX={'ENABLED': True}):
+            self.assertIsNone(get_question_vectors())
+
+    def test_pure_python_index_matches_numpy(self):
+        from unittest.mock import patch
+        entries = [(1, 10, [1.0, 0.0]), (2, 20, [0.6, 0.8]), (3, 30, [0.0, 1.0])]
+        index = MemoryVectorIndex(refresh_interval=3600)
+        index._loaded_at = time.monotonic()  # Nothing to load from the database
+        index.add(entries)
+        def search():
+            return [(question_id, quiz_id, round(score, 5)) for question_id, quiz_id, score in index.search([[0.8, 0.6]], k=2, exclude_quiz_id=10)[0]]
+
+        expected = search()
+        with patch('front.vectors.numpy', None):
+            self.assertEqual(search(), expected)
+        self.assertEqual(expected, [(2, 20, 0.96), (3, 30, 0.6)])
+
+        index.add([(3, 30, [0.6, 0.8])])  # Replaces the stored vector
+        self.assertEqual(search(), [(2, 20, 0.96), (3, 30, 0.96)])
+        with patch('front.vectors.numpy', None):
+            self.assertEqual(search(), [(2, 20, 0.96), (3, 30, 0.96)])
+
+
+@override_settings(QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False})
+class QuestionBankTestCase(TestCase):
+    def stock(self, topic, *difficulties):
+        data = sample_quiz_data(len(difficulties), topic=topic)
+        for item, difficulty in zip(data, difficulties):
+            item.update(difficulty=difficulty, question_text=f"{topic} {difficulty} {item['question_text']}")
+        return save_quiz(QuizSchema.model_validate(data).root)
+
+    def generate(self, description, response_text, **body):
+        with fake_llm(FakeBackend(response_text)) as backend:
+            response = self.client.post(reverse('query_gemini'), json.dumps(dict(body, description=description)), content_type="application/json")
+        return response, backend
+
+    def test_selection_follows_difficulty_mix_without_repeats(self):
+        self.stock("Volcanoes", *["Easy"] * 6, *["Medium"] * 6, *["Hard"] * 6)
+        self.stock("Glaciers", "Easy", "Hard")
+        selection = select_questions("10 questions about volcanoes", rng=random.Random(0))
+
+        self.assertEqual(selection.topics, ["Volcanoes"])
+        self.assertEqual(len(set(selection.question_ids)), 10)
+        difficulties = [Question.objects.get(pk=question_id).difficulty for question_id in selection.question_ids]
+        self.assertEqual(difficulties, ["Easy"] * 3 + ["Medium"] * 4 + ["Hard"] * 3)
+
+    def test_broad_topic_does_not_serve_a_narrow_request(self):
+        self.stock("Python", "Easy", "Medium")
+        self.stock("Python decorators", "Easy", "Hard")
+        self.assertEqual(matching_topics("Python metaclasses and descriptors"), [])
+        self.assertEqual(matching_topics("A quiz on Python decorators"), ["Python decorators"])
+        self.assertEqual(matching_topics("10 questions about Python"), ["Python"])
+
+    def test_copies_are_not_selected_again(self):
+        quiz_id = self.stock("Volcanoes", "Easy", "Hard")
+        copy_questions(list(Question.objects.filter(quiz_id=quiz_id).values_list('pk', flat=True)), make_quiz(0).quiz_id)
+        selection = select_questions("volcanoes", num_questions=5)
+        self.assertEqual(len(selection.question_ids), 2)
+        self.assertEqual(selection.shortfall, 3)
+
+    def test_full_bank_skips_the_llm(self):
+        self.stock("Volcanoes", "Easy", "Medium", "Medium", "Hard")
+        response, backend = self.generate("Volcanoes", SAMPLE_RESPONSE, num_questions=4)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(backend.prompts, [])
+        quiz_id = response.json()['quiz_id']
+        self.assertEqual(Question.objects.filter(quiz_id=quiz_id, origin__isnull=False).count(), 4)
+        self.assertEqual(AnswerOption.objects.filter(question__quiz_id=quiz_id).count(), 16)
+        self.assertEqual(Quiz.objects.get(pk=quiz_id).title, "Quiz about Volcanoes")
+
+    def test_llm_only_generates_the_shortfall(self):
+        self.stock("Volcanoes", "Easy", "Hard")
+        response, backend = self.generate("8 questions on volcanoes", sample_quiz_response(9, topic="Volcanoes"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Generate exactly 6 questions.", backend.prompts[0])
+        questions = Question.objects.filter(quiz_id=response.json()['quiz_id'])
+        self.assertEqual(questions.count(), 8)
+        self.assertEqual(questions.filter(origin__isnull=False).count(), 2)
+
+    def test_invalid_num_questions(self):
+        response = self.client.post(reverse('query_gemini'), json.dumps({"description": "Volcanoes", "num_questions": "ten"}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False})
+class BatchGenerationTestCase(TestCase):
+    def generate(self, backend, descriptions, **kwargs):
+        with fake_llm(backend):
+            return async_to_sync(generate_quizzes)(descriptions, **kwargs)
+
+    def test_descriptions_are_packed_within_the_budget(self):
+        config = dict(get_batch_config(), MAX_PROMPT_TOKENS=PROMPT_OVERHEAD_TOKENS + 2100, TOKENS_PER_QUESTION=100)
+        packs = pack_descriptions(["volcanoes", "glaciers", "deserts", "x" * 10000], num_questions=10, config=config)
+        self.assertEqual(packs, [[0, 1], [2], [3]])
+
+    def test_packed_batch_stores_one_quiz_per_description(self):
+        backend = FakeBatchBackend(size=3)
+        results = self.generate(backend, ["Volcanoes", "Glaciers", "Deserts"], num_questions=3)
+        self.assertEqual(len(backend.prompts), 1)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([Question.objects.filter(quiz_id=result.quiz_id).count() for result in results], [3, 3, 3])
+
+    def test_one_bad_quiz_does_not_fail_the_batch(self):
+        backend = FakeBackend(json.dumps({"1": sample_quiz_data(2), "2": [{"id": "broken"}]}))
+        results = self.generate(backend, ["Volcanoes", "Glaciers"])
+        self.assertTrue(results[0].ok)
+        self.assertFalse(results[1].ok)
+        self.assertIn("Schema validation failed", results[1].error)
+
+    def test_unsplittable_response_is_retried_singly(self):
+        backend = FakeBatchBackend(size=2)
+        respond = backend.respond
+        backend.responder = lambda prompt: respond(prompt)[:50] if backend.quiz_count(prompt) else respond(prompt)
+        results = self.generate(backend, ["Volcanoes", "Glaciers"])
+        self.assertEqual(len(backend.prompts), 3)
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_retries_run_concurrently(self):
+        backend = FakeBatchBackend(size=2, latency=0.2)
+        respond = backend.respond
+        backend.responder = lambda prompt: respond(prompt)[:50] if backend.quiz_count(prompt) else respond(prompt)
+        start = time.monotonic()
+        results = self.generate(backend, ["Volcanoes", "Glaciers", "Deserts", "Oceans"], concurrency=4)
+        self.assertEqual(len(backend.prompts), 5)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertLess(time.monotonic() - start, 0.7)  # The batch call, then the retries side by side
+
+    def test_batch_stops_at_the_deadline(self):
+        start = time.monotonic()
+        results = self.generate(FakeBatchBackend(size=2, latency=0.2), ["Volcanoes", "Glaciers", "Deserts"], pack=False, concurrency=1, deadline=0.3)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual([result.ok for result in results], [True, False, False])
+        self.assertIn("timed out", results[1].error)
+        self.assertIn("deadline", results[2].error)
+
+    def test_batch_view(self):
+        with fake_llm(FakeBatchBackend(size=2)):
+            response = self.client.post(reverse('query_gemini_batch'), json.dumps({"descriptions": ["Volcanoes", "Glaciers"]}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['success'] for result in response.json()['results']], [True, True])
+        response = self.client.post(reverse('query_gemini_batch'), json.dumps({"descriptions": []}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class LLMClientTestCase(TestCase):
+    def client_for(self, backend, **kwargs):
+        return LLMClient(backend, backoff=0, **kwargs)
+
+    def test_transient_errors_are_retried(self):
+        backend = FakeBackend("ok", errors=[UpstreamError(503), UpstreamError(429)])
+        client = self.client_for(backend)
+        self.assertEqual(asyncio.run(client.generate("prompt", timeout=5)), "ok")
+        self.assertEqual(len(backend.prompts), 3)
+        self.assertEqual(client.retries, 2)
+
+    def test_permanent_errors_are_not_retried(self):
+        backend = FakeBackend("ok", errors=[UpstreamError(400)])
+        with self.assertRaises(LLMError):
+            asyncio.run(self.client_for(backend).generate("prompt", timeout=5))
+        self.assertEqual(len(backend.prompts), 1)
+
+    def test_circuit_opens_then_recovers(self):
+        backend = FakeBackend("ok", errors=[UpstreamError(503), UpstreamError(503)])
+        client = self.client_for(backend, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                asyncio.run(client.generate("prompt", timeout=5))
+        with self.assertRaises(CircuitOpen):
+            asyncio.run(client.generate("prompt", timeout=5))
+        self.assertEqual(len(backend.prompts), 2)
+
+        time.sleep(0.06)
+        self.assertEqual(asyncio.run(client.generate("prompt", timeout=5)), "ok")
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual([bucket.try_acquire(), bucket.try_acquire()], [0, 0])
+        self.assertGreater(bucket.try_acquire(), 0)
+        with self.assertRaises(RateLimited):
+            asyncio.run(bucket.acquire(deadline=time.monotonic()))
+
+    def test_open_circuit_returns_503_with_retry_after(self):
+        with fake_llm(FakeBackend(SAMPLE_RESPONSE)) as backend:
+            breaker = get_llm_client().breaker
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            response = self.client.post(reverse('query_gemini'), json.dumps({"description": "Python"}), content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(backend.prompts, [])
+
+    def test_backends_resolve_on_first_use(self):
+        custom = {'BACKEND': 'custom', 'BACKENDS': {'custom': 'front.llm.FakeBackend'}}
+        with override_settings(QUIZ_LLM=custom):
+            reset_llm_client()
+            self.addCleanup(reset_llm_client)
+            self.assertIsInstance(get_llm_client().backend, FakeBackend)
+        with self.assertRaises(LLMError):
+            get_backend_class('missing')
+
+    def test_startup_imports_no_provider_sdk(self):
+        script = (
+            "import sys, django; django.setup(); import front.urls; "
+            "print(','.join(m for m in ('google.generativeai', 'anthropic', 'litellm', 'numpy', 'dotenv') if m in sys.modules))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'quiz2.settings'}
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        get_quiz_cache().clear()
+
+    def test_histogram_exposition(self):
+        registry = []
+        histogram = Histogram('test_seconds', "Test", ('view',), buckets=(0.1, 1), registry=registry)
+        histogram.observe(0.05, view='a"b')
+        histogram.observe(5, view='a"b')
+        self.assertEqual(render(registry).splitlines(), [
+            '# HELP test_seconds Test',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 2',
+            'test_seconds_sum{view="a\\"b"} 5.05',
+            'test_seconds_count{view="a\\"b"} 2',
+        ])
+
+    def test_requests_are_timed_with_query_counts(self):
+        quiz = make_quiz(2)
+        before = REQUEST_QUERIES.count(view='quiz_detail')
+        self.client.get(reverse('quiz_detail', args=[quiz.quiz_id]))
+        self.assertEqual(REQUEST_QUERIES.count(view='quiz_detail'), before + 1)
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'quiz_http_request_duration_seconds_count{method="GET",view="quiz_detail",status="200"}')
+        self.assertContains(response, 'quiz_http_request_db_queries_bucket{view="quiz_detail",le="3"}')
+
+    def test_unknown_methods_share_one_label(self):
+        quiz = make_quiz(1)
+        for method in ('BREW', 'X-SCAN'):
+            self.client.generic(method, reverse('quiz_detail', args=[quiz.quiz_id]))
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'quiz_http_request_duration_seconds_count{method="other",view="quiz_detail",status="200"} 2')
+        self.assertNotContains(response, 'BREW')
+
+    @override_settings(QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False})
+    def test_llm_and_pipeline_steps_are_timed(self):
+        before = (LLM_SECONDS.count(backend='fake', kind='generate', outcome='ok'), STEP_SECONDS.count(step='create_quiz'))
+        with fake_llm(FakeBackend(SAMPLE_RESPONSE)):
+            self.client.post(reverse('query_gemini'), json.dumps({"description": "Python"}), content_type="application/json")
+        after = (LLM_SECONDS.count(backend='fake', kind='generate', outcome='ok'), STEP_SECONDS.count(step='create_quiz'))
+        self.assertEqual(after, (before[0] + 1, before[1] + 1))
+
+
+@override_settings(QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False})
+class ResponseRepairTestCase(TestCase):
+    def test_tolerant_loads(self):
+        data = sample_quiz_data(3)
+        text = json.dumps(data, indent=2)
+        self.assertEqual(tolerant_loads(f"Sure! Here it is:\n{text}\nEnjoy."), data)
+        self.assertEqual(tolerant_loads(text.replace('}\n]', '},\n]')), data)
+        self.assertEqual(tolerant_loads(text[:-100]), data[:2])
+        with self.assertRaises(ValueError):
+            tolerant_loads("not json")
+
+    def test_near_misses_are_repaired_locally(self):
+        data = sample_quiz_data(3)
+        data[0].update(id="Q1", difficulty="easy", correct_answer_id="B")
+        data[1]['options'] = [option['text'] for option in data[1]['options']]
+        data[2]['options'] = data[2]['options'][:3]
+        report = repair_response(json.dumps(data))
+
+        self.assertEqual(report.repaired, 2)
+        self.assertEqual([question.id for question in report.questions], ["q_benchmark_001", "q_bench_002"])
+        self.assertEqual(report.questions[0].difficulty, "Easy")
+        self.assertEqual(report.questions[0].correct_answer_id, "b")
+        self.assertEqual([position for position, _, _ in report.broken], [3])
+
+    def test_only_broken_questions_are_reasked(self):
+        data = sample_quiz_data(3)
+        data[2]['options'] = data[2]['options'][:3]
+        fixed = sample_quiz_data(3)[2:]
+
+        def respond(prompt):
+            return json.dumps(fixed) if prompt.startswith("These questions") else f"Quiz:\n{json.dumps(data)}"
+
+        with fake_llm(FakeBackend(responder=respond)) as backend:
+            response = self.client.post(reverse('query_gemini'), json.dumps({"description": "Benchmark"}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(backend.prompts), 2)
+        self.assertIn("Benchmark question number 3?", backend.prompts[1])
+        self.assertNotIn("Benchmark question number 1?", backend.prompts[1])
+        self.assertEqual(Question.objects.filter(quiz_id=response.json()['quiz_id']).count(), 3)
+
+    def test_reask_only_gets_the_time_left(self):
+        data = sample_quiz_data(3)
+        data[2]['options'] = data[2]['options'][:3]
+        fixed = sample_quiz_data(3)[2:]
+
+        def respond(prompt):
+            return json.dumps(fixed) if prompt.startswith("These questions") else json.dumps(data)
+
+        with fake_llm(FakeBackend(responder=respond, latency=0.3)):
+            quiz_id, message = async_to_sync(generate_quiz)("Benchmark", timeout=0.45)
+        # The re-ask has 0.15 s left, not a fresh 0.45 s, so the broken question is dropped
+        self.assertEqual(Question.objects.filter(quiz_id=quiz_id).count(), 2)
+
+    def test_first_call_only_gets_the_time_left(self):
+        from unittest.mock import patch
+        from .generation import QuizGenerationError
+
+        def slow_selection(description, num_questions):
+            time.sleep(0.3)
+            return None
+
+        with fake_llm(FakeBackend(json.dumps(sample_quiz_data(3)), latency=0.3)), \
+                patch('front.generation.select_questions', slow_selection):
+            with self.assertRaises(QuizGenerationError) as raised:
+                async_to_sync(generate_quiz)("Benchmark", timeout=0.45)
+        # The bank selection used 0.3 s of the 0.45 s, so the 0.3 s model call cannot finish
+        self.assertEqual(raised.exception.status, 504)
+
+    @override_settings(QUIZ_RESPONSE_REPAIR={'REASK': False})
+    def test_unrepairable_questions_are_dropped(self):
+        data = sample_quiz_data(2)
+        data[1]['options'] = data[1]['options'][:3]
+        with fake_llm(FakeBackend(json.dumps(data))) as backend:
+            response = self.client.post(reverse('query_gemini'), json.dumps({"description": "Benchmark"}), content_type="application/json")
+        self.assertEqual(len(backend.prompts), 1)
+        self.assertEqual(Question.objects.filter(quiz_id=response.json()['quiz_id']).count(), 1)
+
+
+@override_settings(QUIZ_PROMPT_CACHE={'ENABLED': False}, QUIZ_VECTOR_INDEX={'ENABLED': False}, QUIZ_QUESTION_BANK={'ENABLED': False})
+class StructuredOutputTestCase(TestCase):
+    def generate(self, backend):
+        with fake_llm(backend):
+            return self.client.post(reverse('query_gemini'), json.dumps({"description": "Benchmark", "num_questions": 3}), content_type="application/json")
+
+    def test_schema_replaces_the_format_instructions(self):
+        backend = FakeBackend(sample_quiz_response(3), structured=True)
+        response = self.generate(backend)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(backend.response_schemas, [quiz_json_schema()])
+        self.assertIn("Generate exactly 3 questions.", backend.prompts[0])
+        self.assertNotIn("correct_answer_id", backend.prompts[0])
+        self.assertLess(len(backend.prompts[0]), len(generate_quiz_prompt("Benchmark", 3)) / 3)
+        self.assertEqual(Question.objects.filter(quiz_id=response.json()['quiz_id']).count(), 3)
+
+    def test_free_text_without_json_mode(self):
+        for backend, overrides in [
+            (FakeBackend(f"```json\n{sample_quiz_response(3)}\n```"), {}),
+            (FakeBackend(f"```json\n{sample_quiz_response(3)}\n```", structured=True), {'QUIZ_STRUCTURED_OUTPUT': False}),
+        ]:
+            with override_settings(**overrides):
+                response = self.generate(backend)
             self.assertEqual(response.status_code, 200)
-            self.assertIn("response", response.json())
\ No newline at end of file
+            self.assertEqual(backend.response_schemas, [])
+            self.assertIn("DO NOT include ```json", backend.prompts[0])
+
+    def test_invalid_structured_output_is_repaired(self):
+        data = sample_quiz_data(3)
+        data[0]['difficulty'] = "easy"
+        backend = FakeBackend(json.dumps({"questions": data}), structured=True)
+        response = self.generate(backend)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(backend.prompts), 1)
+        self.assertEqual(Question.objects.filter(quiz_id=response.json()['quiz_id']).count(), 3)
+
+    def test_provider_schemas(self):
+        gemini = inline_schema(quiz_json_schema(), GeminiBackend.SCHEMA_KEYWORDS)
+        options = gemini['items']['properties']['options']
+        self.assertEqual((options['min_items'], options['items']['required']), (4, ['option_id', 'text']))
+        self.assertEqual(set(options['items']['properties']['option_id']), {'type', 'description'})
+
+        wrapped = object_schema(quiz_json_schema())
+        self.assertEqual(wrapped['type'], 'object')
+        self.assertNotIn('$ref', json.dumps(wrapped))
+        self.assertIn('pattern', wrapped['properties']['result']['items']['properties']['id'])
+        data = sample_quiz_data(1)
+        self.assertEqual(json.loads(unwrap(quiz_json_schema(), {'result': data})), data)
+        self.assertEqual(json.loads(unwrap(quiz_json_schema(), json.dumps({'result': data}))), data)
+        # Malformed answers reach validation and repair instead of failing the call
+        self.assertEqual(json.loads(unwrap(quiz_json_schema(), data)), data)
+        self.assertEqual(unwrap(quiz_json_schema(), '[{"id": "q_1",'), '[{"id": "q_1",')
@@ -4,6 +4,18 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('query-gemini/', views.query_gemini, name='query_gemini'),
+    path('query-gemini/batch/', views.query_gemini_batch, name='query_gemini_batch'),
     path('quiz/<int:quiz_id>/', views.quiz_detail, name='quiz_detail'),
+    path('quiz/<int:quiz_id>/submit/', views.submit_quiz, name='submit_quiz'),
+    path('quiz/<int:quiz_id>/stats/', views.quiz_stats, name='quiz_stats'),
+    path('quiz/<int:quiz_id>/related/', views.related_quizzes, name='related_quizzes'),
+    path('api/quiz/<int:quiz_id>/', views.quiz_api, name='quiz_api'),
+    path('quiz/live/', views.quiz_live, name='quiz_live'),
+    path('quiz/stream/', views.stream_quiz, name='stream_quiz'),
+    path('search/', views.search, name='search'),
+    path('quizzes/', views.quiz_catalogue, name='quiz_catalogue'),
+    path('metrics', views.metrics, name='metrics'),  # Where Prometheus scrapes by default
+    path('jobs/', views.create_generation_job, name='create_generation_job'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
 
 ]
@@ -1,96 +1,173 @@
-import json
-from jsonschema import validate, ValidationError
+import functools
 import logging
 
-from .models import Quiz, Question, AnswerOption
+from pydantic import ValidationError
 
-
-from .schemas import QuizSchema
+from .metrics import STEP_SECONDS, timed
+from .persistence import save_quiz
+from .schemas import QuizQuestion, QuizSchema
+from .vectors import get_question_vectors
 
 logger = logging.getLogger('custom_logger')
 
 
-def write_response_to_file(response_text, file_path):
+def strip_code_fences(response_text):
     """
-    Writes the response text to a file.
+    Removes a surrounding Markdown code block (```json ... ```) if present.
     """
-    try:
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(response_text)
-        logger.info(f"Response successfully written to {file_path}")
-    except Exception as e:
-        logger.error(f"Error writing response to file: {e}")
+    cleaned_response = response_text.strip()
+    if cleaned_response.startswith('```'):
+        # Remove opening ```json or ``` line
+        cleaned_response = cleaned_response.split('\n', 1)[1] if '\n' in cleaned_response else ''
+    if cleaned_response.endswith('```'):
+        # Remove closing ``` line
+        cleaned_response = cleaned_response.rsplit('\n', 1)[0] if '\n' in cleaned_response else ''
+    return cleaned_response.strip()
 
 
-def validate_quiz_response(response_text):
+def _format_validation_error(error):
+    """
+    Maps a pydantic ValidationError to the messages the API has always returned.
+    """
+    if any(detail['type'] == 'json_invalid' for detail in error.errors()):
+        return f"Invalid JSON format: {str(error)}"
+    return f"Schema validation failed: {str(error)}"
+
+
+@timed(STEP_SECONDS, step='validate')
+def parse_quiz_response(response_text, structured=False):
+    """
+    Parses and validates a model response in a single pass.
+
+    QuizSchema's validator is compiled once when the class is defined, and
+    model_validate_json parses the JSON and checks the schema together, so
+    the response text is only read once.
+
+    Args:
+        response_text (str): Raw model output, optionally wrapped in a code block
+        structured (bool): The text came from the provider's JSON mode, so it
+            is validated as is, without looking for code fences
+
+    Returns:
+        tuple: (questions: list[QuizQuestion] | None, error_message: str)
+    """
     try:
-        my_schema = QuizSchema.model_json_schema()
-        # Strip Markdown code block syntax if present
-        cleaned_response = response_text.strip()
-        if cleaned_response.startswith('```'):
-            # Remove opening ```json or ``` line
-            cleaned_response = cleaned_response.split('\n', 1)[1]
-        if cleaned_response.endswith('```'):
-            # Remove closing ``` line
-            cleaned_response = cleaned_response.rsplit('\n', 1)[0]
-        
-        cleaned_response = cleaned_response.strip()
-        quiz_data = json.loads(cleaned_response)
-        
-        # Write the original JSON string to file for debugging
-        write_response_to_file(cleaned_response, 'response.json')
-        
-        logger.info(f"Validating quiz data: {quiz_data}")
-        # Validate the JSON structure against the schema
-        validate(instance=quiz_data, schema=my_schema)
-        return True, ""
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error: {e}")
-        return False, f"Invalid JSON format: {str(e)}"
+        cleaned_response = response_text if structured else strip_code_fences(response_text)
+        questions = QuizSchema.model_validate_json(cleaned_response).root
+        logger.info(f"Validated {len(questions)} quiz questions")
+        return questions, ""
     except ValidationError as e:
-        logger.error(f"Validation error: {e}")
-        return False, f"Schema validation failed: {str(e)}"
+        message = _format_validation_error(e)
+        logger.error(message)
+        return None, message
     except Exception as e:
         logger.error(f"Unexpected error during validation: {e}")
-        return False, f"Unexpected error during validation: {str(e)}"
+        return None, f"Unexpected error during validation: {str(e)}"
 
 
-def generate_quiz_prompt(description):
-    
-    return f"""Create a quiz based on this description: {description}
-    IMPORTANT: Return ONLY the raw JSON array without any Markdown formatting or code blocks.
-    DO NOT include ```json or ``` markers.
-    Generate a complete and valid JSON array of question objects with this structure:
-    [
-        {{
+def validate_quiz_response(response_text):
+    """
+    Checks a model response against QuizSchema.
+
+    Returns:
+        tuple: (is_valid: bool, error_message: str)
+    """
+    questions, error_message = parse_quiz_response(response_text)
+    return questions is not None, error_message
+
+
+QUESTION_FORMAT = """[
+        {
             "id": "q_topic_001", # IMPORTANT: ID must follow pattern 'q_topic_XXX' where XXX is a 3-digit number
             "topic": "Topic Name",
             "difficulty": "Easy/Medium/Hard",
             "type": "MCQ",
             "question_text": "Question text here?",
             "options": [
-                {{"option_id": "a", "text": "First option"}},
-                {{"option_id": "b", "text": "Second option"}},
-                {{"option_id": "c", "text": "Third option"}},
-                {{"option_id": "d", "text": "Fourth option"}}
+                {"option_id": "a", "text": "First option"},
+                {"option_id": "b", "text": "Second option"},
+                {"option_id": "c", "text": "Third option"},
+                {"option_id": "d", "text": "Fourth option"}
             ],
             "correct_answer_id": "a",
             "explanation": "Explanation of the correct answer"
-        }}
-    ]
-    IMPORTANT RULES:
-    1. The 'id' field MUST follow the pattern 'q_topic_XXX' where XXX is a 3-digit number (001-999)
+        }
+    ]"""
+
+ID_RULES = """1. The 'id' field MUST follow the pattern 'q_topic_XXX' where XXX is a 3-digit number (001-999)
     2. The topic part in the ID can include underscores (e.g., 'q_animal_fan_001' is valid)
-    3. Example valid IDs: 'q_topic_001', 'q_topic_002', 'q_animal_fan_010', 'q_science_quiz_999'
+    3. Example valid IDs: 'q_topic_001', 'q_topic_002', 'q_animal_fan_010', 'q_science_quiz_999'"""
+
+
+def generate_quiz_prompt(description, num_questions=None):
+    count = f"\n    Generate exactly {num_questions} questions." if num_questions else ""
+    return f"""Create a quiz based on this description: {description}{count}
+    IMPORTANT: Return ONLY the raw JSON array without any Markdown formatting or code blocks.
+    DO NOT include ```json or ``` markers.
+    Generate a complete and valid JSON array of question objects with this structure:
+    {QUESTION_FORMAT}
+    IMPORTANT RULES:
+    {ID_RULES}
     4. Return ONLY the JSON array with no additional text or formatting."""
-    
-def create_quiz(quiz_data: str) -> tuple[bool, str, int]:
+
+
+@functools.cache
+def quiz_json_schema():
+    """
+    Returns QuizSchema as a JSON schema, for providers' structured output.
+    """
+    return QuizSchema.model_json_schema()
+
+
+def generate_structured_prompt(description, num_questions=None):
+    """
+    Builds the prompt for structured generation.
+
+    The response format is enforced by quiz_json_schema(), sent alongside,
+    so only what the schema cannot express is spelled out.
+    """
+    count = f"\nGenerate exactly {num_questions} questions." if num_questions else ""
+    return (
+        f"Create a multiple-choice quiz based on this description: {description}{count}\n"
+        "Give each question an id like 'q_topic_001' (a topic slug and a 3-digit number), "
+        "options a to d and an explanation of the correct answer."
+    )
+
+
+def generate_batch_prompt(descriptions, num_questions=None):
+    """
+    Builds one prompt asking for a separate quiz per description.
+
+    The model answers with a JSON object mapping each description's number
+    ("1", "2", ...) to that quiz's question array; see batch.split_batch_response.
+    """
+    listing = "\n".join(f"    {number}. {description}" for number, description in enumerate(descriptions, start=1))
+    count = f"\n    Each quiz must have exactly {num_questions} questions." if num_questions else ""
+    return f"""Create {len(descriptions)} separate quizzes, one for each of these descriptions:
+{listing}{count}
+    IMPORTANT: Return ONLY a raw JSON object without any Markdown formatting or code blocks.
+    DO NOT include ```json or ``` markers.
+    The object's keys are the description numbers as strings ("1", "2", ...) and each value is
+    a complete and valid JSON array of question objects with this structure:
+    {QUESTION_FORMAT}
+    IMPORTANT RULES:
+    {ID_RULES}
+    4. Every description number must appear exactly once as a key.
+    5. Return ONLY the JSON object with no additional text or formatting."""
+
+
+@timed(STEP_SECONDS, step='create_quiz')
+def create_quiz(quiz_data: str | list[QuizQuestion], dedupe: bool = True) -> tuple[bool, str, int]:
     """
     Creates a quiz in the database based on the validated JSON data.
-    Uses bulk operations for better performance.
+    Writes are atomic and batched; see persistence.save_quizzes. Questions
+    are then embedded and added to the vector index.
     
     Args:
-        quiz_data (str): JSON string containing validated quiz data
+        quiz_data (str | list[QuizQuestion]): Questions already parsed by
+            parse_quiz_response, or a JSON string containing quiz data
+        dedupe (bool): Drop questions that nearly repeat an existing one
+            (off when the questions were already shown to the user)
         
     Returns:
         tuple: (success: bool, message: str, quiz_id: int)
@@ -99,60 +176,53 @@ def create_quiz(quiz_data: str) -> tuple[bool, str, int]:
             - quiz_id: ID of the created quiz or None if failed
     """
     try:
-        # Parse the JSON data
-        questions_data = json.loads(quiz_data)
+        if isinstance(quiz_data, str):
+            questions_data = QuizSchema.model_validate_json(quiz_data).root
+        else:
+            questions_data = quiz_data
         
         if not questions_data:
             logger.error("Empty quiz data received")
             return False, "Empty quiz data", None
             
-        # Extract topic from first question for the quiz title
-        first_question = questions_data[0]
-        topic = first_question.get('topic', 'General Knowledge')
-        
-        # Create the Quiz instance (can't bulk create as we need the ID)
-        quiz = Quiz.objects.create(
-            title=f"Quiz about {topic}",
-            description=f"A quiz containing {len(questions_data)} questions about {topic}"
-        )
-        logger.info(f"Created quiz with ID {quiz.quiz_id}")
-
-        # Prepare questions for bulk creation
-        questions_to_create = []
-        for q_data in questions_data:
-            question = Question(
-                quiz=quiz,
-                question_text=q_data['question_text'],
-                question_type=q_data['type'],
-                order_in_quiz=int(q_data['id'].split('_')[-1])
-            )
-            questions_to_create.append(question)
-        
-        # Bulk create questions
-        questions = Question.objects.bulk_create(questions_to_create)
-        logger.info(f"Bulk created {len(questions)} questions")
-        
-        # Prepare options for bulk creation
-        options_to_create = []
-        for question, q_data in zip(questions, questions_data):
-            for opt in q_data['options']:
-                option = AnswerOption(
-                    question=question,
-                    option_text=opt['text'],
-                    is_correct=(opt['option_id'] == q_data['correct_answer_id'])
-                )
-                options_to_create.append(option)
-        
-        # Bulk create options
-        options = AnswerOption.objects.bulk_create(options_to_create)
-        logger.info(f"Bulk created {len(options)} answer options")
-        
-        logger.info(f"Successfully created quiz {quiz.quiz_id} with {len(questions)} questions")
-        return True, "Quiz created successfully", quiz.quiz_id
+        vectors = None
+        question_vectors = get_question_vectors()
+        if question_vectors is not None and dedupe:
+            questions_data, vectors = _drop_duplicates(question_vectors, questions_data)
+
+        quiz_id = save_quiz(questions_data)
+        if question_vectors is not None:
+            try:
+                question_vectors.add_quiz(quiz_id, questions_data, vectors)
+            except Exception as e:
+                # The quiz is stored; `embed_questions` can index it later
+                logger.error(f"Failed to index quiz {quiz_id}: {e}")
+        logger.info(f"Successfully created quiz {quiz_id} with {len(questions_data)} questions")
+        return True, "Quiz created successfully", quiz_id
         
-    except json.JSONDecodeError as e:
+    except ValidationError as e:
         logger.error(f"Invalid JSON data: {e}")
         return False, f"Invalid JSON data: {str(e)}", None
     except Exception as e:
         logger.error(f"Error creating quiz: {str(e)}")
-        return False, f"Failed to create quiz: {str(e)}", None
\ No newline at end of file
+        return False, f"Failed to create quiz: {str(e)}", None
+
+
+def _drop_duplicates(question_vectors, questions):
+    """
+    Returns (questions, vectors) without repeats of stored questions.
+
+    Keeps every question if all of them are duplicates, and skips the check
+    (vectors None) if embedding fails.
+    """
+    try:
+        kept, vectors, dropped = question_vectors.drop_duplicates(questions)
+    except Exception as e:
+        logger.error(f"Skipping duplicate check: {e}")
+        return questions, None
+    if not kept:
+        logger.warning(f"All {len(questions)} questions repeat existing ones; keeping them")
+        return questions, None
+    if dropped:
+        logger.info(f"Dropped {dropped} duplicate questions")
+    return kept, vectors
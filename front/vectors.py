@@ -0,0 +1,448 @@
+"""
+Embedding index over question texts.
+
+Questions are embedded in batches when a quiz is created and stored in
+QuestionEmbedding. Nearest-neighbour queries go to an index built from
+those rows: an in-process brute-force index (NumPy when installed, plain
+Python otherwise) by default, or a pgvector HNSW index on PostgreSQL. The
+index finds related quizzes and, with a semantic embedder, drops
+near-duplicate questions at ingest; by default duplicates are questions
+with the same text.
+"""
+import logging
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+
+from .models import Question, QuestionEmbedding
+from .persistence import question_orders
+from .prompt_cache import EMBEDDERS
+from .search import search_question_ids
+
+# Optional, and slow to import: loaded on the first search, None if not installed
+numpy = _NOT_LOADED = object()
+
+logger = logging.getLogger('custom_logger')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'EMBEDDER': None,  # Off until set: 'google' uses the Gemini embedding model, 'hashing' is for tests
+    'BACKEND': 'memory',  # 'pgvector' on PostgreSQL with the vector extension
+    # 'text' drops questions with the same text ignoring case and punctuation;
+    # 'embedding' also drops similar ones, and needs a semantic embedder such as 'google'
+    'DEDUPE': 'text',
+    'DUPLICATE_THRESHOLD': 0.9,  # Cosine similarity above which a new question is a duplicate, with DEDUPE 'embedding'
+    'RELATED_LIMIT': 5,
+    'BATCH_SIZE': 256,  # Texts per embedding call
+    'REFRESH_INTERVAL': 30,  # Seconds between reloads of rows written by other processes
+    'REFRESH_OVERLAP': 60,  # Seconds each reload looks back, for rows committed after they were written
+}
+
+
+def _numpy():
+    """
+    Returns the numpy module, or None to fall back to a pure-Python scan.
+    """
+    global numpy
+    if numpy is _NOT_LOADED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+def pack_vector(vector):
+    return array('f', vector).tobytes()
+
+
+def unpack_vector(data):
+    vector = array('f')
+    vector.frombytes(bytes(data))
+    return vector.tolist()
+
+
+class MemoryVectorIndex:
+    """
+    Exact cosine-similarity index held in process memory.
+
+    Loaded from QuestionEmbedding on first use and topped up every
+    `refresh_interval` seconds with rows other processes wrote or re-embedded.
+    Each top-up rereads rows updated since `refresh_overlap` seconds before
+    the previous one, so a row committed late is still seen.
+    Vectors are normalized, so similarity is a dot product; with NumPy a
+    query against a million vectors is one matrix-vector product. Vectors
+    are kept in one flat float32 array, so adding appends to it and NumPy
+    reads it in place.
+    """
+
+    def __init__(self, refresh_interval=30, refresh_overlap=60):
+        self.refresh_interval = refresh_interval
+        self.refresh_overlap = refresh_overlap
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._clear()
+
+    def _clear(self):
+        self._positions = {}
+        self._question_ids = []
+        self._quiz_ids = []
+        self._vectors = array('f')
+        self._dimensions = None
+        self._refreshed_since = None
+
+    def __len__(self):
+        return len(self._question_ids)
+
+    def add(self, entries):
+        """
+        Adds (question_id, quiz_id, vector) entries, replacing known questions.
+        """
+        with self._lock:
+            for question_id, quiz_id, vector in entries:
+                if self._dimensions is None:
+                    self._dimensions = len(vector)
+                position = self._positions.get(question_id)
+                if position is None:
+                    self._positions[question_id] = len(self._question_ids)
+                    self._question_ids.append(question_id)
+                    self._quiz_ids.append(quiz_id)
+                    self._vectors.extend(vector)
+                else:
+                    self._quiz_ids[position] = quiz_id
+                    start = position * self._dimensions
+                    self._vectors[start:start + self._dimensions] = array('f', vector)
+
+    def search(self, vectors, k, exclude_quiz_id=None):
+        """
+        Returns, for each query vector, up to k (question_id, quiz_id, score) best first.
+        """
+        self._refresh()
+        with self._lock:
+            if not self._question_ids:
+                return [[] for _ in vectors]
+            numpy = _numpy()
+            all_scores = self._scores(vectors)
+            results = []
+            for scores in all_scores:
+                if numpy is not None:
+                    ranked = numpy.argsort(-scores, kind='stable')
+                else:
+                    ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+                matches = []
+                for i in ranked:
+                    if self._quiz_ids[i] == exclude_quiz_id:
+                        continue
+                    matches.append((self._question_ids[i], self._quiz_ids[i], float(scores[i])))
+                    if len(matches) == k:
+                        break
+                results.append(matches)
+            return results
+
+    def _scores(self, vectors):
+        # Called under the lock; the NumPy view of the array must not outlive it,
+        # since the array cannot grow while a view exists
+        numpy = _numpy()
+        if numpy is not None:
+            matrix = numpy.frombuffer(self._vectors, dtype=numpy.float32).reshape(-1, self._dimensions)
+            return numpy.asarray(vectors, dtype=numpy.float32) @ matrix.T
+        rows = [self._vectors[start:start + self._dimensions] for start in range(0, len(self._vectors), self._dimensions)]
+        return [[_dot(query, row) for row in rows] for query in vectors]
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+            return
+        self._loaded_at = now
+        if QuestionEmbedding.objects.count() < len(self):
+            # Questions were deleted elsewhere: start over
+            with self._lock:
+                self._clear()
+        started = timezone.now()
+        rows = QuestionEmbedding.objects.order_by('question_id')
+        if self._refreshed_since is not None:
+            rows = rows.filter(updated_at__gte=self._refreshed_since)
+        entries = [
+            (question_id, quiz_id, unpack_vector(vector))
+            for question_id, quiz_id, vector in rows.values_list('question_id', 'quiz_id', 'vector').iterator(chunk_size=2000)
+        ]
+        if entries:
+            self.add(entries)
+        self._refreshed_since = started - timedelta(seconds=self.refresh_overlap)
+
+
+class PgVectorIndex:
+    """
+    Approximate nearest-neighbour index in PostgreSQL using pgvector's HNSW.
+
+    Mirrors QuestionEmbedding into front_question_vector, which is created
+    on first use and requires the vector extension.
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self._ready = False
+
+    def _connection(self):
+        return connections[router.db_for_write(QuestionEmbedding)]
+
+    def _ensure_schema(self, cursor):
+        if self._ready:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS front_question_vector ("
+            "question_id integer PRIMARY KEY REFERENCES front_question (question_id) ON DELETE CASCADE, "
+            f"quiz_id integer NOT NULL, embedding vector({self.dimensions}) NOT NULL)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS front_question_vector_hnsw "
+            "ON front_question_vector USING hnsw (embedding vector_cosine_ops)"
+        )
+        self._ready = True
+
+    @staticmethod
+    def _literal(vector):
+        return '[' + ','.join(f'{value:.6f}' for value in vector) + ']'
+
+    def add(self, entries):
+        with self._connection().cursor() as cursor:
+            self._ensure_schema(cursor)
+            cursor.executemany(
+                "INSERT INTO front_question_vector (question_id, quiz_id, embedding) VALUES (%s, %s, %s::vector) "
+                "ON CONFLICT (question_id) DO UPDATE SET embedding = EXCLUDED.embedding",
+                [(question_id, quiz_id, self._literal(vector)) for question_id, quiz_id, vector in entries],
+            )
+
+    def search(self, vectors, k, exclude_quiz_id=None):
+        results = []
+        with self._connection().cursor() as cursor:
+            self._ensure_schema(cursor)
+            for vector in vectors:
+                literal = self._literal(vector)
+                cursor.execute(
+                    "SELECT question_id, quiz_id, 1 - (embedding <=> %s::vector) FROM front_question_vector "
+                    "WHERE quiz_id <> %s ORDER BY embedding <=> %s::vector LIMIT %s",
+                    [literal, exclude_quiz_id if exclude_quiz_id is not None else -1, literal, k],
+                )
+                results.append(cursor.fetchall())
+        return results
+
+
+class QuestionVectors:
+    """
+    Embeds questions in batches and answers similarity queries.
+    """
+
+    def __init__(self, embedder, embedder_name, index, dedupe, duplicate_threshold, related_limit, batch_size):
+        self.embedder = embedder
+        self.embedder_name = embedder_name
+        self.index = index
+        self.dedupe = dedupe
+        self.duplicate_threshold = duplicate_threshold
+        self.related_limit = related_limit
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        """
+        Embeds texts, `batch_size` per embedder call.
+        """
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embedder.embed(texts[start:start + self.batch_size]))
+        return vectors
+
+    def drop_duplicates(self, questions):
+        """
+        Removes questions that repeat a stored question or an earlier one in the list.
+
+        A question repeats another with the same text, ignoring case and
+        punctuation. With dedupe 'embedding' it also repeats one whose
+        embedding is at least `duplicate_threshold` similar, which only
+        holds meaning for a semantic embedder: the hashing one scores
+        "World War 1" and "World War 2" questions as duplicates.
+
+        Returns:
+            tuple: (kept questions, their vectors, number dropped)
+        """
+        texts = [question.question_text for question in questions]
+        vectors = self.embed(texts)
+        keys = [_text_key(text) for text in texts]
+        if self.dedupe == 'embedding':
+            nearest = self.index.search(vectors, k=1)
+            repeats = [bool(matches) and matches[0][2] >= self.duplicate_threshold for matches in nearest]
+        else:
+            stored = _stored_text_keys(texts)
+            repeats = [key in stored for key in keys]
+        kept, kept_vectors, kept_keys = [], [], set()
+        for question, vector, key, repeat in zip(questions, vectors, keys, repeats):
+            if repeat or key in kept_keys:
+                continue
+            if self.dedupe == 'embedding' and any(_dot(vector, other) >= self.duplicate_threshold for other in kept_vectors):
+                continue
+            kept.append(question)
+            kept_vectors.append(vector)
+            kept_keys.add(key)
+        return kept, kept_vectors, len(questions) - len(kept)
+
+    def add_quiz(self, quiz_id, questions, vectors=None):
+        """
+        Stores embeddings for a newly saved quiz and adds them to the index.
+
+        Args:
+            quiz_id (int): The saved quiz
+            questions (list[QuizQuestion]): The questions it was saved from
+            vectors (list): Their embeddings, if already computed
+        """
+        if vectors is None:
+            vectors = self.embed([question.question_text for question in questions])
+        question_ids = dict(Question.objects.filter(quiz_id=quiz_id).values_list('order_in_quiz', 'question_id'))
+        entries = [
+            (question_ids[order], quiz_id, vector)
+            for order, vector in zip(question_orders(questions), vectors)
+            if order in question_ids
+        ]
+        self._store(entries)
+
+    def add_copies(self, pairs, quiz_id):
+        """
+        Gives copied questions the stored embeddings of their originals.
+
+        Args:
+            pairs (list[tuple[int, int]]): (original id, copy id) pairs
+            quiz_id (int): The quiz holding the copies
+        """
+        originals = dict(
+            QuestionEmbedding.objects.filter(question_id__in=[original for original, _ in pairs], embedder=self.embedder_name)
+            .values_list('question_id', 'vector')
+        )
+        self._store([
+            (copy, quiz_id, unpack_vector(originals[original]))
+            for original, copy in pairs
+            if original in originals
+        ])
+
+    def embed_missing(self):
+        """
+        Embeds every question without an embedding from the current embedder.
+
+        Returns:
+            int: Number of questions embedded
+        """
+        embedded = 0
+        while True:
+            batch = list(
+                Question.objects.exclude(embedding__embedder=self.embedder_name)
+                .order_by('question_id')
+                .values_list('question_id', 'quiz_id', 'question_text')[:self.batch_size]
+            )
+            if not batch:
+                return embedded
+            vectors = self.embedder.embed([text for _, _, text in batch])
+            self._store([(question_id, quiz_id, vector) for (question_id, quiz_id, _), vector in zip(batch, vectors)])
+            embedded += len(batch)
+
+    def related_quizzes(self, quiz_id, limit=None):
+        """
+        Returns ids of the quizzes whose questions are closest to this quiz's, best first.
+
+        Each other quiz scores the sum of its best match for every question
+        of this quiz, so a quiz sharing many similar questions ranks first.
+        """
+        limit = limit or self.related_limit
+        vectors = [
+            unpack_vector(vector)
+            for vector in QuestionEmbedding.objects.filter(quiz_id=quiz_id).values_list('vector', flat=True)
+        ]
+        if not vectors:
+            return []
+        scores = defaultdict(float)
+        for matches in self.index.search(vectors, k=limit * 4, exclude_quiz_id=quiz_id):
+            best = {}
+            for _, other_quiz_id, score in matches:
+                best[other_quiz_id] = max(best.get(other_quiz_id, 0.0), score)
+            for other_quiz_id, score in best.items():
+                scores[other_quiz_id] += score
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    def _store(self, entries):
+        if not entries:
+            return
+        QuestionEmbedding.objects.filter(question_id__in=[entry[0] for entry in entries]).delete()
+        QuestionEmbedding.objects.bulk_create([
+            QuestionEmbedding(question_id=question_id, quiz_id=quiz_id, embedder=self.embedder_name, vector=pack_vector(vector))
+            for question_id, quiz_id, vector in entries
+        ])
+        self.index.add(entries)
+
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _text_key(text):
+    return ' '.join(re.findall(r'\w+', text.casefold()))
+
+
+def _stored_text_keys(texts):
+    # Full-text search narrows the stored questions to those sharing every word
+    candidates = set()
+    for text in texts:
+        candidates.update(search_question_ids(text, limit=20))
+    return {
+        _text_key(text)
+        for text in Question.objects.filter(pk__in=candidates).values_list('question_text', flat=True)
+    }
+
+
+_vectors = None
+_vectors_lock = threading.Lock()
+
+
+def get_question_vectors():
+    """
+    Returns the process-wide question vector index, or None when it is
+    disabled or no embedder is configured.
+    """
+    global _vectors
+    config = {**DEFAULTS, **getattr(settings, 'QUIZ_VECTOR_INDEX', {})}
+    if not config['ENABLED'] or not config['EMBEDDER']:
+        return None
+    if _vectors is None:
+        with _vectors_lock:
+            if _vectors is None:
+                embedder = EMBEDDERS[config['EMBEDDER']]()
+                if config['BACKEND'] == 'pgvector':
+                    dimensions = len(embedder.embed(['dimension probe'])[0])
+                    index = PgVectorIndex(dimensions)
+                else:
+                    index = MemoryVectorIndex(
+                        refresh_interval=config['REFRESH_INTERVAL'], refresh_overlap=config['REFRESH_OVERLAP'],
+                    )
+                _vectors = QuestionVectors(
+                    embedder=embedder,
+                    embedder_name=config['EMBEDDER'],
+                    index=index,
+                    dedupe=config['DEDUPE'],
+                    duplicate_threshold=config['DUPLICATE_THRESHOLD'],
+                    related_limit=config['RELATED_LIMIT'],
+                    batch_size=config['BATCH_SIZE'],
+                )
+    return _vectors
+
+
+def reset_question_vectors():
+    """
+    Discards the process-wide index so it is rebuilt from settings and the database.
+    """
+    global _vectors
+    with _vectors_lock:
+        _vectors = None
@@ -1,45 +1,32 @@
 # front/views.py
 
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
-from django.shortcuts import render
-from django.http import JsonResponse
+import json
+import logging
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import get_object_or_404, render
-import json
-from jsonschema import validate, ValidationError
-from .utils import *
-from .schemas import QuizSchema
-from .models import Quiz
 
-import logging
+from .analytics import get_quiz_stats
+from .api import PageNotFound, accepts_gzip, get_quiz_payload, matching_etag, parse_page, quiz_etag
+from .batch import generate_quizzes, get_batch_config
+from .cache import get_cached_quiz_page, get_quiz_version, set_cached_quiz_page
+from .catalogue import list_quizzes
+from .generation import QuizGenerationError, generate_quiz
+from .grading import grade_submission
+from .ingest import ingest_attempt
+from .jobs import enqueue_generation, fail_stale_jobs
+from .metrics import render as render_metrics
+from .models import GenerationJob, Quiz
+from .search import MAX_RESULTS, search_questions
+from .streaming import stream_quiz_events
+from .vectors import get_question_vectors
+
 logger = logging.getLogger('custom_logger')
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Configure the Gemini API Key
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        # Handle the case where the API key is not found
-        # Maybe log an error or raise a configuration error
-        # For now, we'll rely on genai.configure to potentially raise an error later
-        # Or you can prevent startup: raise ValueError("GEMINI_API_KEY not found in environment variables")
-        logger.error("Warning: GEMINI_API_KEY environment variable not set.") # Add proper logging
-    genai.configure(api_key=api_key)
-
-    # Create the model instance (choose the model you want to use)
-    # Common models: 'gemini-pro', 'gemini-1.5-flash', 'gemini-1.5-pro'
-    model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20')
-
-except Exception as e:
-    # Handle configuration errors more robustly in production
-    logger.error(f"Error configuring Gemini API: {e}")
-    # You might want to prevent the app from running fully if config fails
-    model = None # Set model to None if configuration fails
 
 def home(request):
     """
@@ -50,87 +37,345 @@ def home(request):
 
 
 @csrf_exempt
-def query_gemini(request):
-    if not model:
-        logger.error("Error: Gemini API is not configured.")
-        return JsonResponse({'error': 'Gemini API is not configured correctly.'}, status=500)
-
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            description = data.get('description', '').strip()
-
-            if not description:
-                logger.error("Error: No description provided.")
-                return JsonResponse({'error': 'Please enter a description.'}, status=400)
-
-            # Generate the prompt
-            formatted_prompt = generate_quiz_prompt(description)
-           
-            # Send the query to the Gemini API
-            logger.info(f"Sending query to Gemini: {formatted_prompt}")
-            try:
-                response = model.generate_content(
-                    formatted_prompt,
-                    generation_config={
-                        'temperature': 0.7,
-                        'top_p': 1,
-                        'top_k': 1,
-                    }
-                )
-            except ConnectionError as e:
-                logger.error(f"Connection error: {e}")
-                return JsonResponse({'error': 'Failed to connect to Gemini API. Please try again later.'}, status=500)
-            except ValueError as e:
-                logger.error(f"Value error: {e}")
-                return JsonResponse({'error': f'Invalid response from Gemini API: {str(e)}'}, status=500)
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                return JsonResponse({'error': f'An unexpected error occurred: {str(e)}'}, status=500)
-            write_response_to_file(response.text, 'response.json')
-            if response.parts:
-                # Validate the response
-                is_valid, error_message = validate_quiz_response(response.text)
-                if not is_valid:
-                    logger.error(f"Invalid response format: {error_message}")
-                    return JsonResponse({'error': f'Invalid response format: {error_message}'}, status=500)
-    
-                # Create quiz if validation passed
-                success, message, quiz_id = create_quiz(response.text)
-                if success:
-                    logger.info(f"Created quiz with ID: {quiz_id}")
-                    # return JsonResponse({
-                    #     'success': True,
-                    #     'message': message,
-                    #     'quiz_id': quiz_id,
-                    #     'response': response.text
-                    # })
-                    quiz_url = reverse('quiz_detail', args=[quiz_id])
-                    return JsonResponse({
-                        'success': True,
-                        'quiz_id': quiz_id,
-                        'quiz_url': quiz_url,
-                        'message': message,
-                    })
-                else:
-                    logger.error(f"Failed to create quiz: {message}")
-                    return JsonResponse({
-                        'error': f'Failed to create quiz: {message}'
-                    }, status=500)
-            else:
-                logger.error("Error: Received empty response from Gemini")
-                return JsonResponse({'error': 'Received empty response from Gemini'}, status=500)
-
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            return JsonResponse({'error': str(e)}, status=500)
-
-    return JsonResponse({'error': 'Invalid request method'}, status=405) 
+async def query_gemini(request):
+    """
+    Generates a quiz from a description without holding a worker thread.
+
+    Served through quiz2/asgi.py, the view awaits the model call so a slow
+    LLM round-trip only parks a coroutine.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        description = data.get('description', '').strip()
+
+        if not description:
+            logger.error("Error: No description provided.")
+            return JsonResponse({'error': 'Please enter a description.'}, status=400)
+
+        num_questions = data.get('num_questions')
+        if num_questions is not None and (not isinstance(num_questions, int) or num_questions < 1):
+            return JsonResponse({'error': 'num_questions must be a positive integer.'}, status=400)
+
+        quiz_id, message = await generate_quiz(description, num_questions=num_questions)
+    except QuizGenerationError as e:
+        response = JsonResponse({'error': e.message}, status=e.status)
+        if e.retry_after:
+            response['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    quiz_url = reverse('quiz_detail', args=[quiz_id])
+    return JsonResponse({
+        'success': True,
+        'quiz_id': quiz_id,
+        'quiz_url': quiz_url,
+        'message': message,
+    })
+
+
+@csrf_exempt
+async def query_gemini_batch(request):
+    """
+    Generates one quiz per description, packing several into each model call.
+
+    Every description gets its own result, so one failed quiz does not fail
+    the batch.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    descriptions = data.get('descriptions')
+    if not isinstance(descriptions, list) or not descriptions or not all(isinstance(d, str) and d.strip() for d in descriptions):
+        return JsonResponse({'error': 'Please enter a list of descriptions.'}, status=400)
+    max_descriptions = get_batch_config()['MAX_DESCRIPTIONS']
+    if len(descriptions) > max_descriptions:
+        return JsonResponse({'error': f'At most {max_descriptions} descriptions per batch.'}, status=400)
+    num_questions = data.get('num_questions')
+    if num_questions is not None and (not isinstance(num_questions, int) or num_questions < 1):
+        return JsonResponse({'error': 'num_questions must be a positive integer.'}, status=400)
+
+    results = await generate_quizzes([d.strip() for d in descriptions], num_questions=num_questions)
+    return JsonResponse({
+        'results': [
+            {
+                'description': result.description,
+                'success': result.ok,
+                'quiz_id': result.quiz_id,
+                'quiz_url': reverse('quiz_detail', args=[result.quiz_id]) if result.ok else None,
+                'error': result.error,
+            }
+            for result in results
+        ],
+    })
+
+
+@csrf_exempt
+def create_generation_job(request):
+    """
+    Queues a quiz generation and immediately returns the job id.
+
+    The browser polls job_status until the job finishes.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    description = data.get('description', '').strip()
+    if not description:
+        logger.error("Error: No description provided.")
+        return JsonResponse({'error': 'Please enter a description.'}, status=400)
+
+    job = enqueue_generation(description)
+    return JsonResponse({
+        'job_id': str(job.job_id),
+        'status': job.status,
+        'status_url': reverse('job_status', args=[job.job_id]),
+    }, status=202)
+
+
+def job_status(request, job_id):
+    """
+    Reports the status of a generation job and, once done, the quiz URL.
+    """
+    job = get_object_or_404(GenerationJob, pk=job_id)
+    if job.status == GenerationJob.RUNNING and fail_stale_jobs(GenerationJob.objects.filter(pk=job.pk)):
+        job.refresh_from_db()
+    payload = {'job_id': str(job.job_id), 'status': job.status}
+    if job.status == GenerationJob.SUCCEEDED:
+        payload['quiz_id'] = job.quiz_id
+        payload['quiz_url'] = reverse('quiz_detail', args=[job.quiz_id])
+    elif job.status == GenerationJob.FAILED:
+        payload['error'] = job.error
+    return JsonResponse(payload)
+
+
+async def stream_quiz(request):
+    """
+    Streams a quiz generation as Server-Sent Events, one question at a time.
+    """
+    description = request.GET.get('description', '').strip()
+    if not description:
+        return JsonResponse({'error': 'Please enter a description.'}, status=400)
+
+    response = StreamingHttpResponse(stream_quiz_events(description), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+def quiz_live(request):
+    """
+    Renders a quiz page that starts as soon as the first streamed question arrives.
+    """
+    description = request.GET.get('description', '').strip()
+    if not description:
+        return render(request, 'home.html')
+    return render(request, 'quiz_live.html', {'description': description})
 
 
 def quiz_detail(request, quiz_id):
+    # Read the version before the quiz so an edit made while rendering
+    # stores the page under a stamp that is already stale
+    version = get_quiz_version(quiz_id)
+    content = get_cached_quiz_page(quiz_id, version)
+    if content is None:
+        quiz = get_object_or_404(Quiz.objects.with_questions(), pk=quiz_id)
+        content = render_to_string('quiz.html', {'quiz': quiz}, request=request)
+        set_cached_quiz_page(quiz_id, version, content)
+    return HttpResponse(content)
+
+
+def quiz_api(request, quiz_id):
+    """
+    Returns a quiz as compact JSON, for clients that render it themselves.
+
+    Takes optional `page` and `page_size` to return one slice of the
+    questions of a large quiz. Responses carry a strong ETag derived from
+    the quiz's version stamp; a matching If-None-Match gets 304 Not
+    Modified without touching the database. Bodies are gzipped for clients
+    that accept it.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        page, page_size = parse_page(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    version = get_quiz_version(quiz_id)
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    etag = matching_etag(request, quiz_id, version, page, page_size)
+    if etag is not None:
+        return HttpResponseNotModified(headers={**headers, 'ETag': etag})
     try:
-        quiz = get_object_or_404(Quiz, pk=quiz_id)
-        return render(request, 'quiz.html', {'quiz': quiz})
+        body, gzipped = get_quiz_payload(quiz_id, version, page, page_size)
     except Quiz.DoesNotExist:
         return JsonResponse({'error': 'Quiz not found'}, status=404)
+    except PageNotFound as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    use_gzip = gzipped is not None and accepts_gzip(request)
+    headers['ETag'] = quiz_etag(quiz_id, version, page, page_size, gzipped=use_gzip)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return HttpResponse(gzipped if use_gzip else body, content_type='application/json', headers=headers)
+
+
+def related_quizzes(request, quiz_id):
+    """
+    Returns the quizzes whose questions are most similar to this quiz's.
+
+    Served separately from quiz_detail so the cached page does not go stale
+    as new quizzes are generated.
+    """
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    question_vectors = get_question_vectors()
+    related_ids = question_vectors.related_quizzes(quiz.quiz_id) if question_vectors else []
+    quizzes = Quiz.objects.in_bulk(related_ids)
+    return JsonResponse({'related': [
+        {
+            'quiz_id': related_id,
+            'title': quizzes[related_id].title,
+            'quiz_url': reverse('quiz_detail', args=[related_id]),
+        }
+        for related_id in related_ids
+        if related_id in quizzes
+    ]})
+
+
+@csrf_exempt
+def submit_quiz(request, quiz_id):
+    """
+    Grades a full quiz submission server-side and records the attempt.
+
+    Expects {"answers": {"<question_id>": <option_id>, ...}}, optionally with
+    "seconds": {"<question_id>": <seconds spent>, ...}, and returns the
+    score with per-question results. The attempt is written behind the
+    response by the attempt buffer; a full buffer answers 503.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        answers = data.get('answers', {})
+        seconds = data.get('seconds', {})
+        if not isinstance(answers, dict) or not isinstance(seconds, dict):
+            raise ValueError("answers and seconds must be objects keyed by question id")
+        graded = grade_submission(quiz_id, answers, seconds)
+    except (json.JSONDecodeError, ValueError, TypeError) as e:
+        return JsonResponse({'error': f'Invalid submission: {str(e)}'}, status=400)
+
+    if graded is None:
+        return JsonResponse({'error': 'Quiz not found'}, status=404)
+
+    if not ingest_attempt(graded):
+        response = JsonResponse({'error': 'Too many submissions right now. Please try again shortly.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    attempt = graded.attempt
+    return JsonResponse({
+        'attempt_id': str(attempt.attempt_id),
+        'score': attempt.score,
+        'total': attempt.total,
+        'percent': round(attempt.score * 100 / attempt.total) if attempt.total else 0,
+        'results': graded.results(),
+    })
+
+
+def quiz_stats(request, quiz_id):
+    """
+    Returns per-question difficulty stats for a quiz.
+
+    Reads the precomputed aggregate rows, so the cost does not grow with
+    the number of attempts.
+    """
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    return JsonResponse(get_quiz_stats(quiz))
+
+
+def search(request):
+    """
+    Full-text search over quiz titles, questions and answer options.
+
+    Takes the search text in `q` and an optional `limit` (at most
+    MAX_RESULTS), and returns matching questions best first.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Please enter a search term.'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_RESULTS)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+
+    results = [
+        {
+            'question_id': question.question_id,
+            'question_text': question.question_text,
+            'quiz_id': question.quiz_id,
+            'quiz_title': question.quiz.title,
+            'quiz_url': reverse('quiz_detail', args=[question.quiz_id]),
+        }
+        for question in search_questions(query, limit)
+    ]
+    return JsonResponse({'query': query, 'results': results})
+
+
+def quiz_catalogue(request):
+    """
+    Lists quizzes newest first, one page at a time.
+
+    Takes an optional `topic`, a `limit`, and the `cursor` returned as part
+    of the previous page's `next` link. Pages are read by keyset, so deep
+    pages cost the same as the first.
+    """
+    topic = request.GET.get('topic', '').strip()
+    try:
+        limit = max(int(request.GET.get('limit', 0)), 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    try:
+        quizzes, next_cursor = list_quizzes(topic, request.GET.get('cursor'), limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    next_url = None
+    if next_cursor:
+        params = {key: value for key, value in (('topic', topic), ('limit', limit)) if value}
+        next_url = f"{reverse('quiz_catalogue')}?{urlencode({**params, 'cursor': next_cursor})}"
+    return JsonResponse({
+        'quizzes': [
+            {
+                'quiz_id': quiz['quiz_id'],
+                'title': quiz['title'],
+                'topic': quiz['topic'],
+                'created_at': quiz['created_at'].isoformat(),
+                'quiz_url': reverse('quiz_detail', args=[quiz['quiz_id']]),
+            }
+            for quiz in quizzes
+        ],
+        'next': next_url,
+    })
+
+
+def metrics(request):
+    """
+    Returns this process's performance metrics in Prometheus text format.
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
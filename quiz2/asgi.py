@@ -3,6 +3,10 @@ ASGI config for quiz2 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (for example with
+``uvicorn quiz2.asgi:application``) so async views such as ``query_gemini``
+await the LLM without tying up a worker for the whole round-trip.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
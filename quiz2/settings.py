@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,6 +26,9 @@ SECRET_KEY = 'django-insecure--8()8_$j-#kjm9=e=b2j!=17_f7e=^u4laxsk$e2!!3-sy1k_t
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# `manage.py test` runs in one process and must not write into the project tree
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 ALLOWED_HOSTS = []
 
 
@@ -41,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'front.metrics.MetricsMiddleware',  # First, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,12 +80,228 @@ WSGI_APPLICATION = 'quiz2.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# SQLite by default; set QUIZ_DB_ENGINE=postgres and POSTGRES_DB, POSTGRES_USER,
+# POSTGRES_PASSWORD, POSTGRES_HOST and POSTGRES_PORT for PostgreSQL.
+# QUIZ_DB_PROFILE=tuned (the default) reuses connections under WSGI, applies
+# QUIZ_SQLITE_PRAGMAS to each SQLite connection (see front/db.py) and, with
+# QUIZ_DB_POOL=on, serves PostgreSQL from a psycopg pool. 'plain' opens a
+# connection per request with backend defaults.
+#
+# Connections are kept open between requests (CONN_MAX_AGE) only with
+# QUIZ_SERVER=wsgi. Under ASGI (quiz2/asgi.py, the default) sync code runs in
+# executor threads, each holding its own persistent connection, so they pile
+# up; there connections close after each request, and QUIZ_DB_POOL=on is the
+# way to reuse them on PostgreSQL.
+
+QUIZ_DB_PROFILE = os.getenv('QUIZ_DB_PROFILE', 'tuned')
+QUIZ_SERVER = os.getenv('QUIZ_SERVER', 'asgi')  # 'wsgi' when served through quiz2/wsgi.py
+_CONN_MAX_AGE = 60 if QUIZ_SERVER == 'wsgi' else 0
+
+if os.getenv('QUIZ_DB_ENGINE') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'quiz2'),
+            'USER': os.getenv('POSTGRES_USER', ''),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', ''),
+            'PORT': os.getenv('POSTGRES_PORT', ''),
+        }
+    }
+    if QUIZ_DB_PROFILE == 'tuned' and os.getenv('QUIZ_DB_POOL') == 'on':
+        # Needs psycopg[pool]; a pool replaces CONN_MAX_AGE
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('QUIZ_DB_POOL_MIN', 2)),
+                'max_size': int(os.getenv('QUIZ_DB_POOL_MAX', 10)),
+                'timeout': 10,  # Seconds to wait for a free connection
+            },
+        }
+    elif QUIZ_DB_PROFILE == 'tuned':
+        DATABASES['default'].update(CONN_MAX_AGE=_CONN_MAX_AGE, CONN_HEALTH_CHECKS=True)
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    if QUIZ_DB_PROFILE == 'tuned':
+        DATABASES['default'].update(
+            CONN_MAX_AGE=_CONN_MAX_AGE,
+            CONN_HEALTH_CHECKS=True,
+            # Take the write lock at BEGIN, where busy_timeout can wait for it;
+            # a deferred transaction that upgrades to a write fails at once
+            OPTIONS={'transaction_mode': 'IMMEDIATE'},
+        )
+
+QUIZ_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'busy_timeout': 10000,  # Milliseconds a writer waits for the lock
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Quiz pages, API payloads, answer keys and their version stamps must be
+# shared by every worker, or an edit only reaches the worker that saved it.
+# QUIZ_CACHE_BACKEND is 'file' (the default, shared on one host), 'redis' or
+# 'memcached' (shared across hosts; QUIZ_CACHE_LOCATION is the server URL),
+# or 'locmem', per process, only for a single-process server.
+
+_quiz_cache_backend = os.getenv('QUIZ_CACHE_BACKEND', 'locmem' if TESTING else 'file')
+_cull_options = {
+    'MAX_ENTRIES': int(os.getenv('QUIZ_CACHE_MAX_ENTRIES', 2000)),
+    'CULL_FREQUENCY': 4,  # Evict a quarter of entries when full
+}
+
+if _quiz_cache_backend == 'redis':
+    _quiz_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('QUIZ_CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+    }
+elif _quiz_cache_backend == 'memcached':
+    _quiz_cache = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.getenv('QUIZ_CACHE_LOCATION', '127.0.0.1:11211'),
     }
+elif _quiz_cache_backend == 'locmem':
+    _quiz_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quiz2',
+        'OPTIONS': _cull_options,
+    }
+else:
+    _quiz_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('QUIZ_CACHE_LOCATION', BASE_DIR / '.cache'),
+        'OPTIONS': _cull_options,
+    }
+
+CACHES = {
+    'default': _quiz_cache,
+}
+
+QUIZ_CACHE_ALIAS = 'default'
+QUIZ_CACHE_TIMEOUT = 60 * 60 * 24  # Seconds a rendered quiz page stays cached
+
+# Quiz catalogue at /quizzes/, paginated by cursor (see front/catalogue.py)
+QUIZ_CATALOGUE = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Request, database and LLM timings served at /metrics (see front/metrics.py)
+QUIZ_METRICS = {
+    'ENABLED': True,
+    'OPIK': os.getenv('QUIZ_OPIK') == 'on',  # Also send traces to Opik; configure it with OPIK_API_KEY etc.
+    'OPIK_PROJECT': os.getenv('OPIK_PROJECT_NAME', 'quiz2'),
+}
+
+# JSON quiz API at /api/quiz/<id>/ (see front/api.py)
+QUIZ_API = {
+    'PAGE_SIZE': 20,  # Questions per page when only ?page= is given
+    'MAX_PAGE_SIZE': 100,
+    'GZIP_MIN_LENGTH': 200,  # Bytes; smaller bodies are sent uncompressed
+}
+
+
+# Quiz generation
+
+# LLM provider and the client's resilience policy (see front/llm.py)
+QUIZ_LLM = {
+    'BACKEND': os.getenv('QUIZ_LLM_BACKEND', 'gemini'),  # 'gemini', 'anthropic', 'litellm' or 'fake'
+    'MODEL': os.getenv('QUIZ_LLM_MODEL') or None,
+    'BACKENDS': {},  # Extra backends, name -> dotted path of the class
+    'MAX_RETRIES': 3,
+    'BACKOFF': 0.5,
+    'MAX_BACKOFF': 8.0,
+    'RATE': 10.0,  # Calls per second per process
+    'BURST': 20,
+    'MAX_CONCURRENCY': 32,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30.0,
+}
+
+QUIZ_GENERATION_TIMEOUT = int(os.getenv('QUIZ_GENERATION_TIMEOUT', 60))  # Seconds to wait for the LLM
+# Request quizzes with QuizSchema as the provider's response schema; 'off' uses the free-text prompt
+QUIZ_STRUCTURED_OUTPUT = os.getenv('QUIZ_STRUCTURED_OUTPUT', 'on') != 'off'
+QUIZ_JOB_WORKERS = int(os.getenv('QUIZ_JOB_WORKERS', 4))  # Max concurrent background generations
+QUIZ_JOBS_EAGER = False  # Run jobs inline on submit (tests and debugging)
+QUIZ_JOB_STALE_AFTER = 10 * 60  # Seconds a job may run before it is presumed lost with its worker
+
+# Malformed LLM output is repaired locally; questions still invalid are re-asked once
+QUIZ_RESPONSE_REPAIR = {
+    'ENABLED': True,
+    'REASK': True,
+    'MAX_REASK_QUESTIONS': 10,
+}
+
+# Batch generation packs several descriptions into each LLM call
+QUIZ_BATCH_GENERATION = {
+    'MAX_PROMPT_TOKENS': 8000,
+    'TOKENS_PER_QUESTION': 200,
+    'DEFAULT_QUESTIONS': 10,
+    'MAX_QUIZZES_PER_CALL': 20,
+    'CONCURRENCY': 4,
+    'MAX_DESCRIPTIONS': 100,
+    'DEADLINE': 300,  # Seconds for a whole batch request
+}
+
+# Raw LLM outputs are appended to compressed JSONL files by a background thread
+QUIZ_RESPONSE_ARCHIVE = {
+    'ENABLED': os.getenv('QUIZ_RESPONSE_ARCHIVE', 'on') != 'off' and not TESTING,
+    'DIRECTORY': BASE_DIR / 'response_archive',  # One active file per process, see front/archive.py
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'QUEUE_SIZE': 1000,
+}
+
+# Reuse quizzes generated for the same or a very similar description
+QUIZ_PROMPT_CACHE = {
+    'ENABLED': True,
+    'TTL': 60 * 60,
+    'MAX_ENTRIES': 1000,
+    'SIMILARITY_THRESHOLD': 0.9,
+    'EMBEDDER': None,  # Exact matches only; 'google' also reuses quizzes for similar descriptions
+    'CLONE': False,
+}
+
+# Question embeddings for duplicate detection and related quizzes
+QUIZ_VECTOR_INDEX = {
+    'ENABLED': True,
+    # Off (None) unless an embedder is set: 'google' uses the Gemini embedding
+    # model; the lexical 'hashing' embedder only sees spelling, so only tests use it
+    'EMBEDDER': os.getenv('QUIZ_VECTOR_EMBEDDER') or ('hashing' if TESTING else None),
+    'BACKEND': 'memory',  # 'pgvector' needs PostgreSQL with the vector extension
+    'DEDUPE': 'text',  # Same text only; 'embedding' also drops similar questions, with a semantic embedder
+    'DUPLICATE_THRESHOLD': 0.9,
+    'RELATED_LIMIT': 5,
+    'BATCH_SIZE': 256,
+    'REFRESH_INTERVAL': 30,
+    'REFRESH_OVERLAP': 60,  # Seconds each reload looks back, for rows committed after they were written
+}
+
+# Quizzes are assembled from stored questions on the same topic before calling the LLM
+QUIZ_QUESTION_BANK = {
+    'ENABLED': True,
+    'DEFAULT_SIZE': 10,
+    'MAX_SIZE': 50,
+    'TOPIC_COVERAGE': 0.5,  # A "Python" bank does not serve "Python decorators and metaclasses"
+    'DIFFICULTY_MIX': {'Easy': 0.3, 'Medium': 0.4, 'Hard': 0.3},
+}
+
+# Quiz attempts are queued and written in batches by a single background thread
+QUIZ_ATTEMPT_BUFFER = {
+    'ENABLED': os.getenv('QUIZ_ATTEMPT_BUFFER', 'on') != 'off',
+    'FLUSH_INTERVAL': 0.2,
+    'MAX_BATCH_ROWS': 2000,
+    'QUEUE_SIZE': 10000,
+    'WRITE_RETRIES': 3,
 }
 
 
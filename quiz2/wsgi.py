@@ -3,6 +3,9 @@ WSGI config for quiz2 project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Set QUIZ_SERVER=wsgi when serving through this module, so the tuned database
+profile keeps connections open between requests (see quiz2/settings.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """